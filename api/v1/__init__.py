@@ -7,24 +7,45 @@ from flask_jwt_extended import JWTManager
 from flask_login import LoginManager
 from flask_sqlalchemy import SQLAlchemy
 from datetime import timedelta
+from api.v1.database import database_from_env, tune_engine  # type: ignore
+from api.v1.passwords import PasswordHasher  # type: ignore
+from api.v1.encoding import json_provider_from_env  # type: ignore
+from api.v1.compression import Compressor  # type: ignore
+from api.v1.profiling import QueryProfiler  # type: ignore
+from api.v1.metrics import RequestMetrics  # type: ignore
 
 
 app = Flask(__name__)
 app.url_map.strict_slashes = False
+# orjson encodes the responses when installed (see api/v1/encoding.py)
+app.json = json_provider_from_env(app)
+# Registered first so that it runs after every other after_request hook
+compressor = Compressor.from_env()
+compressor.init_app(app)
+# Request metrics served on /metrics (see api/v1/metrics.py)
+metrics = RequestMetrics.from_env()
+metrics.init_app(app)
 CORS(app, resources={r"/*": {"origins": "0.0.0.0"}})
 app.config['JWT_SECRET_KEY'] = 'ca16e8f5b8a6e2a3b00a807e84e6117ccb075a53f1a70854f0f8022fe9f5cef1'
 app.config['JWT_ACCESS_TOKEN_EXPIRES'] = timedelta(hours=1)
 
-USER_NAME = os.getenv('WordFlow_MYSQL_USER', 'wordflow_dev')
-PWD = os.getenv('WordFlow_MYSQL_PWD', 'wordflow_dev_pwd')
-HOST = 'localhost'
-DB = os.getenv('WordFlow_MYSQL_DB', 'WordFlow')
-
-app.config['SQLALCHEMY_DATABASE_URI'] = f'mysql+pymysql://{USER_NAME}:{PWD}@{HOST}/{DB}'
+# MySQL, a SQLite file or an in-memory database (see api/v1/database.py);
+# single engine for the whole app, DBStorage reuses it (see api/v1/pool.py)
+DATABASE_URL, ENGINE_OPTIONS = database_from_env()
+app.config['SQLALCHEMY_DATABASE_URI'] = DATABASE_URL
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = ENGINE_OPTIONS
 
+# Password hashing runs in a bounded process pool (see api/v1/passwords.py)
+hasher = PasswordHasher.from_env()
+app.config['BCRYPT_LOG_ROUNDS'] = hasher.rounds
 bcrypt = Bcrypt(app)
 jwt = JWTManager(app)
 db = SQLAlchemy(app)
+# SQL profiling of sampled requests (see api/v1/profiling.py)
+profiler = QueryProfiler.from_env()
+with app.app_context():
+    tune_engine(db.engine)
+    profiler.init_app(app, db.engine)
 login_manager = LoginManager()
 login_manager.init_app(app)
 login_manager.login_view = 'login'
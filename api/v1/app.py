@@ -1,11 +1,50 @@
 """Main app"""
 from api.v1 import app, bcrypt # type: ignore
-from flask import jsonify
+from api.v1 import compressor, hasher, metrics, profiler  # type: ignore
+from api.v1.metrics import cache_metrics, compression_metrics  # type: ignore
+from api.v1.metrics import hasher_metrics, pool_metrics  # type: ignore
+from api.v1.metrics import profiler_metrics, replica_metrics  # type: ignore
+from api.v1.passwords import HasherBusy  # type: ignore
+from models.engine.search import SearchUnavailable  # type: ignore
+from flask import jsonify, request
 from models import storage # type: ignore
 from api.v1.views import app_views # type: ignore
 
 app.register_blueprint(app_views)
 
+# Carry the time of the last write of a client (see models/engine/replicas.py)
+WRITE_HEADER = 'X-Last-Write'
+WRITE_COOKIE = 'last_write'
+
+metrics.register(pool_metrics, storage.pool_stats)
+metrics.register(hasher_metrics, hasher.stats)
+metrics.register(cache_metrics, storage.cache_stats)
+metrics.register(compression_metrics, compressor.stats)
+metrics.register(profiler_metrics, profiler.stats)
+metrics.register(replica_metrics, storage.replica_stats)
+
+
+@app.before_request
+def bind_client():
+    """ reads of a client that has just written go to the primary """
+    marker = (request.headers.get(WRITE_HEADER)
+              or request.cookies.get(WRITE_COOKIE))
+    try:
+        storage.bind_client(float(marker) if marker else None)
+    except ValueError:
+        storage.bind_client(None)
+
+
+@app.after_request
+def mark_write(response):
+    """ hands the time of the write of the request back to the client """
+    last_write = storage.last_write()
+    if last_write is not None:
+        response.headers[WRITE_HEADER] = repr(last_write)
+        response.set_cookie(WRITE_COOKIE, repr(last_write), httponly=True,
+                            samesite='Lax')
+    return response
+
 
 @app.teardown_appcontext
 def close(e):
@@ -19,6 +58,22 @@ def page_not_found(e):
     return (jsonify({"error": "Not found"}), 404)
 
 
+@app.errorhandler(HasherBusy)
+def hasher_busy(e):
+    """ Password hashing queue is full, the client should retry later """
+    response = jsonify({"error": "Service busy, retry later"})
+    response.headers['Retry-After'] = str(e.retry_after)
+    return (response, 503)
+
+
+@app.errorhandler(SearchUnavailable)
+def search_unavailable(e):
+    """ The search index is not built yet or the search ran out of time """
+    response = jsonify({"error": "Search unavailable, retry later"})
+    response.headers['Retry-After'] = str(e.retry_after)
+    return (response, 503)
+
+
 if __name__ == "__main__":
     host = 'localhost'
     port = 5000
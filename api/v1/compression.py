@@ -0,0 +1,213 @@
+"""
+Response compression.
+JSON bodies are compressed with the best encoding the client accepts
+(Accept-Encoding, with q-values) among brotli, gzip and deflate; brotli
+only when the `brotli` package is installed. Bodies smaller than the
+threshold are sent as is. Streamed responses (see
+api/v1/views/streaming.py) are compressed chunk by chunk, each chunk
+flushed so that the client still receives rows as they are read.
+
+Compressed responses get a weak ETag, since their bytes differ from the
+identity representation, which conditional requests compare weakly.
+The bytes before and after compression are counted per encoding, see
+`Compressor.stats`.
+
+Settings come from the environment:
+    WordFlow_COMPRESS: Encodings in order of preference (default
+        `br,gzip,deflate`), or `none` to disable compression.
+    WordFlow_COMPRESS_MIN_SIZE: Smallest body compressed, in bytes
+        (default 500).
+    WordFlow_COMPRESS_LEVEL: gzip and deflate level, 1 to 9 (default 6).
+    WordFlow_COMPRESS_BROTLI_QUALITY: brotli quality, 0 to 11 (default 4).
+"""
+import os
+import threading
+import zlib
+from flask import request
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+# Media types worth compressing
+COMPRESSIBLE_TYPES = {
+    'application/json',
+    'application/x-ndjson',
+    'application/javascript',
+    'application/xml',
+}
+
+
+class ZlibEncoder:
+    """Incremental gzip or deflate (zlib format) compression."""
+
+    def __init__(self, wbits, level):
+        self.__compressor = zlib.compressobj(level, zlib.DEFLATED, wbits)
+
+    def compress(self, data):
+        """Compresses a chunk and flushes it to a byte boundary."""
+        return (self.__compressor.compress(data)
+                + self.__compressor.flush(zlib.Z_SYNC_FLUSH))
+
+    def finish(self):
+        """Returns the end of the compressed stream."""
+        return self.__compressor.flush()
+
+
+class BrotliEncoder:
+    """Incremental brotli compression."""
+
+    def __init__(self, quality):
+        self.__compressor = brotli.Compressor(quality=quality)
+
+    def compress(self, data):
+        """Compresses a chunk and flushes it."""
+        return self.__compressor.process(data) + self.__compressor.flush()
+
+    def finish(self):
+        """Returns the end of the compressed stream."""
+        return self.__compressor.finish()
+
+
+class Compressor:
+    """
+    Compresses the responses of a Flask app, registered as its last
+    `after_request` function with `init_app`.
+    """
+
+    def __init__(self, encodings=('br', 'gzip', 'deflate'), min_size=500,
+                 level=6, brotli_quality=4):
+        self.encodings = tuple(encoding for encoding in encodings
+                               if encoding != 'br' or brotli is not None)
+        self.min_size = min_size
+        self.level = level
+        self.brotli_quality = brotli_quality
+        self.__lock = threading.Lock()
+        self.__counts = {}
+
+    @classmethod
+    def from_env(cls):
+        """Builds a compressor from the WordFlow_COMPRESS_* variables."""
+        encodings = os.getenv('WordFlow_COMPRESS', 'br,gzip,deflate').lower()
+        if encodings == 'none':
+            encodings = ''
+        encodings = [encoding.strip() for encoding in encodings.split(',')
+                     if encoding.strip()]
+        unknown = set(encodings) - {'br', 'gzip', 'deflate'}
+        if unknown:
+            raise ValueError("Unknown encoding: {}".format(
+                ", ".join(sorted(unknown))))
+        return cls(
+            encodings=encodings,
+            min_size=int(os.getenv('WordFlow_COMPRESS_MIN_SIZE', '500')),
+            level=int(os.getenv('WordFlow_COMPRESS_LEVEL', '6')),
+            brotli_quality=int(
+                os.getenv('WordFlow_COMPRESS_BROTLI_QUALITY', '4')))
+
+    def init_app(self, app):
+        """Compresses the responses of `app`."""
+        app.after_request(self.compress)
+
+    def encoder(self, encoding):
+        """Returns a new incremental encoder for `encoding`."""
+        if encoding == 'br':
+            return BrotliEncoder(self.brotli_quality)
+        if encoding == 'gzip':
+            return ZlibEncoder(16 + zlib.MAX_WBITS, self.level)
+        return ZlibEncoder(zlib.MAX_WBITS, self.level)
+
+    def negotiate(self):
+        """
+        Returns the encoding to use for the current request: the one with
+        the highest q-value in Accept-Encoding, the server preference
+        breaking ties, or None.
+        """
+        accepted = request.accept_encodings
+        best, best_quality = None, 0
+        for encoding in self.encodings:
+            quality = accepted.quality(encoding)
+            if quality > best_quality:
+                best, best_quality = encoding, quality
+        return best
+
+    def compress(self, response):
+        """
+        Compresses `response` if its type is compressible, it is large
+        enough or streamed, and the client accepts one of the encodings.
+        """
+        if (response.mimetype not in COMPRESSIBLE_TYPES
+                or response.status_code < 200
+                or response.status_code in (204, 206, 304)
+                or response.direct_passthrough
+                or 'Content-Encoding' in response.headers):
+            return response
+        response.vary.add('Accept-Encoding')
+        encoding = self.negotiate() if self.encodings else None
+        if response.is_streamed:
+            response.response = self.__stream(response.iter_encoded(),
+                                              encoding)
+            if encoding is not None:
+                response.headers.pop('Content-Length', None)
+                self.__mark_encoded(response, encoding)
+            return response
+        data = response.get_data()
+        if encoding is None or len(data) < self.min_size:
+            self.__count('identity', len(data), len(data))
+            return response
+        encoder = self.encoder(encoding)
+        compressed = encoder.compress(data) + encoder.finish()
+        self.__count(encoding, len(data), len(compressed))
+        response.set_data(compressed)
+        self.__mark_encoded(response, encoding)
+        return response
+
+    def stats(self):
+        """
+        Returns the responses and the bytes before and after compression,
+        by encoding (`identity` for the responses sent uncompressed).
+
+        Returns:
+            dict: {encoding: {'responses', 'bytes_in', 'bytes_out'}}.
+        """
+        with self.__lock:
+            return {encoding: dict(counts)
+                    for encoding, counts in self.__counts.items()}
+
+    def __stream(self, chunks, encoding):
+        """
+        Compresses the chunks of a streamed body as they come, or passes
+        them through when `encoding` is None, counting their bytes.
+        """
+        encoder = self.encoder(encoding) if encoding is not None else None
+        size_in = size_out = 0
+        try:
+            for chunk in chunks:
+                data = encoder.compress(chunk) if encoder else chunk
+                size_in += len(chunk)
+                size_out += len(data)
+                if data:
+                    yield data
+            if encoder:
+                data = encoder.finish()
+                size_out += len(data)
+                yield data
+        finally:
+            self.__count(encoding or 'identity', size_in, size_out)
+
+    def __mark_encoded(self, response, encoding):
+        """Sets the Content-Encoding and makes the ETag weak."""
+        response.headers['Content-Encoding'] = encoding
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            response.set_etag(etag, weak=True)
+
+    def __count(self, encoding, size_in, size_out):
+        """Adds a response to the counters of `encoding`."""
+        with self.__lock:
+            counts = self.__counts.setdefault(
+                encoding, {'responses': 0, 'bytes_in': 0, 'bytes_out': 0})
+            counts['responses'] += 1
+            counts['bytes_in'] += size_in
+            counts['bytes_out'] += size_out
@@ -0,0 +1,150 @@
+"""
+Database backend selection.
+The app and DBStorage run on MySQL, on a SQLite file or on an in-memory
+SQLite database, chosen by configuration. SQLite files use write-ahead
+logging so that readers do not block on the writer, and every backend
+goes through DBStorage, so they all offer the same interface.
+
+The in-memory database lives in one connection, which the pool hands to
+one session at a time: requests are serialized, and the data is lost
+when the process exits. It suits tests and single-client runs that must
+start without a database server, not concurrent benchmarks: with a pool
+of one connection, concurrent clients only measure the wait for it, and
+a session holding it while another needs it (e.g. a second thread of
+the same request) waits out WordFlow_SQLITE_POOL_TIMEOUT and fails.
+Streamed responses are refused on it, since a slow client would hold
+the only connection for the whole transfer and block every other
+request (see api/v1/views/streaming.py). Tests relying on concurrent
+sessions or streams are skipped on it.
+
+Settings come from the environment:
+    WordFlow_STORAGE: `mysql` (default), `sqlite` or `memory`.
+    WordFlow_DATABASE_URL: The database URL, instead of the one built
+        from the other settings; the backend follows its scheme.
+    WordFlow_MYSQL_USER, WordFlow_MYSQL_PWD, WordFlow_MYSQL_HOST,
+        WordFlow_MYSQL_DB: The MySQL connection, see also the pool
+        settings in api/v1/pool.py.
+    WordFlow_SQLITE_PATH: The SQLite file (default `wordflow.db`, in the
+        instance folder when relative).
+    WordFlow_SQLITE_BUSY_TIMEOUT: Milliseconds a writer waits for the
+        lock (default 5000).
+    WordFlow_SQLITE_CACHE_MB: Page cache per connection (default 64).
+    WordFlow_SQLITE_POOL_SIZE, WordFlow_SQLITE_MAX_OVERFLOW: Connections
+        to a SQLite file kept open and opened beyond (default 10 and 20).
+    WordFlow_SQLITE_POOL_TIMEOUT: Seconds a request waits for a SQLite
+        connection, the in-memory one included (default 30).
+"""
+from os import getenv
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from api.v1.pool import TimedQueuePool, engine_options  # type: ignore
+
+BACKENDS = ('mysql', 'sqlite', 'memory')
+
+
+def database_from_env():
+    """
+    Builds the database URL and engine options of the configured backend.
+
+    Returns:
+        tuple: (url, engine options).
+
+    Raises:
+        ValueError: If WordFlow_STORAGE names an unknown backend.
+    """
+    backend = getenv('WordFlow_STORAGE', 'mysql').lower()
+    if backend not in BACKENDS:
+        raise ValueError("Unknown storage backend: {}".format(backend))
+    url = getenv('WordFlow_DATABASE_URL')
+    if url and not (url.startswith('sqlite') and
+                    make_url(url).database in (None, '', ':memory:')):
+        return url, options_for(url)
+    if url or backend == 'memory':
+        # A named in-memory database; a plain `sqlite://` URL would make
+        # Flask-SQLAlchemy share one connection between all the threads
+        return ('sqlite:///file:wordflow?mode=memory&uri=true',
+                memory_options())
+    if backend == 'sqlite':
+        return ('sqlite:///' + getenv('WordFlow_SQLITE_PATH', 'wordflow.db'),
+                sqlite_options())
+    return ('mysql+pymysql://{}:{}@{}/{}'.format(
+        getenv('WordFlow_MYSQL_USER', 'wordflow_dev'),
+        getenv('WordFlow_MYSQL_PWD', 'wordflow_dev_pwd'),
+        getenv('WordFlow_MYSQL_HOST', 'localhost'),
+        getenv('WordFlow_MYSQL_DB', 'WordFlow')), engine_options())
+
+
+def options_for(url):
+    """
+    Returns the engine options suited to the backend of `url`, a MySQL, a
+    SQLite file or an in-memory SQLite URL.
+    """
+    if not url.startswith('sqlite'):
+        return engine_options()
+    if in_memory(url):
+        return memory_options()
+    return sqlite_options()
+
+
+def in_memory(url):
+    """Tells if `url` names an in-memory SQLite database."""
+    url = str(url)
+    return url.startswith('sqlite') and (
+        make_url(url).database in (None, '', ':memory:')
+        or 'mode=memory' in url)
+
+
+def sqlite_options():
+    """
+    Builds the engine options of a SQLite file: a pool of connections
+    usable from any thread, each tuned by `tune_engine`.
+    """
+    return {
+        'poolclass': TimedQueuePool,
+        'pool_size': int(getenv('WordFlow_SQLITE_POOL_SIZE', '10')),
+        'max_overflow': int(getenv('WordFlow_SQLITE_MAX_OVERFLOW', '20')),
+        'pool_timeout': float(getenv('WordFlow_SQLITE_POOL_TIMEOUT', '30')),
+        'connect_args': {'check_same_thread': False},
+    }
+
+
+def memory_options():
+    """
+    Builds the engine options of the in-memory database: a single
+    connection, never recycled, since closing it would drop the data.
+    """
+    return {
+        'poolclass': TimedQueuePool,
+        'pool_size': 1,
+        'max_overflow': 0,
+        'pool_recycle': -1,
+        'pool_timeout': float(getenv('WordFlow_SQLITE_POOL_TIMEOUT', '30')),
+        'connect_args': {'check_same_thread': False},
+    }
+
+
+def tune_engine(engine):
+    """
+    Sets the pragmas of each new SQLite connection of `engine`: write-ahead
+    logging for files, a busy timeout, a larger page cache and foreign
+    keys enforced as in MySQL. Other engines are left alone.
+    """
+    if engine.dialect.name != 'sqlite':
+        return
+    memory = in_memory(engine.url)
+    busy_timeout = int(getenv('WordFlow_SQLITE_BUSY_TIMEOUT', '5000'))
+    cache_kb = int(getenv('WordFlow_SQLITE_CACHE_MB', '64')) * 1024
+
+    @event.listens_for(engine, 'connect')
+    def set_pragmas(dbapi_connection, connection_record):
+        """Tunes a new SQLite connection."""
+        cursor = dbapi_connection.cursor()
+        if not memory:
+            cursor.execute('PRAGMA journal_mode=WAL')
+            # Durable at checkpoints; WAL keeps the file consistent
+            cursor.execute('PRAGMA synchronous=NORMAL')
+        cursor.execute('PRAGMA busy_timeout={:d}'.format(busy_timeout))
+        cursor.execute('PRAGMA cache_size=-{:d}'.format(cache_kb))
+        cursor.execute('PRAGMA temp_store=MEMORY')
+        cursor.execute('PRAGMA foreign_keys=ON')
+        cursor.close()
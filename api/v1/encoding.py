@@ -0,0 +1,69 @@
+"""
+JSON encoding of the responses.
+Flask encodes responses with the standard json module. When orjson is
+installed it is used instead, which encodes the serialized lists of the
+list endpoints several times faster. Both produce the same documents:
+dates that reach the encoder are still formatted by Flask, and keys are
+sorted as with `jsonify`.
+
+Settings come from the environment:
+    WordFlow_JSON: `orjson` (default when installed) or `std`.
+"""
+import os
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """
+    A Flask JSON provider encoding with orjson. Decoding is left to the
+    standard provider.
+    """
+
+    def __options(self, **kwargs):
+        """Returns the orjson options matching the provider settings."""
+        options = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+        if kwargs.get('sort_keys', self.sort_keys):
+            options |= orjson.OPT_SORT_KEYS
+        return options
+
+    def dumps(self, obj, **kwargs):
+        """Serializes `obj` to a JSON string."""
+        if kwargs.keys() - {'sort_keys'}:
+            # Options orjson does not have, e.g. indent or separators
+            return super().dumps(obj, **kwargs)
+        return orjson.dumps(obj, default=self.default,
+                            option=self.__options(**kwargs)).decode()
+
+    def response(self, *args, **kwargs):
+        """Builds a JSON response, encoded straight to bytes."""
+        if self.compact is False or (self.compact is None and self._app.debug):
+            # Indented output, as the standard provider does in debug mode
+            return super().response(*args, **kwargs)
+        obj = self._prepare_response_obj(args, kwargs)
+        data = orjson.dumps(obj, default=self.default,
+                            option=self.__options())
+        return self._app.response_class(data, mimetype=self.mimetype)
+
+
+def json_provider_from_env(app):
+    """
+    Builds the JSON provider selected by WordFlow_JSON.
+
+    Raises:
+        ValueError: If the encoder is unknown, or orjson is requested but
+                    not installed.
+    """
+    default = 'orjson' if orjson is not None else 'std'
+    encoder = os.getenv('WordFlow_JSON', default).lower()
+    if encoder == 'std':
+        return DefaultJSONProvider(app)
+    if encoder == 'orjson':
+        if orjson is None:
+            raise ValueError("WordFlow_JSON=orjson but orjson is not installed")
+        return FastJSONProvider(app)
+    raise ValueError("Unknown JSON encoder: {}".format(encoder))
@@ -0,0 +1,65 @@
+"""
+Stateless identity for the JWT protected endpoints.
+Access tokens carry the user id as subject and the username as a claim,
+so a view can tell who is calling without loading the `User`.
+
+Tokens are revoked per user by recording a revocation time on the user
+row: every token of that user issued up to that time is rejected. With
+the object cache on, protected requests read that time from the cache,
+where commits write it through; otherwise, or on a miss, they read that
+single column from the primary. Either way a revocation is seen at once
+by every worker and survives restarts, and a token whose user was
+deleted is rejected before the view runs. When the time cannot be read,
+the token is rejected. The issue
+time is kept with sub-second precision in the `issued` claim, since `iat`
+is rounded to the second and would reject a token issued right after a
+password change.
+"""
+import time
+from datetime import datetime, timezone
+from models import storage  # type: ignore
+from api.v1 import jwt  # type: ignore
+from flask_jwt_extended import create_access_token
+
+
+CREDENTIAL_FIELDS = ('username', 'email', 'password', 'password_hash')
+
+
+@jwt.token_in_blocklist_loader
+def is_token_revoked(jwt_header, jwt_payload):
+    """
+    Rejects the tokens of users that no longer exist, or whose tokens were
+    revoked after the token was issued.
+    """
+    try:
+        exists, revoked_at = storage.tokens_revoked_at(jwt_payload['sub'])
+    except Exception:
+        # Fail closed: without a revocation time, the token is not trusted
+        return True
+    if not exists:
+        return True
+    if revoked_at is None:
+        return False
+    issued_at = jwt_payload.get('issued', jwt_payload['iat'])
+    return issued_at <= revoked_at.replace(tzinfo=timezone.utc).timestamp()
+
+
+def issue_token(user):
+    """
+    Creates an access token carrying the identity claims of `user`.
+    """
+    claims = {'username': user.username, 'issued': time.time()}
+    return create_access_token(identity=user.id, additional_claims=claims)
+
+
+def revoke_tokens(user):
+    """
+    Revokes the tokens issued to `user` until now, e.g. once their
+    credentials change. The revocation is written with the next `save`.
+    """
+    user.tokens_revoked_at = datetime.utcnow()
+
+
+def credentials_changed(data):
+    """Tells if an update to a user changes the claims or credentials."""
+    return any(key in data for key in CREDENTIAL_FIELDS)
@@ -0,0 +1,349 @@
+"""
+Operational metrics in the Prometheus text format.
+Every request is counted by endpoint: a latency histogram, the requests
+in flight and the responses by method and status code. Requests that
+match no route are counted under the `unmatched` endpoint. The latency
+runs until the view returns, without the time spent sending a streamed
+body.
+
+Each thread records into its own shard, so request threads never wait on
+one another; a scrape of `/metrics` sums the shards. The shards of the
+threads that have ended are folded into a retired total, so a server that
+starts a thread per request does not keep one shard per request.
+
+Other figures (connection pool, read replicas, password hashing queue,
+object cache, compression, SQL profiling) are added by the collectors
+registered with `RequestMetrics.register`, see api/v1/app.py.
+
+Settings come from the environment:
+    WordFlow_METRICS: Set to 0 to disable the metrics and the `/metrics`
+        endpoint (default 1).
+"""
+import os
+import threading
+import time
+from flask import Response, request
+from api.v1.profiling import Histogram  # type: ignore
+
+# Upper bounds of the request latency buckets, in seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0,
+                   10.0)
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _format_value(value):
+    """Formats a sample value or a bucket bound."""
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, bool):
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def _format_labels(labels):
+    """Formats a label set, escaping the values."""
+    if not labels:
+        return ''
+    pairs = []
+    for name, value in labels.items():
+        value = (str(value).replace('\\', '\\\\').replace('"', '\\"')
+                 .replace('\n', '\\n'))
+        pairs.append('{}="{}"'.format(name, value))
+    return '{' + ','.join(pairs) + '}'
+
+
+class Exposition:
+    """Writes metric families in the Prometheus text format."""
+
+    def __init__(self, prefix='wordflow_'):
+        self.prefix = prefix
+        self.__lines = []
+
+    def add(self, name, kind, help, samples):
+        """
+        Adds a counter or gauge family.
+
+        Args:
+            name: The metric name, without the prefix.
+            kind: `counter` or `gauge`.
+            help: The description of the metric.
+            samples: (labels, value) pairs, labels being a dict or None.
+        """
+        name = self.prefix + name
+        self.__lines.append('# HELP {} {}'.format(name, help))
+        self.__lines.append('# TYPE {} {}'.format(name, kind))
+        for labels, value in samples:
+            self.__lines.append('{}{} {}'.format(
+                name, _format_labels(labels), _format_value(value)))
+
+    def add_histogram(self, name, help, series):
+        """
+        Adds a histogram family.
+
+        Args:
+            name: The metric name, without the prefix.
+            help: The description of the metric.
+            series: (labels, snapshot) pairs, the snapshots being those of
+                    `Histogram.snapshot`.
+        """
+        name = self.prefix + name
+        self.__lines.append('# HELP {} {}'.format(name, help))
+        self.__lines.append('# TYPE {} histogram'.format(name))
+        for labels, snapshot in series:
+            labels = labels or {}
+            for bound, count in snapshot['buckets']:
+                self.__lines.append('{}_bucket{} {}'.format(
+                    name, _format_labels({**labels, 'le': _format_value(
+                        float(bound))}), count))
+            self.__lines.append('{}_sum{} {}'.format(
+                name, _format_labels(labels),
+                _format_value(snapshot['sum'])))
+            self.__lines.append('{}_count{} {}'.format(
+                name, _format_labels(labels), snapshot['count']))
+
+    def render(self):
+        """Returns the exposition text."""
+        return '\n'.join(self.__lines) + '\n'
+
+
+class _Shard:
+    """The request figures recorded by one thread."""
+
+    def __init__(self):
+        self.latency = {}
+        self.in_flight = {}
+        self.responses = {}
+
+    def merge(self, other):
+        """Adds the figures of `other` to this shard."""
+        for endpoint, histogram in list(other.latency.items()):
+            total = self.latency.get(endpoint)
+            if total is None:
+                total = self.latency[endpoint] = Histogram(LATENCY_BUCKETS)
+            for i, count in enumerate(histogram.counts):
+                total.counts[i] += count
+            total.count += histogram.count
+            total.sum += histogram.sum
+        for endpoint, count in list(other.in_flight.items()):
+            self.in_flight[endpoint] = self.in_flight.get(endpoint, 0) + count
+        for key, count in list(other.responses.items()):
+            self.responses[key] = self.responses.get(key, 0) + count
+
+
+class RequestMetrics:
+    """
+    Records the requests of a Flask app and serves `/metrics`, registered
+    with `init_app`.
+    """
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.__local = threading.local()
+        self.__lock = threading.Lock()
+        self.__shards = []
+        self.__retired = _Shard()
+        self.__collectors = []
+
+    @classmethod
+    def from_env(cls):
+        """Builds the metrics from the WordFlow_METRICS variable."""
+        return cls(enabled=os.getenv('WordFlow_METRICS', '1').lower()
+                   in ('1', 'true', 'yes'))
+
+    def init_app(self, app):
+        """Records the requests of `app` and adds its `/metrics` endpoint."""
+        if not self.enabled:
+            return
+        app.before_request(self.__start)
+        app.after_request(self.__finish)
+        app.teardown_request(self.__end)
+        app.add_url_rule('/metrics', 'metrics', self.view)
+
+    def register(self, writer, source):
+        """
+        Adds figures to the scrapes: `writer(exposition, source())` is
+        called on each scrape.
+        """
+        self.__collectors.append((writer, source))
+
+    def collect(self):
+        """
+        Sums the shards of all the threads.
+
+        Returns:
+            _Shard: The request figures since the start.
+        """
+        total = _Shard()
+        with self.__lock:
+            alive = []
+            for thread, shard in self.__shards:
+                if thread.is_alive():
+                    alive.append((thread, shard))
+                else:
+                    self.__retired.merge(shard)
+            self.__shards = alive
+            total.merge(self.__retired)
+        for _, shard in alive:
+            total.merge(shard)
+        return total
+
+    def exposition(self):
+        """Returns the text of a scrape."""
+        total = self.collect()
+        out = Exposition()
+        out.add_histogram(
+            'http_request_duration_seconds',
+            'Time to handle a request, by endpoint.',
+            [({'endpoint': endpoint}, histogram.snapshot())
+             for endpoint, histogram in sorted(total.latency.items())])
+        out.add('http_requests_in_flight', 'gauge',
+                'Requests being handled, by endpoint.',
+                [({'endpoint': endpoint}, count)
+                 for endpoint, count in sorted(total.in_flight.items())])
+        out.add('http_responses_total', 'counter',
+                'Responses sent, by endpoint, method and status code.',
+                [({'endpoint': endpoint, 'method': method,
+                   'status': status}, count)
+                 for (endpoint, method, status), count
+                 in sorted(total.responses.items())])
+        for writer, source in self.__collectors:
+            writer(out, source())
+        return out.render()
+
+    def view(self):
+        """Serves a scrape."""
+        return Response(self.exposition(), content_type=CONTENT_TYPE)
+
+    def __shard(self):
+        """Returns the shard of the current thread, creating it on first use."""
+        shard = getattr(self.__local, 'shard', None)
+        if shard is None:
+            shard = self.__local.shard = _Shard()
+            with self.__lock:
+                self.__shards.append((threading.current_thread(), shard))
+        return shard
+
+    def __start(self):
+        """Counts the request in flight and starts its timer."""
+        endpoint = request.endpoint or 'unmatched'
+        shard = self.__shard()
+        shard.in_flight[endpoint] = shard.in_flight.get(endpoint, 0) + 1
+        self.__local.request = (endpoint, time.perf_counter())
+
+    def __finish(self, response):
+        """Records the latency and status of the request."""
+        started = getattr(self.__local, 'request', None)
+        if started is None:
+            return response
+        endpoint, start = started
+        shard = self.__shard()
+        histogram = shard.latency.get(endpoint)
+        if histogram is None:
+            histogram = shard.latency[endpoint] = Histogram(LATENCY_BUCKETS)
+        histogram.observe(time.perf_counter() - start)
+        key = (endpoint, request.method, response.status_code)
+        shard.responses[key] = shard.responses.get(key, 0) + 1
+        return response
+
+    def __end(self, exc):
+        """Removes the request from the requests in flight."""
+        started = getattr(self.__local, 'request', None)
+        if started is None:
+            return
+        self.__local.request = None
+        shard = self.__shard()
+        shard.in_flight[started[0]] -= 1
+
+
+def pool_metrics(out, stats):
+    """Writes the connection pool figures of `DBStorage.pool_stats`."""
+    if not stats:
+        return
+    for key, kind, help in (
+            ('pool_size', 'gauge', 'Connections kept open.'),
+            ('max_overflow', 'gauge', 'Extra connections allowed.'),
+            ('checked_out', 'gauge', 'Connections in use.'),
+            ('overflow', 'gauge', 'Extra connections open.'),
+            ('utilization', 'gauge', 'Share of the capacity in use.'),
+            ('checkouts', 'counter', 'Connection checkouts.'),
+            ('timeouts', 'counter', 'Checkouts that timed out.'),
+            ('wait_max', 'gauge', 'Longest checkout wait, in seconds.')):
+        name = 'db_pool_' + key + ('_total' if kind == 'counter' else '')
+        out.add(name, kind, help, [(None, stats[key])])
+    out.add('db_pool_wait_seconds_total', 'counter',
+            'Time spent waiting for a connection.',
+            [(None, stats['wait_total'])])
+
+
+def hasher_metrics(out, stats):
+    """Writes the password hashing figures of `PasswordHasher.stats`."""
+    out.add('bcrypt_queue_depth', 'gauge',
+            'Password hashing operations waiting or running.',
+            [(None, stats['queue_depth'])])
+    out.add('bcrypt_queue_capacity', 'gauge',
+            'Password hashing operations allowed in flight.',
+            [(None, stats['max_queue'])])
+
+
+def cache_metrics(out, stats):
+    """Writes the object cache figures of `DBStorage.cache_stats`."""
+    if not stats:
+        return
+    labels = {'backend': stats['backend']}
+    out.add('cache_hits_total', 'counter', 'Object cache hits.',
+            [(labels, stats['hits'])])
+    out.add('cache_misses_total', 'counter', 'Object cache misses.',
+            [(labels, stats['misses'])])
+    out.add('cache_invalidations_total', 'counter',
+            'Object cache invalidations.', [(labels, stats['invalidations'])])
+    if 'size' in stats:
+        out.add('cache_size', 'gauge', 'Objects in the cache.',
+                [(labels, stats['size'])])
+
+
+def compression_metrics(out, stats):
+    """Writes the response compression figures of `Compressor.stats`."""
+    encodings = sorted(stats.items())
+    out.add('compression_responses_total', 'counter',
+            'Responses by content encoding.',
+            [({'encoding': encoding}, counts['responses'])
+             for encoding, counts in encodings])
+    out.add('compression_bytes_in_total', 'counter',
+            'Response bytes before compression.',
+            [({'encoding': encoding}, counts['bytes_in'])
+             for encoding, counts in encodings])
+    out.add('compression_bytes_out_total', 'counter',
+            'Response bytes sent.',
+            [({'encoding': encoding}, counts['bytes_out'])
+             for encoding, counts in encodings])
+
+
+def profiler_metrics(out, stats):
+    """Writes the SQL profiling figures of `QueryProfiler.stats`."""
+    endpoints = sorted(stats.items())
+    out.add_histogram(
+        'sql_queries_per_request', 'Statements run by a profiled request.',
+        [({'endpoint': endpoint}, figures['queries'])
+         for endpoint, figures in endpoints])
+    out.add_histogram(
+        'sql_duration_seconds', 'Database time of a profiled request.',
+        [({'endpoint': endpoint}, figures['db_time'])
+         for endpoint, figures in endpoints])
+
+
+def replica_metrics(out, stats):
+    """Writes the read replica figures of `DBStorage.replica_stats`."""
+    if not stats:
+        return
+    replicas = sorted(stats.items())
+    out.add('db_replica_up', 'gauge', 'Whether the replica gets reads.',
+            [({'replica': name}, figures['healthy'])
+             for name, figures in replicas])
+    out.add('db_replica_reads_total', 'counter',
+            'Sessions that read from the replica.',
+            [({'replica': name}, figures['reads'])
+             for name, figures in replicas])
+    out.add('db_replica_failures_total', 'counter',
+            'Failed checks and dropped connections of the replica.',
+            [({'replica': name}, figures['failures'])
+             for name, figures in replicas])
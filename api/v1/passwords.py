@@ -0,0 +1,163 @@
+"""
+Password hashing off the request threads.
+bcrypt hashing and verification are CPU bound, so they run in a bounded
+process pool instead of the Flask worker threads. At most `max_queue`
+operations may be waiting or running; beyond that `HasherBusy` is raised
+and the app answers 503 with a Retry-After header, instead of letting a
+login storm starve the other endpoints.
+
+The pool processes are started by a fork server rather than forked from
+the app: forking a threaded server copies locks held by other threads,
+which can deadlock the child. They run the functions of the `bcrypt`
+module itself, the only module the fork server preloads, so that they do
+not import the app, its engine or its search index to unpickle them.
+
+Like every multiprocessing start method but fork, the fork server runs
+the `__main__` module of the parent again in each pool process, under the
+name `__mp_main__`. Scripts that hash passwords must therefore keep their
+work under an `if __name__ == "__main__":` guard, as a script without one
+starts its work again in the pool processes, which die and break the
+pool (BrokenProcessPool); the app servers (gunicorn, `flask run`) have
+one. The `__main__` module should also be cheap to import.
+
+Settings come from the environment:
+    WordFlow_BCRYPT_ROUNDS: bcrypt work factor (default 12).
+    WordFlow_BCRYPT_WORKERS: Hashing processes, 0 hashes on the calling
+        thread (default: number of CPUs).
+    WordFlow_BCRYPT_MAX_QUEUE: Operations allowed in flight (default four
+        per worker).
+    WordFlow_BCRYPT_RETRY_AFTER: Seconds sent in Retry-After (default 1).
+"""
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+import bcrypt
+
+
+class HasherBusy(Exception):
+    """Raised when too many hashing operations are already in flight."""
+
+    def __init__(self, retry_after):
+        super().__init__("Password hashing queue is full")
+        self.retry_after = retry_after
+
+
+class PasswordHasher:
+    """
+    Hashes and verifies passwords with bcrypt in a bounded process pool.
+    """
+
+    def __init__(self, rounds=12, workers=None, max_queue=None,
+                 retry_after=1):
+        self.__lock = threading.Lock()
+        self.__executor = None
+        self.__in_flight = 0
+        self.configure(rounds, workers, max_queue, retry_after)
+
+    @classmethod
+    def from_env(cls):
+        """Builds a hasher from the WordFlow_BCRYPT_* variables."""
+        workers = os.getenv('WordFlow_BCRYPT_WORKERS')
+        max_queue = os.getenv('WordFlow_BCRYPT_MAX_QUEUE')
+        return cls(
+            rounds=int(os.getenv('WordFlow_BCRYPT_ROUNDS', '12')),
+            workers=int(workers) if workers else None,
+            max_queue=int(max_queue) if max_queue else None,
+            retry_after=int(os.getenv('WordFlow_BCRYPT_RETRY_AFTER', '1')))
+
+    def configure(self, rounds=12, workers=None, max_queue=None,
+                  retry_after=1):
+        """
+        Applies new settings, shutting down the current pool; a new one is
+        started on the next operation.
+        """
+        if workers is None:
+            workers = os.cpu_count() or 1
+        with self.__lock:
+            if self.__executor is not None:
+                self.__executor.shutdown(wait=True)
+                self.__executor = None
+            self.rounds = rounds
+            self.workers = workers
+            self.max_queue = max_queue or 4 * max(workers, 1)
+            self.retry_after = retry_after
+            self.__slots = threading.BoundedSemaphore(self.max_queue)
+
+    @property
+    def queue_depth(self):
+        """The number of operations waiting or running."""
+        return self.__in_flight
+
+    def stats(self):
+        """
+        Returns the hashing queue figures.
+
+        Returns:
+            dict: Operations in flight, queue capacity and workers.
+        """
+        return {
+            'queue_depth': self.__in_flight,
+            'max_queue': self.max_queue,
+            'workers': self.workers,
+        }
+
+    def hash(self, password):
+        """
+        Hashes a password with the configured work factor.
+
+        Raises:
+            HasherBusy: If the queue is full.
+        """
+        return self.__run(bcrypt.hashpw, password.encode('utf-8'),
+                          bcrypt.gensalt(self.rounds)).decode('utf-8')
+
+    def verify(self, pw_hash, password):
+        """
+        Tells if `password` matches `pw_hash`.
+
+        Raises:
+            HasherBusy: If the queue is full.
+        """
+        return self.__run(bcrypt.checkpw, password.encode('utf-8'),
+                          pw_hash.encode('utf-8'))
+
+    def needs_rehash(self, pw_hash):
+        """Tells if `pw_hash` was made with another work factor."""
+        try:
+            return int(pw_hash.split('$')[2]) != self.rounds
+        except (AttributeError, IndexError, ValueError):
+            return True
+
+    def shutdown(self):
+        """Stops the pool processes."""
+        with self.__lock:
+            if self.__executor is not None:
+                self.__executor.shutdown(wait=True)
+                self.__executor = None
+
+    def __run(self, func, *args):
+        """Runs `func` in the pool, waiting for its result."""
+        slots = self.__slots
+        if not slots.acquire(blocking=False):
+            raise HasherBusy(self.retry_after)
+        with self.__lock:
+            self.__in_flight += 1
+        try:
+            if self.workers == 0:
+                return func(*args)
+            return self.__pool().submit(func, *args).result()
+        finally:
+            with self.__lock:
+                self.__in_flight -= 1
+            slots.release()
+
+    def __pool(self):
+        """Returns the process pool, starting it on first use."""
+        with self.__lock:
+            if self.__executor is None:
+                context = multiprocessing.get_context('forkserver')
+                context.set_forkserver_preload(['bcrypt'])
+                self.__executor = ProcessPoolExecutor(self.workers,
+                                                      mp_context=context)
+            return self.__executor
@@ -0,0 +1,104 @@
+"""
+Connection pool settings shared by Flask-SQLAlchemy and DBStorage.
+The engine is created once by the Flask-SQLAlchemy extension with the
+options built here, and DBStorage reuses that same engine. The pool is
+tuned through the WordFlow_MYSQL_POOL_* environment variables and records
+how long checkouts wait so its health can be reported.
+"""
+import threading
+import time
+from os import getenv
+from sqlalchemy import exc
+from sqlalchemy.pool import QueuePool
+
+
+class TimedQueuePool(QueuePool):
+    """
+    QueuePool that records the number of checkouts, how long they waited
+    for a connection and how many of them timed out.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._stats_lock = threading.Lock()
+        self._waiting = threading.local()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def _do_get(self):
+        """Times the checkout; nested retries are part of the same wait."""
+        if getattr(self._waiting, 'active', False):
+            return super()._do_get()
+        self._waiting.active = True
+        start = time.perf_counter()
+        timed_out = False
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            timed_out = True
+            raise
+        finally:
+            self._waiting.active = False
+            waited = time.perf_counter() - start
+            with self._stats_lock:
+                self.checkouts += 1
+                self.timeouts += timed_out
+                self.wait_total += waited
+                self.wait_max = max(self.wait_max, waited)
+
+    def stats(self):
+        """
+        Returns the checkout wait and utilization figures of the pool.
+
+        Returns:
+            dict: Pool size and usage, and checkout wait times in seconds.
+        """
+        with self._stats_lock:
+            checkouts = self.checkouts
+            timeouts = self.timeouts
+            wait_total = self.wait_total
+            wait_max = self.wait_max
+        capacity = self.size() + max(self._max_overflow, 0)
+        checked_out = self.checkedout()
+        return {
+            'pool_size': self.size(),
+            'max_overflow': self._max_overflow,
+            'checked_out': checked_out,
+            'overflow': self.overflow(),
+            'utilization': checked_out / capacity if capacity else 0.0,
+            'checkouts': checkouts,
+            'timeouts': timeouts,
+            'wait_total': wait_total,
+            'wait_avg': wait_total / checkouts if checkouts else 0.0,
+            'wait_max': wait_max,
+        }
+
+
+def engine_options():
+    """
+    Builds the engine options from the environment.
+
+    Environment:
+        WordFlow_MYSQL_POOL_SIZE: Connections kept open (default 10).
+        WordFlow_MYSQL_MAX_OVERFLOW: Extra connections allowed (default 20).
+        WordFlow_MYSQL_POOL_RECYCLE: Seconds before a connection is
+            replaced (default 3600).
+        WordFlow_MYSQL_POOL_PRE_PING: Test connections on checkout
+            (default 1).
+        WordFlow_MYSQL_POOL_TIMEOUT: Seconds to wait for a connection
+            (default 30).
+
+    Returns:
+        dict: Keyword arguments for the engine.
+    """
+    pre_ping = getenv('WordFlow_MYSQL_POOL_PRE_PING', '1')
+    return {
+        'poolclass': TimedQueuePool,
+        'pool_size': int(getenv('WordFlow_MYSQL_POOL_SIZE', '10')),
+        'max_overflow': int(getenv('WordFlow_MYSQL_MAX_OVERFLOW', '20')),
+        'pool_recycle': int(getenv('WordFlow_MYSQL_POOL_RECYCLE', '3600')),
+        'pool_pre_ping': pre_ping.lower() in ('1', 'true', 'yes'),
+        'pool_timeout': float(getenv('WordFlow_MYSQL_POOL_TIMEOUT', '30')),
+    }
@@ -0,0 +1,250 @@
+"""
+Per-request SQL instrumentation.
+A sampled request records every statement run on the engine shared by
+Flask-SQLAlchemy and DBStorage (see api/v1/pool.py) and on the engines of
+the read replicas (see models/engine/replicas.py): the statement count,
+the total database time and its slowest statements. The figures are sent
+back in a `Server-Timing` header, statements slower than the threshold are
+logged with the endpoint name, and each endpoint aggregates histograms of
+its query count and database time, see `QueryProfiler.stats`.
+
+Statements run after the view returns, such as those of streamed
+responses, are not part of the request figures.
+
+Profiling is off unless sampling is turned on; when it is off no engine
+listener is installed and each request only pays one comparison.
+
+Settings come from the environment:
+    WordFlow_PROFILE_SAMPLE: Fraction of the requests profiled, 0 to 1
+        (default 0, disabled).
+    WordFlow_PROFILE_SLOW_MS: Statements slower than this are logged
+        (default 100).
+    WordFlow_PROFILE_TOP: Slowest statements kept per endpoint (default 5).
+"""
+import bisect
+import heapq
+import logging
+import os
+import random
+import threading
+import time
+import weakref
+from flask import request
+from sqlalchemy import event
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds of the histogram buckets, the last bucket is unbounded
+QUERY_COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100)
+DB_TIME_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0,
+                   2.5)
+# Longest statement text kept for the logs and the slowest statements
+STATEMENT_LENGTH = 500
+
+
+class Histogram:
+    """Counts observations in fixed buckets, not thread safe."""
+
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0
+
+    def observe(self, value):
+        """Adds `value` to the bucket of the first bound it does not exceed."""
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def snapshot(self):
+        """
+        Returns the cumulative counts of the buckets.
+
+        Returns:
+            dict: {'buckets': [(upper bound, count)], 'count', 'sum'}, the
+                  last bound being `inf`.
+        """
+        cumulative, buckets = 0, []
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            cumulative += count
+            buckets.append((bound, cumulative))
+        return {'buckets': buckets, 'count': self.count, 'sum': self.sum}
+
+
+class RequestProfile:
+    """The statements of one profiled request."""
+
+    def __init__(self, top):
+        self.top = top
+        self.count = 0
+        self.duration = 0.0
+        self.slowest = []
+
+    def add(self, statement, duration):
+        """Records a statement and keeps it if it is among the slowest."""
+        self.count += 1
+        self.duration += duration
+        entry = (duration, statement[:STATEMENT_LENGTH])
+        if len(self.slowest) < self.top:
+            heapq.heappush(self.slowest, entry)
+        elif self.top:
+            heapq.heappushpop(self.slowest, entry)
+
+
+class EndpointStats:
+    """Aggregated figures of the profiled requests of one endpoint."""
+
+    def __init__(self, top):
+        self.top = top
+        self.queries = Histogram(QUERY_COUNT_BUCKETS)
+        self.db_time = Histogram(DB_TIME_BUCKETS)
+        self.slowest = []
+
+    def add(self, profile):
+        """Adds the figures of a profiled request."""
+        self.queries.observe(profile.count)
+        self.db_time.observe(profile.duration)
+        for entry in profile.slowest:
+            if len(self.slowest) < self.top:
+                heapq.heappush(self.slowest, entry)
+            elif self.top:
+                heapq.heappushpop(self.slowest, entry)
+
+
+class QueryProfiler:
+    """
+    Profiles the SQL statements of a sample of the requests of a Flask
+    app, registered with `init_app`.
+    """
+
+    def __init__(self, sample=0.0, slow_ms=100, top=5):
+        self.sample = sample
+        self.slow_ms = slow_ms
+        self.top = top
+        # Weak, so that the engines of stopped replicas are not kept alive
+        self.__engines = weakref.WeakSet()
+        self.__listening = False
+        self.__local = threading.local()
+        self.__lock = threading.Lock()
+        self.__endpoints = {}
+
+    @classmethod
+    def from_env(cls):
+        """Builds a profiler from the WordFlow_PROFILE_* variables."""
+        return cls(
+            sample=float(os.getenv('WordFlow_PROFILE_SAMPLE', '0')),
+            slow_ms=float(os.getenv('WordFlow_PROFILE_SLOW_MS', '100')),
+            top=int(os.getenv('WordFlow_PROFILE_TOP', '5')))
+
+    def init_app(self, app, *engines):
+        """
+        Profiles the requests of `app` and the statements run on `engines`,
+        to which `configure` can add others.
+        """
+        app.before_request(self.__start)
+        app.after_request(self.__finish)
+        app.teardown_request(self.__discard)
+        self.configure(self.sample, engines=engines)
+
+    def configure(self, sample=None, slow_ms=None, engines=()):
+        """
+        Changes the sampling rate or the slow statement threshold, or adds
+        `engines` to those profiled, e.g. the engines of read replicas. The
+        engine listeners are installed only while the sampling rate is
+        positive.
+        """
+        if slow_ms is not None:
+            self.slow_ms = slow_ms
+        if sample is not None:
+            self.sample = sample
+        listening = self.sample > 0
+        if listening != self.__listening:
+            for engine in self.__engines:
+                self.__listen(engine, listening)
+            self.__listening = listening
+        for engine in engines:
+            if engine not in self.__engines:
+                self.__engines.add(engine)
+                if listening:
+                    self.__listen(engine, True)
+
+    def stats(self):
+        """
+        Returns the aggregated figures of the profiled requests.
+
+        Returns:
+            dict: {endpoint: {'queries', 'db_time', 'slowest'}}, with the
+                  histograms of the statements per request and of the
+                  database time per request in seconds, and the slowest
+                  statements as (seconds, statement), slowest first.
+        """
+        with self.__lock:
+            return {
+                endpoint: {
+                    'queries': stats.queries.snapshot(),
+                    'db_time': stats.db_time.snapshot(),
+                    'slowest': sorted(stats.slowest, reverse=True),
+                }
+                for endpoint, stats in self.__endpoints.items()
+            }
+
+    def reset(self):
+        """Forgets the aggregated figures."""
+        with self.__lock:
+            self.__endpoints.clear()
+
+    def __listen(self, engine, on):
+        """Installs or removes the statement listeners of `engine`."""
+        change = event.listen if on else event.remove
+        change(engine, 'before_cursor_execute', self.__before_execute)
+        change(engine, 'after_cursor_execute', self.__after_execute)
+
+    def __start(self):
+        """Decides whether the request is profiled."""
+        if self.sample > 0 and random.random() < self.sample:
+            self.__local.profile = RequestProfile(self.top)
+
+    def __finish(self, response):
+        """Adds the Server-Timing header and aggregates the request."""
+        profile = getattr(self.__local, 'profile', None)
+        if profile is None:
+            return response
+        self.__local.profile = None
+        timing = 'db;dur={:.2f};desc="{} queries"'.format(
+            profile.duration * 1000, profile.count)
+        if 'Server-Timing' in response.headers:
+            timing = response.headers['Server-Timing'] + ', ' + timing
+        response.headers['Server-Timing'] = timing
+        endpoint = request.endpoint or 'unknown'
+        with self.__lock:
+            stats = self.__endpoints.get(endpoint)
+            if stats is None:
+                stats = self.__endpoints[endpoint] = EndpointStats(self.top)
+            stats.add(profile)
+        return response
+
+    def __discard(self, exc):
+        """Drops the profile of a request that failed before finishing."""
+        self.__local.profile = None
+
+    def __before_execute(self, conn, cursor, statement, parameters, context,
+                         executemany):
+        """Starts timing a statement of a profiled request."""
+        if getattr(self.__local, 'profile', None) is not None:
+            conn.info.setdefault('wordflow_profile', []).append(
+                time.perf_counter())
+
+    def __after_execute(self, conn, cursor, statement, parameters, context,
+                        executemany):
+        """Records a statement of a profiled request."""
+        profile = getattr(self.__local, 'profile', None)
+        starts = conn.info.get('wordflow_profile')
+        if profile is None or not starts:
+            return
+        duration = time.perf_counter() - starts.pop()
+        profile.add(statement, duration)
+        if duration * 1000 >= self.slow_ms:
+            logger.warning("Slow query on %s: %.1f ms: %s",
+                           request.endpoint, duration * 1000,
+                           statement[:STATEMENT_LENGTH])
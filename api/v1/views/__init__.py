@@ -6,4 +6,7 @@ app_views = Blueprint('app_views', __name__, url_prefix='/api/v1')
 from api.v1.views.users import *  # type: ignore
 from api.v1.views.posts import *  # type: ignore
 from api.v1.views.comments import *  # type: ignore
-from api.v1.views.categories import *  # type: ignore
\ No newline at end of file
+from api.v1.views.categories import *  # type: ignore
+from api.v1.views.batch import *  # type: ignore
+from api.v1.views.feed import *  # type: ignore
+from api.v1.views.tags import *  # type: ignore
@@ -0,0 +1,235 @@
+"""
+API Views for batch writes
+This module defines routes that create posts and comments and assign
+categories to posts in batches. A batch is a JSON list of items: every
+item is validated first, with one query per referenced class, then the
+valid items are written in a single transaction (one commit). Category
+links are written with one statement each (see DBStorage.link).
+
+The response lists one result per item, in order:
+    {"index": 0, "status": 201, "id": "<id>"}
+    {"index": 1, "status": 404, "error": "Post not found"}
+It is answered with 201 when every item was written and 207 otherwise.
+With `?atomic=1` nothing is written if any item is invalid; the batch is
+then answered with 400 and the valid items report status 424.
+"""
+from models.post import Post  # type: ignore
+from models.comment import Comment  # type: ignore
+from models.category import Category  # type: ignore
+from api.v1.views import app_views  # type: ignore
+from models import storage  # type: ignore
+from flask import jsonify, abort, request
+from flask_jwt_extended import jwt_required, get_jwt_identity
+
+
+MAX_BATCH = 1000
+
+
+def batch_items():
+    """
+    Reads the list of items of the current request.
+
+    Returns:
+        list: The items.
+
+    Raises:
+        400: If the body is not a non-empty JSON list of objects, or has
+             more than MAX_BATCH items.
+    """
+    items = request.get_json(silent=True)
+    if not isinstance(items, list) or not items:
+        abort(400, {'error': 'Not a JSON list'})
+    if len(items) > MAX_BATCH:
+        abort(400, {'error': 'At most {} items per batch'.format(MAX_BATCH)})
+    return items
+
+
+def missing_field(item, *fields):
+    """
+    Returns the error of an item that is not an object or lacks one of
+    the string `fields`, or None.
+    """
+    if not isinstance(item, dict):
+        return 'Not a JSON object'
+    for field in fields:
+        if not item.get(field) or not isinstance(item[field], str):
+            return 'Missing {}'.format(field)
+    return None
+
+
+def referenced(items, field):
+    """Returns the ids found in `field` of the items."""
+    return [item[field] for item in items
+            if isinstance(item, dict) and isinstance(item.get(field), str)]
+
+
+def batch_response(results, writes, finish=None):
+    """
+    Commits the valid items of a batch and builds its response.
+
+    Args:
+        results: The result of each item, the failed ones already set.
+        writes: (index, write) pairs of the valid items, `write` applies
+                the item to the session and returns its result.
+        finish: Called once the items are applied, before the commit
+                (optional).
+
+    Returns:
+        tuple: The JSON list of results and the status code.
+    """
+    failed = len(writes) < len(results)
+    if failed and request.args.get('atomic') in ('1', 'true'):
+        for index, _ in writes:
+            results[index] = {'index': index, 'status': 424,
+                              'error': 'Not written, the batch is invalid'}
+        return jsonify(results), 400
+    for index, write in writes:
+        results[index] = {'index': index, **write()}
+    if writes:
+        if finish is not None:
+            finish()
+        storage.save()
+    return jsonify(results), 207 if failed else 201
+
+
+def link_error(item, posts, categories, user_id, assign):
+    """
+    Validates a category assignment or removal against the loaded posts
+    and categories.
+
+    Returns:
+        tuple: The error and its status code, or (None, None).
+    """
+    error = missing_field(item, 'post_id', 'category_id')
+    if error:
+        return error, 400
+    post = posts.get(item['post_id'])
+    if post is None:
+        return 'Post not found', 404
+    category = categories.get(item['category_id'])
+    if category is None:
+        return 'Category not found', 404
+    if post.user_id != user_id:
+        return 'You are not authorized to update this post', 403
+    if not assign and category not in post.categories:
+        return 'Category not assigned to this post', 400
+    return None, None
+
+
+@app_views.route('/posts/batch', methods=['POST'], strict_slashes=False)
+@jwt_required()
+def createPosts():
+    """
+    Creates posts from a list of {"title", "content"} objects.
+
+    Returns:
+        JSON: The result of each item, with the id of the created posts.
+
+    Raises:
+        400: If the body is not a list of at most MAX_BATCH items.
+    """
+    current_user_id = get_jwt_identity()
+    items = batch_items()
+    results = [None] * len(items)
+    writes = []
+    for index, item in enumerate(items):
+        error = missing_field(item, 'title', 'content')
+        if error:
+            results[index] = {'index': index, 'status': 400, 'error': error}
+            continue
+        post = Post(user_id=current_user_id, title=item['title'],
+                    content=item['content'])
+
+        def write(post=post):
+            storage.new(post)
+            return {'status': 201, 'id': post.id}
+        writes.append((index, write))
+    return batch_response(results, writes)
+
+
+@app_views.route('/comments/batch', methods=['POST'], strict_slashes=False)
+@jwt_required()
+def addComments():
+    """
+    Adds comments from a list of {"post_id", "content"} objects.
+
+    Returns:
+        JSON: The result of each item, with the id of the created comments.
+
+    Raises:
+        400: If the body is not a list of at most MAX_BATCH items.
+    """
+    current_user_id = get_jwt_identity()
+    items = batch_items()
+    posts = storage.get_many(Post, referenced(items, 'post_id'))
+    results = [None] * len(items)
+    writes = []
+    for index, item in enumerate(items):
+        error = missing_field(item, 'post_id', 'content')
+        if error:
+            results[index] = {'index': index, 'status': 400, 'error': error}
+            continue
+        if item['post_id'] not in posts:
+            results[index] = {'index': index, 'status': 404,
+                              'error': 'Post not found'}
+            continue
+        comment = Comment(post_id=item['post_id'], user_id=current_user_id,
+                          content=item['content'])
+
+        def write(comment=comment):
+            storage.new(comment)
+            return {'status': 201, 'id': comment.id}
+        writes.append((index, write))
+    return batch_response(results, writes)
+
+
+@app_views.route('/posts/categories/batch', methods=['POST', 'DELETE'],
+                 strict_slashes=False)
+@jwt_required()
+def assignCategories():
+    """
+    Assigns (POST) or removes (DELETE) categories from a list of
+    {"post_id", "category_id"} objects. Only the post author can change
+    the categories of a post.
+
+    Returns:
+        JSON: The result of each item: 201 when a category was assigned,
+              200 when it was removed or already assigned.
+
+    Raises:
+        400: If the body is not a list of at most MAX_BATCH items.
+    """
+    current_user_id = get_jwt_identity()
+    items = batch_items()
+    posts = storage.get_many(Post, referenced(items, 'post_id'),
+                             expand=['categories'])
+    categories = storage.get_many(Category,
+                                  referenced(items, 'category_id'))
+    assign = request.method == 'POST'
+    results = [None] * len(items)
+    writes = []
+    for index, item in enumerate(items):
+        error, status = link_error(item, posts, categories, current_user_id,
+                                   assign)
+        if error:
+            results[index] = {'index': index, 'status': status,
+                              'error': error}
+            continue
+        post = posts[item['post_id']]
+        category = categories[item['category_id']]
+
+        def write(post=post, category=category):
+            if not assign:
+                storage.unlink(post, 'categories', category)
+                return {'status': 200, 'id': post.id}
+            if not storage.link(post, 'categories', category):
+                return {'status': 200, 'id': post.id}
+            return {'status': 201, 'id': post.id}
+        writes.append((index, write))
+
+    def publish():
+        # The feeds follow the categories of published posts
+        for post in {posts[items[index]['post_id']] for index, _ in writes}:
+            if post.published:
+                storage.publish(post)
+    return batch_response(results, writes, publish)
@@ -2,42 +2,88 @@
 API Views for Category Management
 This module defines various routes to manage ccategories using
 the RESTful API. It allows retrieving, creating, updating,
-and deleting categories by interacting with the Category model.
+and deleting categories by interacting with the Category model,
+and listing the posts of a category from the association table.
 """
 from models.user import User  # type: ignore
 from models.post import Post  # type: ignore
 from models.comment import Comment  # type: ignore
 from models.category import Category  # type: ignore
 from api.v1.views import app_views  # type: ignore
+from api.v1.views.pagination import paginated_response  # type: ignore
+from api.v1.views.streaming import streamed_response  # type: ignore
+from api.v1.views.expand import schema_args  # type: ignore
+from api.v1.views.conditional import (  # type: ignore
+    object_validators, not_modified, with_validators)
 from models import storage  # type: ignore
 from flask import jsonify, abort, request
 from api.v1 import bcrypt, jwt, login_manager  # type: ignore
 from flask_jwt_extended import jwt_required, get_jwt_identity
 
 
+def find_category(value):
+    """
+    Returns the category named `value`, or with the ID `value`.
+
+    Raises:
+        404: If there is no such category.
+    """
+    category = (storage.get_by_name(Category, value)
+                or storage.get(Category, value))
+    if category is None:
+        abort(404, {'error': 'Category not found'})
+    return category
+
+
 @app_views.route('/categories', methods=['GET'], strict_slashes=False)
 @jwt_required()
 def getAllCategories():
     """
-    Retrieves all categories.
+    Retrieves all categories, one page at a time (see `limit` and `after`),
+    or all at once as a stream with `stream=json` or `stream=ndjson`.
     """
     current_user_id = get_jwt_identity()
     if not current_user_id:
         return jsonify({'msg': 'Unauthorized access'}), 401
-    categories = [category.to_dict() for category in storage.all(Category).values()]
-    return jsonify(categories), 200
+    if request.args.get('stream'):
+        return streamed_response(Category)
+    return paginated_response(Category)
 
 
 @app_views.route('/categories/<category_id>', methods=['GET'], strict_slashes=False)
 @jwt_required()
 def getCategoryByID(category_id):
     """
-    Retrieves a specific category by its ID.
+    Retrieves a specific category by its ID, or 304 if it did not change
+    since the copy held by the client (ETag / Last-Modified). The columns
+    returned can be selected with `fields`.
     """
     current_user_id = get_jwt_identity()
     if not current_user_id:
         return jsonify({'msg': 'Unauthorized access'}), 401
-    category = storage.get(Category, category_id)
+    schema = schema_args(Category)
+    category = storage.get(Category, category_id, fields=schema.projection)
     if category is None:
         abort(404, {'error': 'Category not found'})
-    return jsonify(category.to_dict())
+    validators = object_validators(category)
+    response = not_modified(*validators)
+    if response is not None:
+        return response, 304
+    return with_validators(jsonify(schema.dump(category)), *validators)
+
+
+@app_views.route('/categories/<category_id>/posts', methods=['GET'],
+                 strict_slashes=False)
+@jwt_required()
+def getCategoryPosts(category_id):
+    """
+    Retrieves the posts of a category, given by ID or name, one page at a
+    time (see `limit`, `after` and `expand`), or as a stream with `stream`.
+
+    Raises:
+        404: If the category does not exist.
+    """
+    category = find_category(category_id)
+    if request.args.get('stream'):
+        return streamed_response(Post, categories=category.id)
+    return paginated_response(Post, categories=category.id)
@@ -8,6 +8,8 @@ from models.user import User  # type: ignore
 from models.post import Post  # type: ignore
 from models.comment import Comment  # type: ignore
 from api.v1.views import app_views  # type: ignore
+from api.v1.views.pagination import paginated_response  # type: ignore
+from api.v1.views.streaming import streamed_response  # type: ignore
 from models import storage  # type: ignore
 from flask import jsonify, abort, request
 from api.v1 import bcrypt, jwt, login_manager  # type: ignore
@@ -61,10 +63,17 @@ def addComment(post_id):
 @jwt_required()
 def getAllComments(post_id):
     """
-    Retrieves all comments for a specific post by `post_id`.
+    Retrieves the comments of a specific post by `post_id`, one page at a time.
+
+    Query parameters:
+    - limit: The page size (optional).
+    - after: The cursor of the page to read, from the `X-Next-Cursor` header (optional).
+    - stream: `json` or `ndjson` to stream every comment instead of one page (optional).
+    - expand: Comma-separated related data to embed: user, post (optional).
 
     Returns:
     - 200: A list of comments in JSON format.
+    - 400: Invalid pagination or expansion parameters.
     - 404: Post not found.
     - 401: Unauthorized access.
     """
@@ -74,8 +83,9 @@ def getAllComments(post_id):
     post = storage.get(Post, post_id)
     if not post:
         abort(404, {'error': 'Post not found'})
-    comments = [comment.to_dict() for comment in post.comments]
-    return jsonify(comments), 200
+    if request.args.get('stream'):
+        return streamed_response(Comment, post_id=post.id)
+    return paginated_response(Comment, post_id=post.id)
 
 
 @app_views.route('/posts/<post_id>/comments/<comment_id>', methods=['DELETE'], strict_slashes=False)
@@ -0,0 +1,82 @@
+"""
+HTTP conditional request helpers.
+Single resources are validated with their `id` and `updated_at`, and
+pages of collections with the `id` and `updated_at` of the objects they
+hold and the cursor of the next page, so validating a page costs no query
+beyond reading it: any write to an object of the page, or adding or
+removing one, changes them. When the validators sent in `If-None-Match`
+or `If-Modified-Since` still match, a 304 response is returned before the
+body is built.
+
+Pages carry an ETag only: removing an object leaves the newest
+`updated_at` of the page unchanged, so a Last-Modified date would let
+`If-Modified-Since` answer 304 for a page that lost an object.
+"""
+import hashlib
+from datetime import timezone
+from flask import Response, request
+
+
+def make_etag(*parts):
+    """Returns an entity tag built from the string form of `parts`."""
+    raw = '|'.join(str(part) for part in parts)
+    return hashlib.sha1(raw.encode()).hexdigest()
+
+
+def object_validators(obj):
+    """
+    Returns the ETag and Last-Modified values of a single object. The
+    `fields` query parameter is part of the ETag since it selects the
+    representation.
+    """
+    return (make_etag(type(obj).__name__, obj.id, obj.updated_at.isoformat(),
+                      request.args.get('fields', '')),
+            obj.updated_at)
+
+
+def page_validators(cls, objs, next_cursor, **filters):
+    """
+    Returns the ETag of a page of the objects of `cls` matching the
+    filters, from the objects read and the cursor of the next page, and
+    no Last-Modified value (see the module docstring). The query string is
+    part of the ETag since it selects the page and the representation.
+    """
+    args = sorted(request.args.items(multi=True))
+    versions = [(obj.id, obj.updated_at.isoformat()) for obj in objs]
+    etag = make_etag(cls.__name__, sorted(filters.items()), args, versions,
+                     next_cursor)
+    return etag, None
+
+
+def not_modified(etag, last_modified):
+    """
+    Checks the validators of the current request.
+
+    Returns:
+        Response: An empty 304 response if the client copy is still valid,
+                  otherwise None.
+    """
+    if request.if_none_match:
+        fresh = request.if_none_match.contains_weak(etag)
+    elif request.if_modified_since and last_modified:
+        last_modified = last_modified.replace(microsecond=0,
+                                              tzinfo=timezone.utc)
+        fresh = last_modified <= request.if_modified_since
+    else:
+        fresh = False
+    if not fresh:
+        return None
+    return with_validators(Response(status=304), etag, last_modified)
+
+
+def with_validators(response, etag, last_modified):
+    """
+    Adds the ETag and Last-Modified headers to a response. Clients must
+    revalidate before reusing their copy.
+    """
+    response.set_etag(etag)
+    if last_modified:
+        response.last_modified = last_modified.replace(tzinfo=timezone.utc)
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
@@ -0,0 +1,117 @@
+"""
+Expansion helpers for the post and comment endpoints.
+The `expand` query parameter lists related data to embed in each object,
+e.g. `GET /posts?expand=author,categories,tags`. Relationships are loaded
+through the named loading profiles of the storage, and counts with one
+grouped query, so the number of queries does not depend on the number of
+objects in the response. Counts kept in a counter column, such as
+`comment_count`, are already serialized and need no expansion.
+The `fields` query parameter selects the columns to read and serialize,
+e.g. `GET /posts?fields=id,title`, or all of them with `fields=*`. Lists
+leave out the large columns by default, such as the content of posts.
+"""
+from models import storage  # type: ignore
+from models.engine.serializer import schema_for  # type: ignore
+from sqlalchemy import inspect
+from flask import abort, request
+
+
+# Counts that can be expanded: class -> name -> (counted class, column)
+count_expansions = {}
+
+
+def expand_args(cls):
+    """
+    Reads the `expand` query parameter of the current request.
+
+    Args:
+        cls: The class of the returned objects.
+
+    Returns:
+        tuple: The names of the loading profiles and the names of the
+               counts to expand.
+    """
+    names = [name.strip() for name in request.args.get('expand', '').split(',')]
+    names = list(dict.fromkeys(name for name in names if name))
+    # Counter columns such as comment_count are part of `to_dict`
+    columns = inspect(cls).columns
+    names = [name for name in names if name not in columns]
+    counts = count_expansions.get(cls, {})
+    return ([name for name in names if name not in counts],
+            [name for name in names if name in counts])
+
+
+def schema_args(cls, listing=False):
+    """
+    Reads the `fields` query parameter of the current request.
+
+    Args:
+        cls: The class of the returned objects.
+        listing: True for the list endpoints, whose default schema leaves
+                 out the large columns (optional).
+
+    Returns:
+        Schema: The schema of the requested columns of `cls`, or its
+                default schema when `fields` is absent.
+
+    Raises:
+        400: If a field is not a column of `cls`.
+    """
+    names = [name.strip() for name in request.args.get('fields', '').split(',')]
+    names = tuple(name for name in names if name)
+    if not names:
+        return schema_for(cls, summary=listing)
+    if names == ('*',):
+        return schema_for(cls)
+    try:
+        return schema_for(cls, names)
+    except ValueError as e:
+        abort(400, {'error': str(e)})
+
+
+def expanded_dicts(cls, objs, relations=(), counts=(), schema=None):
+    """
+    Serializes objects with the schema of their class, embedding the
+    relationships loaded by the storage profiles, in their embedded form
+    (see `Schema`), and the requested counts.
+
+    Args:
+        cls: The class of the objects.
+        objs: The objects to serialize.
+        relations: The names of the relationships to embed (optional).
+        counts: The names of the counts to add (optional).
+        schema: The schema of the serialized columns, all of them when
+                None (optional).
+
+    Returns:
+        list: One dictionary per object.
+    """
+    if schema is None:
+        schema = schema_for(cls)
+    loaded = {}
+    for name in counts:
+        counted_cls, key = count_expansions[cls][name]
+        loaded[name] = storage.count_by(counted_cls, key,
+                                        [obj.id for obj in objs])
+    dicts = []
+    for obj in objs:
+        obj_dict = schema.dump(obj)
+        for name in relations:
+            value = getattr(obj, name)
+            if isinstance(value, list):
+                obj_dict[name] = [embedded(item) for item in value]
+            else:
+                obj_dict[name] = embedded(value) if value else None
+        for name in counts:
+            obj_dict[name] = loaded[name][obj.id]
+        dicts.append(obj_dict)
+    return dicts
+
+
+def embedded(item):
+    """
+    Serializes an object embedded in another with the embedded schema of
+    its class, which never carries credentials such as the user email.
+    """
+    return schema_for(type(item), embedded=True).dump(item)
+
@@ -0,0 +1,139 @@
+"""
+API Views for home feeds
+This module defines the routes to follow authors, categories and tags,
+and to read the resulting home feed: the latest published posts of the
+followed sources, newest first. Feeds are precomputed when posts are
+published (see models/engine/feed.py), so a read is a bounded slice.
+"""
+from models.user import User  # type: ignore
+from models.post import Post  # type: ignore
+from models.category import Category  # type: ignore
+from models.tag import Tag  # type: ignore
+from models.follow import Follow, FOLLOW_TARGETS  # type: ignore
+from api.v1.views import app_views  # type: ignore
+from api.v1.views.pagination import (  # type: ignore
+    next_page_headers, page_args, paginated_response)
+from api.v1.views.expand import schema_args  # type: ignore
+from models import storage  # type: ignore
+from flask import jsonify, abort, request
+from flask_jwt_extended import jwt_required, get_jwt_identity
+
+
+# Followable classes by target type
+target_classes = {
+    'user': User,
+    'category': Category,
+    'tag': Tag,
+}
+
+
+@app_views.route('/feed', methods=['GET'], strict_slashes=False)
+@jwt_required()
+def getFeed():
+    """
+    Retrieves the home feed of the authenticated user, one page at a time.
+
+    Query Parameters:
+        limit (int): The page size (optional).
+        after (str): The cursor of the page to read, from the `X-Next-Cursor` header (optional).
+        fields (str): Comma-separated post columns to read and return, `*` for all; by default all but content (optional).
+
+    Returns:
+        JSON: A list of posts, newest first.
+
+    Raises:
+        400: If the pagination parameters or the fields are invalid.
+    """
+    limit, after = page_args()
+    schema = schema_args(Post, listing=True)
+    try:
+        posts, next_cursor = storage.feed(get_jwt_identity(), limit, after,
+                                          fields=schema.projection)
+    except ValueError as e:
+        abort(400, {'error': str(e)})
+    response = jsonify(schema.dump_many(posts))
+    if next_cursor:
+        next_page_headers(response, limit, next_cursor)
+    return response, 200
+
+
+@app_views.route('/follows', methods=['GET'], strict_slashes=False)
+@jwt_required()
+def getFollows():
+    """
+    Retrieves the sources followed by the authenticated user, one page at
+    a time.
+
+    Returns:
+        JSON: A list of follows.
+    """
+    return paginated_response(Follow, follower_id=get_jwt_identity())
+
+
+@app_views.route('/follows', methods=['POST'], strict_slashes=False)
+@jwt_required()
+def createFollow():
+    """
+    Follows an author, a category or a tag. The latest posts of the source
+    are added to the feed right away.
+
+    Request Body (JSON):
+        type (str): `user`, `category` or `tag` (required).
+        id (str): The ID of the followed object (required).
+
+    Returns:
+        JSON: The follow, with status 201, or 200 if it already existed.
+
+    Raises:
+        400: If the body is invalid or the user follows themselves.
+        404: If the followed object does not exist.
+    """
+    current_user_id = get_jwt_identity()
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        abort(400, {'error': 'Not a JSON'})
+    target_type, target_id = data.get('type'), data.get('id')
+    if target_type not in FOLLOW_TARGETS:
+        abort(400, {'error': 'type must be one of: {}'.format(
+            ', '.join(FOLLOW_TARGETS))})
+    if not isinstance(target_id, str) or not target_id:
+        abort(400, {'error': 'Missing id'})
+    if target_type == 'user' and target_id == current_user_id:
+        abort(400, {'error': 'You cannot follow yourself'})
+    if storage.get(target_classes[target_type], target_id) is None:
+        abort(404, {'error': 'Not found'})
+    follow = storage.first(Follow, follower_id=current_user_id,
+                           target_type=target_type, target_id=target_id)
+    if follow is not None:
+        return jsonify(follow.to_dict()), 200
+    follow = Follow(follower_id=current_user_id, target_type=target_type,
+                    target_id=target_id)
+    storage.new(follow)
+    storage.backfill_feed(follow)
+    storage.save()
+    return jsonify(follow.to_dict()), 201
+
+
+@app_views.route('/follows/<follow_id>', methods=['DELETE'],
+                 strict_slashes=False)
+@jwt_required()
+def deleteFollow(follow_id):
+    """
+    Unfollows a source; its posts leave the feed.
+
+    Returns:
+        JSON: An empty JSON object.
+
+    Raises:
+        403: If the follow belongs to another user.
+        404: If the follow does not exist.
+    """
+    current_user_id = get_jwt_identity()
+    follow = storage.get(Follow, follow_id)
+    if follow is None:
+        abort(404, {'error': 'Not found'})
+    if follow.follower_id != current_user_id:
+        abort(403, 'You are not authorized to delete this follow')
+    storage.unfollow(follow)
+    storage.save()
+    return jsonify({}), 200
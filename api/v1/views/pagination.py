@@ -0,0 +1,95 @@
+"""
+Pagination helpers for the list endpoints.
+Lists are read one page at a time with keyset (cursor) pagination through
+`storage.paginate`. A page is requested with the `limit` and `after` query
+parameters; the cursor of the next page is returned in the `X-Next-Cursor`
+header and as a `Link: rel="next"` URL, so the body stays a JSON list.
+"""
+from models import storage  # type: ignore
+from api.v1.views.expand import (  # type: ignore
+    expand_args, expanded_dicts, schema_args)
+from api.v1.views.conditional import (  # type: ignore
+    not_modified, page_validators, with_validators)
+from flask import jsonify, abort, request, url_for
+
+
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 100
+
+
+def page_args():
+    """
+    Reads the pagination parameters of the current request.
+
+    Returns:
+        tuple: The page size, capped at MAX_LIMIT, and the cursor (or None).
+
+    Raises:
+        400: If `limit` is not a positive integer.
+    """
+    limit = request.args.get('limit', DEFAULT_LIMIT)
+    try:
+        limit = int(limit)
+    except (TypeError, ValueError):
+        abort(400, {'error': 'limit must be an integer'})
+    if limit < 1:
+        abort(400, {'error': 'limit must be positive'})
+    return min(limit, MAX_LIMIT), request.args.get('after') or None
+
+
+def paginated_response(cls, **filters):
+    """
+    Builds the JSON response for one page of objects of `cls`, with the
+    columns named in the `fields` query parameter (by default all but the
+    large ones), read with a column-restricted SELECT, and the related
+    data named in the `expand` one. Pages without
+    expansions carry ETag and Last-Modified validators derived from the
+    page read, and are answered with 304, without serializing the page,
+    when the client copy is still valid.
+
+    Args:
+        cls: The class of the listed objects.
+        **filters: Column equality filters passed to the storage (optional).
+
+    Returns:
+        tuple: The JSON response and the 200 status code, or the 304
+               response.
+
+    Raises:
+        400: If the pagination or expansion parameters are invalid.
+    """
+    limit, after = page_args()
+    relations, counts = expand_args(cls)
+    schema = schema_args(cls, listing=True)
+    try:
+        objs, next_cursor = storage.paginate(cls, limit, after,
+                                             expand=relations,
+                                             fields=schema.projection,
+                                             **filters)
+    except ValueError as e:
+        abort(400, {'error': str(e)})
+    validators = None
+    if not relations and not counts:
+        validators = page_validators(cls, objs, next_cursor, **filters)
+        response = not_modified(*validators)
+        if response is not None:
+            return response, 304
+    response = jsonify(expanded_dicts(cls, objs, relations, counts, schema))
+    if next_cursor:
+        next_page_headers(response, limit, next_cursor)
+    if validators:
+        with_validators(response, *validators)
+    return response, 200
+
+
+def next_page_headers(response, limit, next_cursor):
+    """
+    Sets the `X-Next-Cursor` and `Link: rel="next"` headers of a page,
+    the next URL keeping the other query parameters of the request.
+    """
+    args = request.args.to_dict()
+    args.update(request.view_args or {}, limit=limit, after=next_cursor)
+    next_url = url_for(request.endpoint, **args)
+    response.headers['X-Next-Cursor'] = next_cursor
+    response.headers['Link'] = '<{}>; rel="next"'.format(next_url)
+    return response
@@ -4,16 +4,29 @@ This module defines various routes to manage posts using
 the RESTful API. It allows retrieving, creating, updating,
 and deleting posts by interacting with the POst model.
 """
-from models.user import User  # type: ignore
 from models.post import Post # type: ignore
+from models.engine.serializer import read_only  # type: ignore
 from models.category import Category  # type: ignore
 from api.v1.views import app_views  # type: ignore
+from api.v1.views.pagination import (  # type: ignore
+    next_page_headers, page_args, paginated_response)
+from api.v1.views.streaming import streamed_response  # type: ignore
+from api.v1.views.expand import (  # type: ignore
+    expand_args, expanded_dicts, schema_args)
+from api.v1.views.tags import find_tag  # type: ignore
+from api.v1.views.categories import find_category  # type: ignore
+from api.v1.views.conditional import (  # type: ignore
+    object_validators, not_modified, with_validators)
 from models import storage  # type: ignore
+from models.engine.search import highlight, tokenize  # type: ignore
 from flask import jsonify, abort, request
 from api.v1 import bcrypt, jwt, login_manager  # type: ignore
 from flask_jwt_extended import jwt_required, get_jwt_identity
 
 
+MAX_QUERY_LENGTH = 256
+
+
 @app_views.route('/posts', methods=['POST'], strict_slashes=False)
 @jwt_required()
 def createPost():
@@ -23,6 +36,7 @@ def createPost():
     Request Body (JSON):
         title (str): The post title (required)
         content (str): the post content (required)
+        published (bool): Publishes the post to the feeds of its followers (optional)
 
     Returns:
         JSON: A dictionary representing the newly created post.
@@ -32,9 +46,6 @@ def createPost():
         403: If the user is not allowed to perform this action.
     """
     current_user_id = get_jwt_identity()
-    user = User.query.get(current_user_id)
-    if not user:
-        abort(403, 'User not found or not authorized to create posts')
     data = request.get_json()
     if not isinstance(data, dict):
         abort(400, {'error': 'Not a JSON'})
@@ -45,9 +56,12 @@ def createPost():
     new_post = Post(
         user_id = current_user_id,
         title=data['title'],
-        content=data['content']
+        content=data['content'],
+        published=bool(data.get('published', False))
         )
     storage.new(new_post)
+    if new_post.published:
+        storage.publish(new_post)
     new_post.save()
     return jsonify(new_post.to_dict()), 201
 
@@ -56,23 +70,84 @@ def createPost():
 @jwt_required()
 def getAllPosts():
     """
-    Retrieves all posts.
+    Retrieves all posts, one page at a time.
+
+    This endpoint returns a page of posts from the database, ordered by creation time. The user must be authenticated via JWT.
 
-    This endpoint returns a list of all posts from the database. The user must be authenticated via JWT.
+    Query Parameters:
+        limit (int): The page size (optional).
+        after (str): The cursor of the page to read, from the `X-Next-Cursor` header (optional).
+        stream (str): `json` or `ndjson` to stream every post instead of one page (optional).
+        expand (str): Comma-separated related data to embed: author, comments, categories, tags, comment_count (optional).
+        fields (str): Comma-separated columns to read and return, `*` for all; by default all but content (optional).
+        tag (str): Only lists the posts with this tag, given by name or ID (optional).
+        category (str): Only lists the posts in this category, given by name or ID (optional).
 
     Returns:
         JSON: A list of dictionaries, where each dictionary represents a post.
 
     Raises:
-        403: If the authenticated user does not exist or is not authorized to access posts.
+        401: If the token is missing, expired or revoked.
+        404: If the tag or the category does not exist.
         200: On successful retrieval of posts.
     """
-    current_user_id = get_jwt_identity()
-    user = User.query.get(current_user_id)
-    if not user:
-        abort(403, 'User not found or not authorized to see posts')
-    posts = [post.to_dict() for post in storage.all(Post).values()]
-    return jsonify(posts), 200
+    filters = {}
+    if request.args.get('tag'):
+        filters['tags'] = find_tag(request.args['tag']).id
+    if request.args.get('category'):
+        filters['categories'] = find_category(request.args['category']).id
+    if request.args.get('stream'):
+        return streamed_response(Post, **filters)
+    return paginated_response(Post, **filters)
+
+
+@app_views.route('/posts/search', methods=['GET'], strict_slashes=False)
+@jwt_required()
+def searchPosts():
+    """
+    Searches posts by title and content, best matches first.
+
+    Query Parameters:
+        q (str): The words to look for (required).
+        limit (int): The page size (optional).
+        after (str): The cursor of the page to read, from the `X-Next-Cursor` header (optional).
+
+    Returns:
+        JSON: A list of posts, each with its relevance `score` and `highlights`
+        of its title and content where the matching words are wrapped in <mark>.
+        The number of matching posts is sent in the `X-Total-Count` header.
+
+    Raises:
+        400: If `q` is missing or the pagination parameters are invalid.
+        503: If the search index is still being built or the search ran
+             out of time (with Retry-After).
+    """
+    query = request.args.get('q', '').strip()
+    if not query:
+        abort(400, {'error': 'Missing q'})
+    if len(query) > MAX_QUERY_LENGTH:
+        abort(400, {'error': 'q is too long'})
+    limit, after = page_args()
+    try:
+        offset = int(after or 0)
+    except ValueError:
+        abort(400, {'error': 'Invalid cursor'})
+    hits, total = storage.search(query, limit, max(offset, 0))
+    terms = set(tokenize(query))
+    results = []
+    for post, score in hits:
+        result = post.to_dict()
+        result['score'] = score
+        result['highlights'] = {
+            'title': highlight(post.title, terms),
+            'content': highlight(post.content, terms),
+        }
+        results.append(result)
+    response = jsonify(results)
+    response.headers['X-Total-Count'] = str(total)
+    if offset + limit < total:
+        next_page_headers(response, limit, str(offset + limit))
+    return response, 200
 
 
 @app_views.route('/posts/<post_id>', methods=['GET'], strict_slashes=False)
@@ -83,22 +158,37 @@ def getPostById(post_id):
     
     Args:
         post_id (str): The ID of the post to retrieve.
+
+    Query Parameters:
+        expand (str): Comma-separated related data to embed: author, comments, categories, tags, comment_count (optional).
+        fields (str): Comma-separated columns to read and return, e.g. id,title (optional).
     
     Returns:
         JSON: A dictionary representing the post's data if the post is found.
+        304: If the post did not change since the copy held by the client (ETag / Last-Modified).
     
     Raises:
+        400: If an expansion or a field is unknown.
         403: If the authenticated user is not authorized to view the post.
         404: If the post with the given ID does not exist.
     """
-    current_user_id = get_jwt_identity()
-    user = User.query.get(current_user_id)
-    if not user:
-        abort(403, 'User not found or not authorized to view post')
-    post = Post.query.get(post_id)
+    relations, counts = expand_args(Post)
+    schema = schema_args(Post)
+    try:
+        post = storage.get(Post, post_id, expand=relations,
+                           fields=schema.projection)
+    except ValueError as e:
+        abort(400, {'error': str(e)})
     if not post:
         abort(404, 'Post not found')
-    return jsonify(post.to_dict()), 200
+    if relations or counts:
+        return jsonify(expanded_dicts(Post, [post], relations, counts,
+                                      schema)[0]), 200
+    validators = object_validators(post)
+    response = not_modified(*validators)
+    if response is not None:
+        return response, 304
+    return with_validators(jsonify(schema.dump(post)), *validators), 200
 
 
 @app_views.route('/posts/<post_id>', methods=['DELETE'], strict_slashes=False)
@@ -118,14 +208,12 @@ def deletePostById(post_id):
         404: If the post with the given ID does not exist.
     """
     current_user_id = get_jwt_identity()
-    user = User.query.get(current_user_id)
-    if not user:
-        abort(403, 'User not found or not authorized to delete post')
     post = storage.get(Post, post_id)
     if not post:
         abort(404, 'Post not found')
     if post.user_id != current_user_id:
         abort(403, 'You are not authorized to delete this post')
+    storage.retract(post)
     storage.delete(post)
     storage.save()
     return jsonify({}), 200
@@ -148,10 +236,7 @@ def updatePostById(post_id):
         404: If the post with the given ID does not exist.
     """
     current_user_id = get_jwt_identity()
-    user = User.query.get(current_user_id)
-    if not user:
-        abort(403, 'User not found or not authorized to delete post')
-    post = Post.query.get(post_id)
+    post = storage.get(Post, post_id)
     if not post:
         abort(404, 'Post not found')
     data = request.get_json()
@@ -159,9 +244,12 @@ def updatePostById(post_id):
         abort(400, {'error': 'Not a JSON'})
     if post.user_id != current_user_id:
         abort(403, 'You are not authorized to update this post')
+    published = post.published
     for key, value in data.items():
-        if key not in ['id', 'created_at', 'updated_at']:
+        if key not in read_only(Post):
             setattr(post, key, value)
+    if post.published != published:
+        storage.publish(post)
     storage.save()
     return jsonify(post.to_dict()), 200
 
@@ -181,8 +269,9 @@ def assignCategorytoPost(post_id, category_id):
         abort(404, {'error': 'Category not found'})
     if current_user_id != post.user_id:
         abort(403, 'You are not authorized to update this post')
-    if category not in post.categories:
-        post.categories.append(category)
+    if storage.link(post, 'categories', category):
+        if post.published:
+            storage.publish(post)
         storage.save()
     return jsonify(post.to_dict()), 200
     
@@ -202,8 +291,9 @@ def removeCtegoryFromPost(post_id, category_id):
         abort(404, {'error': 'Category not found'})
     if current_user_id != post.user_id:
         abort(403, 'You are not authorized to update this post')
-    if category in post.categories:
-        post.categories.remove(category)
+    if storage.unlink(post, 'categories', category):
+        if post.published:
+            storage.publish(post)
         storage.save()
         return jsonify(post.to_dict()), 200
     return jsonify({'msg': 'Category not assigned to this post'}), 400
@@ -0,0 +1,76 @@
+"""
+Streaming helpers for the list endpoints.
+With `?stream=json` a list endpoint returns the whole collection as a JSON
+array written batch by batch from a generator, and with `?stream=ndjson`
+(meant for export jobs) one JSON object per line. Rows are read from the
+database in server-side batches through `storage.stream_rows`, so the
+first bytes are sent right away and only one batch is held in memory.
+Rows are serialized as plain tuples by the schema of the class, no ORM
+object is built; `fields` selects the columns read and sent.
+
+A stream holds its database connection until the last byte is sent, so
+streams are refused on the in-memory database, whose single connection
+would be held away from every other request (see api/v1/database.py).
+"""
+from models import storage  # type: ignore
+from api.v1.database import in_memory  # type: ignore
+from api.v1.views.expand import schema_args  # type: ignore
+from flask import Response, abort, current_app, request, stream_with_context
+
+
+STREAM_BATCH_SIZE = 500
+STREAM_FORMATS = {
+    'json': 'application/json',
+    'ndjson': 'application/x-ndjson',
+}
+
+
+def _json_array(batches, schema):
+    """Writes the batches of rows as the chunks of one JSON array."""
+    dumps = current_app.json.dumps
+    dump_row = schema.dump_row
+    separator = '['
+    for batch in batches:
+        if batch:
+            yield separator + ','.join(dumps(dump_row(row)) for row in batch)
+            separator = ','
+    yield ']' if separator == ',' else '[]'
+
+
+def _ndjson(batches, schema):
+    """Writes the batches of rows as newline-delimited JSON."""
+    dumps = current_app.json.dumps
+    dump_row = schema.dump_row
+    for batch in batches:
+        if batch:
+            yield ''.join(dumps(dump_row(row)) + '\n' for row in batch)
+
+
+def streamed_response(cls, **filters):
+    """
+    Builds a streamed response holding every object of `cls`.
+
+    Args:
+        cls: The class of the listed objects.
+        **filters: Column equality filters passed to the storage (optional).
+
+    Returns:
+        Response: A generator-backed response in the format given by the
+                  `stream` query parameter.
+
+    Raises:
+        400: If the requested stream format or a field is unknown.
+        501: If the database is the in-memory one.
+    """
+    fmt = request.args.get('stream')
+    if fmt not in STREAM_FORMATS:
+        abort(400, {'error': 'stream must be one of json, ndjson'})
+    if in_memory(current_app.config['SQLALCHEMY_DATABASE_URI']):
+        abort(501, {'error': 'Streaming is not available on the '
+                             'in-memory database'})
+    schema = schema_args(cls, listing=True)
+    batches = storage.stream_rows(cls, schema.columns(), STREAM_BATCH_SIZE,
+                                  **filters)
+    writer = _ndjson if fmt == 'ndjson' else _json_array
+    return Response(stream_with_context(writer(batches, schema)),
+                    mimetype=STREAM_FORMATS[fmt])
@@ -0,0 +1,244 @@
+"""
+API Views for Tag Management
+This module defines various routes to manage tags using
+the RESTful API. It allows retrieving, creating, updating and
+deleting tags, tagging posts and listing the posts of a tag.
+Links between posts and tags are read and written on the
+association table only, a tag's collection of posts is never loaded.
+"""
+from models.user import User  # type: ignore
+from models.post import Post  # type: ignore
+from models.tag import Tag  # type: ignore
+from api.v1.views import app_views  # type: ignore
+from api.v1.views.pagination import paginated_response  # type: ignore
+from api.v1.views.streaming import streamed_response  # type: ignore
+from api.v1.views.expand import schema_args  # type: ignore
+from api.v1.views.conditional import (  # type: ignore
+    object_validators, not_modified, with_validators)
+from models import storage  # type: ignore
+from flask import jsonify, abort, request
+from flask_jwt_extended import jwt_required, get_jwt_identity
+
+
+def tag_name(tag=None):
+    """
+    Reads the tag name of the request body.
+
+    Args:
+        tag: The tag being renamed, which may keep its name (optional).
+
+    Raises:
+        400: If the body is not JSON or the name is missing.
+        409: If another tag has this name.
+    """
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        abort(400, {'error': 'Not a JSON'})
+    name = data.get('name')
+    if not isinstance(name, str) or not name.strip():
+        abort(400, {'error': 'Missing name'})
+    name = name.strip()
+    other = storage.get_by_name(Tag, name)
+    if other is not None and (tag is None or other.id != tag.id):
+        abort(409, {'error': 'Tag already exists'})
+    return name
+
+
+def check_manager(tag):
+    """
+    Lets the creator of `tag` and the admins change it.
+
+    Raises:
+        403: If the user is neither.
+    """
+    current_user_id = get_jwt_identity()
+    if tag.user_id is not None and tag.user_id == current_user_id:
+        return
+    user = storage.get(User, current_user_id)
+    if user is None or not user.is_admin:
+        abort(403, 'You are not authorized to update this tag')
+
+
+def find_tag(value):
+    """
+    Returns the tag named `value`, or with the ID `value`.
+
+    Raises:
+        404: If there is no such tag.
+    """
+    tag = storage.get_by_name(Tag, value) or storage.get(Tag, value)
+    if tag is None:
+        abort(404, {'error': 'Tag not found'})
+    return tag
+
+
+@app_views.route('/tags', methods=['GET'], strict_slashes=False)
+@jwt_required()
+def getAllTags():
+    """
+    Retrieves all tags, one page at a time (see `limit` and `after`),
+    or all at once as a stream with `stream=json` or `stream=ndjson`.
+    """
+    if request.args.get('stream'):
+        return streamed_response(Tag)
+    return paginated_response(Tag)
+
+
+@app_views.route('/tags/<tag_id>', methods=['GET'], strict_slashes=False)
+@jwt_required()
+def getTagByID(tag_id):
+    """
+    Retrieves a specific tag by its ID or name, or 304 if it did not
+    change since the copy held by the client (ETag / Last-Modified). The
+    columns returned can be selected with `fields`.
+    """
+    schema = schema_args(Tag)
+    tag = find_tag(tag_id)
+    validators = object_validators(tag)
+    response = not_modified(*validators)
+    if response is not None:
+        return response, 304
+    return with_validators(jsonify(schema.dump(tag)), *validators)
+
+
+@app_views.route('/tags', methods=['POST'], strict_slashes=False)
+@jwt_required()
+def createTag():
+    """
+    Creates a tag, owned by the user.
+
+    Request Body (JSON):
+        name (str): The tag name, unique (required).
+
+    Returns:
+        JSON: The new tag, with status 201.
+
+    Raises:
+        400: If the name is missing.
+        409: If a tag with this name exists.
+    """
+    tag = Tag(name=tag_name(), user_id=get_jwt_identity())
+    storage.new(tag)
+    storage.save()
+    return jsonify(tag.to_dict()), 201
+
+
+@app_views.route('/tags/<tag_id>', methods=['PUT'], strict_slashes=False)
+@jwt_required()
+def updateTag(tag_id):
+    """
+    Renames a tag. Only its creator or an admin can rename it.
+
+    Request Body (JSON):
+        name (str): The new name, unique (required).
+
+    Raises:
+        400: If the name is missing.
+        403: If the user is neither the creator of the tag nor an admin.
+        404: If the tag does not exist.
+        409: If another tag has this name.
+    """
+    tag = storage.get(Tag, tag_id)
+    if tag is None:
+        abort(404, {'error': 'Tag not found'})
+    check_manager(tag)
+    tag.name = tag_name(tag)
+    storage.save()
+    return jsonify(tag.to_dict()), 200
+
+
+@app_views.route('/tags/<tag_id>', methods=['DELETE'], strict_slashes=False)
+@jwt_required()
+def deleteTag(tag_id):
+    """
+    Deletes a tag, removes it from its posts and drops its follows, along
+    with the posts it alone brought to the feeds of its followers. Only
+    its creator or an admin can delete it.
+
+    Raises:
+        403: If the user is neither the creator of the tag nor an admin.
+        404: If the tag does not exist.
+    """
+    tag = storage.get(Tag, tag_id)
+    if tag is None:
+        abort(404, {'error': 'Tag not found'})
+    check_manager(tag)
+    storage.unfollow_all(tag)
+    storage.unlink(tag, 'posts')
+    storage.delete(tag)
+    storage.save()
+    return jsonify({}), 200
+
+
+@app_views.route('/tags/<tag_id>/posts', methods=['GET'], strict_slashes=False)
+@jwt_required()
+def getTagPosts(tag_id):
+    """
+    Retrieves the posts of a tag, given by ID or name, one page at a time
+    (see `limit`, `after` and `expand`), or as a stream with `stream`.
+
+    Raises:
+        404: If the tag does not exist.
+    """
+    tag = find_tag(tag_id)
+    if request.args.get('stream'):
+        return streamed_response(Post, tags=tag.id)
+    return paginated_response(Post, tags=tag.id)
+
+
+@app_views.route('/posts/<post_id>/tags/<tag_id>', methods=['POST'],
+                 strict_slashes=False)
+@jwt_required()
+def assignTagToPost(post_id, tag_id):
+    """
+    Tags a post. Only the post author can tag it.
+
+    Returns:
+        JSON: The post, with status 201, or 200 if it already had the tag.
+
+    Raises:
+        403: If the user is not the author of the post.
+        404: If the post or the tag does not exist.
+    """
+    post = storage.get(Post, post_id)
+    if post is None:
+        abort(404, {'error': 'Post not found'})
+    tag = storage.get(Tag, tag_id)
+    if tag is None:
+        abort(404, {'error': 'Tag not found'})
+    if get_jwt_identity() != post.user_id:
+        abort(403, 'You are not authorized to update this post')
+    if not storage.link(post, 'tags', tag):
+        return jsonify(post.to_dict()), 200
+    if post.published:
+        storage.publish(post)
+    storage.save()
+    return jsonify(post.to_dict()), 201
+
+
+@app_views.route('/posts/<post_id>/tags/<tag_id>', methods=['DELETE'],
+                 strict_slashes=False)
+@jwt_required()
+def removeTagFromPost(post_id, tag_id):
+    """
+    Removes a tag from a post. Only the post author can untag it.
+
+    Raises:
+        400: If the post does not have the tag.
+        403: If the user is not the author of the post.
+        404: If the post or the tag does not exist.
+    """
+    post = storage.get(Post, post_id)
+    if post is None:
+        abort(404, {'error': 'Post not found'})
+    tag = storage.get(Tag, tag_id)
+    if tag is None:
+        abort(404, {'error': 'Tag not found'})
+    if get_jwt_identity() != post.user_id:
+        abort(403, 'You are not authorized to update this post')
+    if not storage.unlink(post, 'tags', tag):
+        return jsonify({'msg': 'Tag not assigned to this post'}), 400
+    if post.published:
+        storage.publish(post)
+    storage.save()
+    return jsonify(post.to_dict()), 200
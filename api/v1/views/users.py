@@ -5,12 +5,21 @@ the RESTful API. It allows retrieving, creating, updating,
 and deleting user data by interacting with the User model.
 """
 from models.user import User  # type: ignore
+from models.engine.serializer import read_only  # type: ignore
 from api.v1.views import app_views  # type: ignore
+from api.v1.views.pagination import paginated_response  # type: ignore
+from api.v1.views.streaming import streamed_response  # type: ignore
+from api.v1.views.expand import schema_args  # type: ignore
+from api.v1.views.conditional import (  # type: ignore
+    object_validators, not_modified, with_validators)
 from models import storage  # type: ignore
 from flask import jsonify, abort, request
-from api.v1 import bcrypt, jwt, login_manager  # type: ignore
+from api.v1 import bcrypt, hasher, jwt, login_manager  # type: ignore
+from api.v1.passwords import HasherBusy  # type: ignore
 from werkzeug.security import check_password_hash
-from flask_jwt_extended import create_access_token, jwt_required, get_jwt_identity
+from api.v1.identity import (  # type: ignore
+    credentials_changed, issue_token, revoke_tokens)
+from flask_jwt_extended import jwt_required, get_jwt_identity
 
 
 @app_views.route('/login', methods=['POST'], strict_slashes=False)
@@ -24,6 +33,10 @@ def login():
     
     Returns:
         JSON: A JWT token if authentication is successful.
+
+    The password hash is upgraded when it was made with another work factor
+    than the configured one, unless the hashing queue is full. Answers 503
+    when the queue is full for the verification.
     """
     data = request.get_json()
     if not isinstance(data, dict):
@@ -33,8 +46,15 @@ def login():
     if not email or not password:
         return jsonify({"msg": "Missing email or password"}), 400
     user = storage.get_user_by_email(User, email)
-    if user and bcrypt.check_password_hash(user.password_hash, password):
-        access_token = create_access_token(identity=user.id)
+    if user and hasher.verify(user.password_hash, password):
+        if hasher.needs_rehash(user.password_hash):
+            try:
+                user.password_hash = hasher.hash(password)
+                storage.save()
+            except HasherBusy:
+                # The upgrade is retried on a later login
+                pass
+        access_token = issue_token(user)
         return jsonify(access_token=access_token), 200
     else:
         return jsonify({"msg": "Bad email or password"}), 401
@@ -54,6 +74,7 @@ def createUser():
     
     Raises:
         400: If the request body is not JSON or if required fields (email, password) are missing.
+        503: If the password hashing queue is full.
     """
     data = request.get_json()
     if not isinstance(data, dict):
@@ -64,7 +85,7 @@ def createUser():
         abort(400, 'Missing password')
     if 'username' not in data:
         abort(400, 'Missing username')
-    hashed_password = bcrypt.generate_password_hash(data['password']).decode('utf-8')
+    hashed_password = hasher.hash(data['password'])
     new_user = User(
         email=data['email'],
         username=data['username'],
@@ -78,13 +99,19 @@ def createUser():
 @app_views.route('/users', methods=['GET'], strict_slashes=False)
 def getUsers():
     """
-    Retrieves all users from the storage.
+    Retrieves all users from the storage, one page at a time.
+
+    Query Parameters:
+        limit (int): The page size (optional).
+        after (str): The cursor of the page to read, from the `X-Next-Cursor` header (optional).
+        stream (str): `json` or `ndjson` to stream every user instead of one page (optional).
     
     Returns:
         JSON: A list of dictionaries, where each dictionary represents a user's data.
     """
-    users = [user.to_dict() for user in storage.all(User).values()]
-    return jsonify(users), 200
+    if request.args.get('stream'):
+        return streamed_response(User)
+    return paginated_response(User)
 
 
 @app_views.route('/users/<user_id>', methods=['GET'])
@@ -95,16 +122,26 @@ def getUserWithID(user_id):
     Args:
         user_id (str): The ID of the user to retrieve.
     
+    Query Parameters:
+        fields (str): Comma-separated columns to read and return (optional).
+    
     Returns:
         JSON: A dictionary representing the user's data if the user is found.
+        304: If the user did not change since the copy held by the client (ETag / Last-Modified).
     
     Raises:
+        400: If a field is unknown.
         404: If the user with the given ID does not exist.
     """
-    user = storage.get(User, user_id)
+    schema = schema_args(User)
+    user = storage.get(User, user_id, fields=schema.projection)
     if user is None:
         abort(404)
-    return jsonify(user.to_dict())
+    validators = object_validators(user)
+    response = not_modified(*validators)
+    if response is not None:
+        return response, 304
+    return with_validators(jsonify(schema.dump(user)), *validators)
 
 
 @app_views.route('/users/<user_id>', methods=['DELETE'])
@@ -129,6 +166,8 @@ def deleteUserWithID(user_id):
         abort(404)
     if str(current_user_id) != str(user_id):
         return jsonify({"msg": "You are not authorized to update this user"}), 403
+    # The tokens of a user that no longer exists are rejected
+    storage.remove_follows(user)
     storage.delete(user)
     storage.save()
     return jsonify({}), 200
@@ -150,8 +189,9 @@ def updateUser(user_id):
         abort(400, {'error': 'Not a JSON'})
     
     for key, value in data.items():
-        if key not in ['id', 'created_at', 'updated_at']:
+        if key not in read_only(User):
             setattr(user, key, value)
-    
+    if credentials_changed(data):
+        revoke_tokens(user)
     storage.save()
     return jsonify(user.to_dict()), 200
@@ -0,0 +1,520 @@
+#!/usr/bin/python3
+"""
+Load test of the REST API.
+
+Seeds a deterministic dataset, then runs concurrent clients replaying a
+traffic mix (login, list posts, get post, add comment, assign category)
+against the Flask app, in-process through the test client and over HTTP
+through a threaded WSGI server. Reports, by operation, the requests per
+second, the p50/p95/p99 latency and the SQL statements per request, read
+from the Server-Timing header of the profiler (api/v1/profiling.py) with
+every request sampled.
+
+The database is the configured one (see api/v1/database.py):
+WordFlow_STORAGE=sqlite with WordFlow_SQLITE_PATH, WordFlow_STORAGE=memory,
+or a local MySQL. The dataset ids depend only on its size, so a database
+file can be seeded once and reused by later runs. The comments and
+category links written by the traffic mix are removed before each round
+(in-process, then over HTTP), so that every round, and every later run,
+starts from the seeded dataset. The in-memory database
+has a pool of one connection, which serializes every request: it cannot
+serve concurrent clients, so its runs only make sense with --clients 1.
+
+The object cache is disabled during the runs, so that the figures are
+those of the database (see models/engine/cache.py).
+
+Results can be saved as a baseline, and a later run compared to it: the
+run fails when the throughput of an operation drops, or its p95 latency
+grows, by more than the tolerance, or when it issues more statements.
+A baseline is only compared to a run of the same configuration (dataset
+size, clients, work factor and backend). benchmarks/baseline_sqlite.json
+holds the baseline of the default options on SQLite.
+
+Usage:
+    WordFlow_STORAGE=sqlite WordFlow_SQLITE_PATH=/tmp/wordflow_bench.db \\
+        python3 -m benchmarks.bench_api --users 50 --posts 2000 \\
+        --duration 10 --clients 8 --save benchmarks/baseline_sqlite.json
+    WordFlow_STORAGE=sqlite WordFlow_SQLITE_PATH=/tmp/wordflow_bench.db \\
+        python3 -m benchmarks.bench_api \\
+        --compare benchmarks/baseline_sqlite.json
+"""
+import argparse
+import http.client
+import json
+import math
+import random
+import re
+import sys
+import threading
+import time
+from sqlalchemy import delete
+from sqlalchemy.engine import make_url
+from werkzeug.serving import WSGIRequestHandler, make_server
+from api.v1 import hasher, profiler  # type: ignore
+from api.v1.app import app  # type: ignore
+from api.v1.database import in_memory  # type: ignore
+from models import storage  # type: ignore
+from models.base_model import db  # type: ignore
+from models.user import User  # type: ignore
+from models.post import Post, post_categories  # type: ignore
+from models.comment import Comment  # type: ignore
+from models.category import Category  # type: ignore
+
+
+PASSWORD = "bench"
+DEFAULT_MIX = "login=1,list_posts=6,get_post=10,add_comment=2," \
+              "assign_category=1"
+TIMING = re.compile(r'db;dur=[\d.]+;desc="(\d+) queries"')
+# The options a baseline must share with the run compared to it
+COMPARED = ('users', 'posts', 'comments', 'categories', 'clients', 'rounds',
+            'backend')
+
+
+class Dataset:
+    """The deterministic ids of a seeded dataset of a given size."""
+
+    def __init__(self, users, posts, comments, categories):
+        self.users = users
+        self.posts = posts
+        self.comments = comments
+        self.categories = categories
+        self.prefix = "bench-{}-{}-{}-{}".format(users, posts, comments,
+                                                 categories)
+
+    def id(self, kind, i):
+        """Returns the id of the i-th object of `kind`."""
+        return "{}-{}-{:09d}".format(self.prefix, kind, i)
+
+    def email(self, i):
+        """Returns the email of the i-th user."""
+        return "{}-{}@example.com".format(self.prefix, i)
+
+    def own_posts(self, user):
+        """Returns the indexes of the posts of the user `user`."""
+        return range(user, self.posts, self.users)
+
+
+def seed(dataset, rng, words):
+    """Inserts the dataset unless it is already there."""
+    if storage.get(User, dataset.id('user', dataset.users - 1)) is not None:
+        print("dataset {} already seeded".format(dataset.prefix))
+        return
+    start = time.perf_counter()
+    password_hash = hasher.hash(PASSWORD)
+    storage.bulk_insert(User, (
+        {'id': dataset.id('user', i), 'email': dataset.email(i),
+         'username': "{}-{}".format(dataset.prefix, i),
+         'password_hash': password_hash}
+        for i in range(dataset.users)))
+    storage.bulk_insert(Category, (
+        {'id': dataset.id('category', i),
+         'name': "{}-{}".format(dataset.prefix, i)}
+        for i in range(dataset.categories)))
+    storage.bulk_insert(Post, (
+        {'id': dataset.id('post', i),
+         'user_id': dataset.id('user', i % dataset.users),
+         'title': " ".join(rng.choices(words, k=6)),
+         'content': " ".join(rng.choices(words, k=rng.randint(50, 300))),
+         'published': True}
+        for i in range(dataset.posts)))
+    storage.bulk_insert('post_categories', seeded_links(dataset))
+    storage.bulk_insert(Comment, (
+        {'id': dataset.id('comment', i),
+         'user_id': dataset.id('user', rng.randrange(dataset.users)),
+         'post_id': dataset.id('post', rng.randrange(dataset.posts)),
+         'content': " ".join(rng.choices(words, k=rng.randint(5, 40)))}
+        for i in range(dataset.comments)))
+    storage.close()
+    print("seeded {} in {:.1f}s".format(dataset.prefix,
+                                        time.perf_counter() - start))
+
+
+def seeded_links(dataset):
+    """Returns the category links of the seeded posts."""
+    return ({'post_id': dataset.id('post', i),
+             'category_id': dataset.id('category', i % dataset.categories)}
+            for i in range(dataset.posts))
+
+
+def restore(dataset):
+    """
+    Removes the comments and category links written by the traffic mix,
+    then recounts the counters they moved.
+    """
+    start = time.perf_counter()
+    ours = dataset.prefix + '-'
+    comments = Comment.__table__
+    removed = db.session.execute(delete(comments).where(
+        comments.c.user_id.startswith(ours, autoescape=True),
+        ~comments.c.id.startswith(ours, autoescape=True))).rowcount
+    db.session.execute(delete(post_categories).where(
+        post_categories.c.post_id.startswith(ours, autoescape=True)))
+    db.session.commit()
+    storage.bulk_insert('post_categories', seeded_links(dataset))
+    storage.reconcile_counters()
+    storage.close()
+    print("restored {} ({} comments removed) in {:.1f}s".format(
+        dataset.prefix, removed, time.perf_counter() - start))
+
+
+class InProcessClient:
+    """Sends requests through the Flask test client."""
+
+    def __init__(self):
+        self.client = app.test_client()
+
+    def request(self, method, path, headers, body=None):
+        """Returns the status, the JSON body and the Server-Timing header."""
+        response = self.client.open(path, method=method, headers=headers,
+                                    json=body)
+        return (response.status_code, response.get_json(silent=True),
+                response.headers.get('Server-Timing', ''))
+
+    def close(self):
+        """Nothing to release."""
+
+
+class HTTPClient:
+    """Sends requests over a keep-alive HTTP connection."""
+
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.connection = None
+
+    def request(self, method, path, headers, body=None):
+        """Returns the status, the JSON body and the Server-Timing header."""
+        headers = dict(headers)
+        data = None
+        if body is not None:
+            data = json.dumps(body)
+            headers['Content-Type'] = 'application/json'
+        for attempt in (1, 2):
+            if self.connection is None:
+                self.connection = http.client.HTTPConnection(self.host,
+                                                             self.port)
+            try:
+                self.connection.request(method, path, data, headers)
+                response = self.connection.getresponse()
+                payload = response.read()
+                break
+            except (http.client.HTTPException, OSError):
+                self.close()
+                if attempt == 2:
+                    raise
+        try:
+            document = json.loads(payload) if payload else None
+        except ValueError:
+            document = None
+        return (response.status, document,
+                response.getheader('Server-Timing', ''))
+
+    def close(self):
+        """Closes the connection."""
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+
+class QuietHandler(WSGIRequestHandler):
+    """Request handler that does not log each request."""
+
+    def log_request(self, *args, **kwargs):
+        """Skips the access log."""
+
+
+class Worker:
+    """A virtual user replaying the traffic mix."""
+
+    def __init__(self, index, client, dataset, mix, seed):
+        self.client = client
+        self.dataset = dataset
+        self.user = index % dataset.users
+        self.rng = random.Random(seed * 1000 + index)
+        self.operations = [name for name, _ in mix]
+        self.weights = [weight for _, weight in mix]
+        self.headers = {}
+        self.samples = {name: [] for name in self.operations}
+        self.errors = {name: 0 for name in self.operations}
+
+    def login(self):
+        """Logs in and keeps the token."""
+        status, body, timing = self.client.request(
+            'POST', '/api/v1/login', {},
+            {'email': self.dataset.email(self.user), 'password': PASSWORD})
+        if status == 200:
+            self.headers = {
+                'Authorization': 'Bearer ' + body['access_token']}
+        return status, timing
+
+    def list_posts(self):
+        """Reads the first page of posts."""
+        return self.get('/api/v1/posts?limit=20')
+
+    def get_post(self):
+        """Reads a random post."""
+        return self.get('/api/v1/posts/{}'.format(self.random_post()))
+
+    def add_comment(self):
+        """Comments a random post."""
+        status, _, timing = self.client.request(
+            'POST', '/api/v1/posts/{}/comments'.format(self.random_post()),
+            self.headers, {'content': 'benchmark comment'})
+        return status, timing
+
+    def assign_category(self):
+        """Adds a random category to one of the user's posts."""
+        posts = self.dataset.own_posts(self.user)
+        if not posts:
+            return 200, ''
+        path = '/api/v1/posts/{}/categories/{}'.format(
+            self.dataset.id('post', self.rng.choice(posts)),
+            self.dataset.id('category',
+                            self.rng.randrange(self.dataset.categories)))
+        status, _, timing = self.client.request('POST', path, self.headers)
+        return status, timing
+
+    def get(self, path):
+        """Sends an authenticated GET."""
+        status, _, timing = self.client.request('GET', path, self.headers)
+        return status, timing
+
+    def random_post(self):
+        """Returns the id of a random post."""
+        return self.dataset.id('post', self.rng.randrange(self.dataset.posts))
+
+    def run(self, stop, record):
+        """Sends requests until `stop` is set, recording after `record`."""
+        self.login()
+        while not stop.is_set():
+            name = self.rng.choices(self.operations, self.weights)[0]
+            start = time.perf_counter()
+            status, timing = getattr(self, name)()
+            elapsed = time.perf_counter() - start
+            if not record.is_set():
+                continue
+            match = TIMING.search(timing)
+            queries = int(match.group(1)) if match else None
+            self.samples[name].append((elapsed, queries))
+            if status >= 400:
+                self.errors[name] += 1
+        self.client.close()
+
+
+def percentile(values, q):
+    """Returns the `q` percentile of the sorted `values`."""
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, math.ceil(q * len(values)) - 1)]
+
+
+def summarize(samples, errors, duration):
+    """Returns the figures of a list of (seconds, queries) samples."""
+    latencies = sorted(elapsed for elapsed, _ in samples)
+    queries = [count for _, count in samples if count is not None]
+    return {
+        'requests': len(samples),
+        'errors': errors,
+        'rps': len(samples) / duration,
+        'p50_ms': percentile(latencies, 0.50) * 1e3,
+        'p95_ms': percentile(latencies, 0.95) * 1e3,
+        'p99_ms': percentile(latencies, 0.99) * 1e3,
+        'queries_per_request': sum(queries) / len(queries)
+        if queries else None,
+    }
+
+
+def run(make_client, dataset, mix, args):
+    """Runs the clients against one transport and returns the figures."""
+    workers = [Worker(i, make_client(), dataset, mix, args.seed)
+               for i in range(args.clients)]
+    stop, record = threading.Event(), threading.Event()
+    threads = [threading.Thread(target=worker.run, args=(stop, record))
+               for worker in workers]
+    for thread in threads:
+        thread.start()
+    time.sleep(args.warmup)
+    record.set()
+    time.sleep(args.duration)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    results = {}
+    everything, total_errors = [], 0
+    for name, _ in mix:
+        samples = [s for worker in workers for s in worker.samples[name]]
+        errors = sum(worker.errors[name] for worker in workers)
+        results[name] = summarize(samples, errors, args.duration)
+        everything += samples
+        total_errors += errors
+    results['total'] = summarize(everything, total_errors, args.duration)
+    return results
+
+
+def over_http(dataset, mix, args):
+    """Runs the clients against a threaded WSGI server on a free port."""
+    server = make_server('127.0.0.1', 0, app, threaded=True,
+                         request_handler=QuietHandler)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.start()
+    try:
+        return run(lambda: HTTPClient('127.0.0.1', server.server_port),
+                   dataset, mix, args)
+    finally:
+        server.shutdown()
+        thread.join()
+
+
+def report(mode, results):
+    """Prints the figures of one transport."""
+    print("\n{}".format(mode))
+    print("  {:<16} {:>8} {:>7} {:>9} {:>8} {:>8} {:>8} {:>8}".format(
+        "operation", "requests", "errors", "req/s", "p50 ms", "p95 ms",
+        "p99 ms", "queries"))
+    for name, stats in results.items():
+        queries = stats['queries_per_request']
+        print("  {:<16} {:>8} {:>7} {:>9.1f} {:>8.2f} {:>8.2f} {:>8.2f} "
+              "{:>8}".format(name, stats['requests'], stats['errors'],
+                             stats['rps'], stats['p50_ms'], stats['p95_ms'],
+                             stats['p99_ms'], "-" if queries is None
+                             else "{:.1f}".format(queries)))
+
+
+def backend():
+    """Returns the name of the configured database backend."""
+    url = app.config['SQLALCHEMY_DATABASE_URI']
+    if in_memory(url):
+        return 'memory'
+    return make_url(url).get_backend_name()
+
+
+def mismatches(baseline, config):
+    """
+    Returns the options of `config` that differ from those of the run
+    that produced `baseline`.
+    """
+    return ["{}: {}, baseline {}".format(key, config[key],
+                                         baseline.get(key))
+            for key in COMPARED if baseline.get(key) != config[key]]
+
+
+def compare(baseline, results, tolerance):
+    """
+    Returns the regressions of `results` against `baseline`: lower
+    throughput or higher p95 beyond the tolerance, or more statements.
+    """
+    regressions = []
+    for mode, operations in results.items():
+        for name, stats in operations.items():
+            base = baseline.get(mode, {}).get(name)
+            if not base or not base['requests']:
+                continue
+            label = "{} {}".format(mode, name)
+            if stats['rps'] < base['rps'] * (1 - tolerance):
+                regressions.append("{}: {:.1f} req/s, baseline {:.1f}".format(
+                    label, stats['rps'], base['rps']))
+            if stats['p95_ms'] > base['p95_ms'] * (1 + tolerance):
+                regressions.append("{}: p95 {:.2f} ms, baseline {:.2f}".format(
+                    label, stats['p95_ms'], base['p95_ms']))
+            if (stats['queries_per_request'] is not None
+                    and base['queries_per_request'] is not None
+                    and stats['queries_per_request']
+                    > base['queries_per_request'] + 0.5):
+                regressions.append(
+                    "{}: {:.1f} queries per request, baseline {:.1f}".format(
+                        label, stats['queries_per_request'],
+                        base['queries_per_request']))
+    return regressions
+
+
+def parse_mix(value):
+    """Parses `name=weight,...` into (name, weight) pairs."""
+    mix = []
+    for part in value.split(','):
+        name, _, weight = part.partition('=')
+        if not hasattr(Worker, name.strip()) or name.strip() in (
+                'run', 'get', 'random_post'):
+            raise argparse.ArgumentTypeError(
+                "unknown operation: {}".format(name))
+        mix.append((name.strip(), float(weight or 1)))
+    return mix
+
+
+def main():
+    """Seeds the dataset, runs the load and reports or compares."""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--posts', type=int, default=2000)
+    parser.add_argument('--comments', type=int, default=5000)
+    parser.add_argument('--categories', type=int, default=20)
+    parser.add_argument('--clients', type=int, default=8)
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--warmup', type=float, default=2)
+    parser.add_argument('--mix', type=parse_mix, default=DEFAULT_MIX,
+                        help="operation weights (default {})".format(
+                            DEFAULT_MIX))
+    parser.add_argument('--mode', choices=('inprocess', 'http', 'both'),
+                        default='both')
+    parser.add_argument('--rounds', type=int, default=4,
+                        help="bcrypt work factor of the seeded users")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--save', help="write the results to this file")
+    parser.add_argument('--compare', help="baseline results to compare to")
+    parser.add_argument('--tolerance', type=float, default=0.2)
+    args = parser.parse_args()
+
+    hasher.configure(args.rounds, max_queue=4 * args.clients)
+    profiler.configure(sample=1.0)
+    rng = random.Random(args.seed)
+    words = ["w{}".format(i) for i in range(5000)]
+    dataset = Dataset(args.users, args.posts, args.comments,
+                      args.categories)
+    config = {k: v for k, v in vars(args).items()
+              if k not in ('save', 'compare')}
+    config['backend'] = backend()
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        different = mismatches(baseline['config'], config)
+        if different:
+            for difference in different:
+                print("CONFIG " + difference)
+            sys.exit("{} was not produced with this configuration".format(
+                args.compare))
+    storage.use_cache(None)
+    with app.app_context():
+        seed(dataset, rng, words)
+
+    print("{}, {} clients, {:.0f}s".format(
+        app.config['SQLALCHEMY_DATABASE_URI'].split('@')[-1],
+        args.clients, args.duration))
+    results = {}
+    if args.mode in ('inprocess', 'both'):
+        with app.app_context():
+            restore(dataset)
+        results['inprocess'] = run(InProcessClient, dataset, args.mix, args)
+        report('inprocess', results['inprocess'])
+    if args.mode in ('http', 'both'):
+        with app.app_context():
+            restore(dataset)
+        results['http'] = over_http(dataset, args.mix, args)
+        report('http', results['http'])
+    hasher.shutdown()
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump({'config': config, 'results': results}, f, indent=2,
+                      default=str)
+        print("\nresults saved to {}".format(args.save))
+    if args.compare:
+        regressions = compare(baseline['results'], results, args.tolerance)
+        print()
+        for regression in regressions:
+            print("REGRESSION " + regression)
+        if regressions:
+            sys.exit(1)
+        print("no regression against {}".format(args.compare))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+#!/usr/bin/python3
+"""
+Benchmark for login throughput against the number of hashing processes.
+
+Signs up one user, then for each worker count runs concurrent login
+clients against the Flask app in-process for a fixed duration, while one
+more client reads a user profile to show how cheap endpoints fare during
+the login storm.
+
+Usage:
+    python3 -m benchmarks.bench_login --workers 1 2 4 --duration 10
+"""
+import argparse
+import os
+import threading
+import time
+from uuid import uuid4
+from api.v1 import hasher  # type: ignore
+from api.v1.app import app  # type: ignore
+
+
+def login_client(credentials, stop, results):
+    """Logs in until `stop` is set, counting the answers by status."""
+    client = app.test_client()
+    while not stop.is_set():
+        status = client.post('/api/v1/login', json=credentials).status_code
+        results[status] = results.get(status, 0) + 1
+
+
+def profile_client(user_id, stop, latencies):
+    """Reads the user profile until `stop` is set, recording latencies."""
+    client = app.test_client()
+    while not stop.is_set():
+        start = time.perf_counter()
+        client.get('/api/v1/users/{}'.format(user_id))
+        latencies.append(time.perf_counter() - start)
+
+
+def run(credentials, user_id, workers, clients, duration):
+    """Runs one login storm and returns its statistics."""
+    hasher.configure(hasher.rounds, workers, max_queue=clients)
+    stop = threading.Event()
+    results = [{} for _ in range(clients)]
+    latencies = []
+    threads = [threading.Thread(target=login_client,
+                                args=(credentials, stop, result))
+               for result in results]
+    threads.append(threading.Thread(target=profile_client,
+                                    args=(user_id, stop, latencies)))
+    for thread in threads:
+        thread.start()
+    time.sleep(duration)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    ok = sum(result.get(200, 0) for result in results)
+    busy = sum(result.get(503, 0) for result in results)
+    latencies.sort()
+    return {
+        "logins_per_s": ok / duration,
+        "rejected": busy,
+        "profile_p50_ms": latencies[len(latencies) // 2] * 1e3
+        if latencies else 0.0,
+    }
+
+
+def main():
+    cpus = os.cpu_count() or 1
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--workers", type=int, nargs="+",
+                        default=sorted({1, max(cpus // 2, 1), cpus}))
+    parser.add_argument("--clients-per-worker", type=int, default=2)
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--rounds", type=int, default=hasher.rounds)
+    args = parser.parse_args()
+
+    hasher.configure(args.rounds, workers=0)
+    suffix = uuid4().hex[:8]
+    credentials = {"email": "bench_{}@example.com".format(suffix),
+                   "password": "bench"}
+    response = app.test_client().post('/api/v1/signup', json=dict(
+        credentials, username="bench_{}".format(suffix)))
+    user_id = response.get_json()['id']
+
+    print("{} CPUs, bcrypt rounds {}".format(cpus, args.rounds))
+    print("{:>8} {:>8} {:>12} {:>9} {:>15}".format(
+        "workers", "clients", "logins/s", "rejected", "profile p50 ms"))
+    for workers in args.workers:
+        clients = workers * args.clients_per_worker
+        stats = run(credentials, user_id, workers, clients, args.duration)
+        print("{:>8} {:>8} {:>12.1f} {:>9} {:>15.2f}".format(
+            workers, clients, stats["logins_per_s"], stats["rejected"],
+            stats["profile_p50_ms"]))
+    hasher.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+#!/usr/bin/python3
+"""
+Benchmark for the in-memory search index against its size.
+
+Indexes synthetic posts drawn from a Zipf-like vocabulary, so that a few
+words appear in most posts as in real text, then reports the latency of
+queries mixing rare and common words. The MySQL backend is measured by
+the load tests, against the database populated with populate_db.py.
+
+Usage:
+    python3 -m benchmarks.bench_search --posts 1000000 --queries 200
+"""
+import argparse
+import random
+import time
+from itertools import accumulate
+from models.engine.search import MemoryIndex  # type: ignore
+
+
+def vocabulary(size):
+    """Returns the words and their cumulated Zipf weights."""
+    words = ["w{}".format(i) for i in range(size)]
+    weights = list(accumulate(1 / (rank + 1) for rank in range(size)))
+    return words, weights
+
+
+def build(posts, words, weights):
+    """Builds an index of `posts` synthetic posts."""
+    index = MemoryIndex()
+    for i in range(posts):
+        title = " ".join(random.choices(words, cum_weights=weights, k=6))
+        content = " ".join(random.choices(words, cum_weights=weights, k=60))
+        index.add(str(i), title, content)
+    index.ready = True
+    return index
+
+
+def percentile(values, fraction):
+    """Returns the value at `fraction` of the sorted values."""
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def main():
+    """Builds the index and times the queries."""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument('--posts', type=int, default=1000000)
+    parser.add_argument('--words', type=int, default=50000)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--limit', type=int, default=20)
+    args = parser.parse_args()
+    random.seed(0)
+    words, weights = vocabulary(args.words)
+    start = time.perf_counter()
+    index = build(args.posts, words, weights)
+    print("indexed {} posts in {:.1f}s".format(
+        args.posts, time.perf_counter() - start))
+    latencies = []
+    for _ in range(args.queries):
+        query = " ".join(random.choices(words, k=2) +
+                         random.choices(words, cum_weights=weights, k=1))
+        start = time.perf_counter()
+        index.search(None, query, args.limit)
+        latencies.append(time.perf_counter() - start)
+    print("p50 {:.1f} ms, p99 {:.1f} ms, max {:.1f} ms".format(
+        percentile(latencies, 0.5) * 1000,
+        percentile(latencies, 0.99) * 1000, max(latencies) * 1000))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+#!/usr/bin/python3
+"""
+Benchmark for the serialization of list responses.
+
+Serializes synthetic posts to one JSON document with the former path
+(a copy of `__dict__` per object, then the standard json module with
+sorted keys, as `jsonify` did) and with the schema serializer, from ORM
+objects and from plain row tuples, with the standard json module and
+with orjson when it is installed. No database is needed.
+
+Usage:
+    python3 -m benchmarks.bench_serialize --objects 1000 100000
+"""
+import argparse
+import json
+import time
+from datetime import datetime, timedelta
+from models.post import Post  # type: ignore
+from models.engine.serializer import schema_for  # type: ignore
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def legacy_to_dict(obj):
+    """The former `BaseModel.to_dict`."""
+    instance_dict = obj.__dict__.copy()
+    instance_dict["__class__"] = obj.__class__.__name__
+    if "created_at" in instance_dict:
+        instance_dict["created_at"] = obj.created_at.isoformat()
+    if "updated_at" in instance_dict:
+        instance_dict["updated_at"] = obj.updated_at.isoformat()
+    if "_sa_instance_state" in instance_dict.keys():
+        del instance_dict["_sa_instance_state"]
+    for key in obj.__mapper__.relationships.keys():
+        instance_dict.pop(key, None)
+    return instance_dict
+
+
+def std_dumps(data):
+    """Encodes like the standard Flask JSON provider."""
+    return json.dumps(data, sort_keys=True, separators=(",", ":")).encode()
+
+
+def fast_dumps(data):
+    """Encodes like api/v1/encoding.py."""
+    return orjson.dumps(data, option=orjson.OPT_SORT_KEYS)
+
+
+def posts(n):
+    """Builds `n` posts with every column loaded."""
+    start = datetime(2024, 1, 1)
+    objs = []
+    for i in range(n):
+        created_at = start + timedelta(seconds=i)
+        objs.append(Post(id="post-{:09d}".format(i), user_id="user-1",
+                         title="Post number {}".format(i),
+                         content="Some content " * 20, published=True,
+                         comment_count=i % 50, created_at=created_at,
+                         updated_at=created_at))
+    return objs
+
+
+def measure(serialize, repeat):
+    """Returns the best time of `repeat` runs of `serialize` and the size."""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        size = len(serialize())
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, size
+
+
+def main():
+    """Times each serialization path at each size."""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument('--objects', type=int, nargs='+',
+                        default=[1000, 100000])
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+    schema = schema_for(Post)
+    narrow = schema.only(('id', 'title'))
+    for n in args.objects:
+        objs = posts(n)
+        rows = [tuple(obj.__dict__[key] for key in schema.fields)
+                for obj in objs]
+        narrow_rows = [(row[0], row[schema.fields.index('title')])
+                       for row in rows]
+        print("{} posts".format(n))
+        paths = [
+            ("to_dict (former) + json", lambda: std_dumps(
+                [legacy_to_dict(obj) for obj in objs])),
+            ("schema + json", lambda: std_dumps(schema.dump_many(objs))),
+        ]
+        if orjson is not None:
+            paths += [
+                ("schema + orjson", lambda: fast_dumps(
+                    schema.dump_many(objs))),
+                ("rows + orjson", lambda: fast_dumps(
+                    [schema.dump_row(row) for row in rows])),
+                ("rows fields=id,title + orjson", lambda: fast_dumps(
+                    [narrow.dump_row(row) for row in narrow_rows])),
+            ]
+        baseline = None
+        for label, serialize in paths:
+            best, size = measure(serialize, args.repeat)
+            baseline = baseline or best
+            print("  {:<30} {:8.1f} ms {:6.2f} us/object {:5.1f}x"
+                  "  {} bytes".format(label, best * 1000, best * 1e6 / n,
+                                      baseline / best, size))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+#!/usr/bin/python3
+"""
+Benchmark for DBStorage.get.
+
+Seeds the configured database with deterministic benchmark users and then
+measures single-object lookups at several table sizes. Because `get` is a
+primary-key fetch, the reported latencies should stay flat as the number
+of rows grows.
+
+Usage:
+    python3 -m benchmarks.bench_storage_get --rows 10000 100000 1000000
+"""
+import argparse
+import random
+import time
+from models import storage  # type: ignore
+from models.user import User  # type: ignore
+
+
+CHUNK_SIZE = 10000
+
+
+def bench_id(i):
+    """Returns the deterministic id of the i-th benchmark user."""
+    return "bench-user-{:09d}".format(i)
+
+
+def seed(rows):
+    """
+    Makes sure the first `rows` benchmark users exist. Chunks that are
+    already present are skipped, so growing from 10k to 1M only inserts
+    the missing rows. Only the last chunk of a previous run can be
+    partial, and only that one is checked row by row.
+    """
+    for start in range(0, rows, CHUNK_SIZE):
+        stop = min(start + CHUNK_SIZE, rows)
+        if storage.get(User, bench_id(stop - 1)) is not None:
+            continue
+        partial = storage.get(User, bench_id(start)) is not None
+        for i in range(start, stop):
+            if partial and storage.get(User, bench_id(i)) is not None:
+                continue
+            storage.new(User(
+                id=bench_id(i),
+                username="bench_user_{}".format(i),
+                email="bench_user_{}@example.com".format(i),
+                password_hash="x"))
+        storage.save()
+        storage.close()
+
+
+def percentile(samples, pct):
+    """Returns the `pct` percentile of a sorted list of samples."""
+    index = min(len(samples) - 1, int(len(samples) * pct / 100))
+    return samples[index]
+
+
+def measure(rows, lookups, cold):
+    """
+    Times `lookups` random `get` calls against the first `rows` users.
+    When `cold` is True the session is removed before every lookup so each
+    call goes to the database instead of the identity map.
+    """
+    ids = [bench_id(random.randrange(rows)) for _ in range(lookups)]
+    # The identity map holds weak references, keep the warmed objects alive
+    warmed = [] if cold else [storage.get(User, obj_id) for obj_id in ids]
+    samples = []
+    for obj_id in ids:
+        if cold:
+            storage.close()
+        start = time.perf_counter()
+        obj = storage.get(User, obj_id)
+        samples.append(time.perf_counter() - start)
+        assert obj is not None
+    del warmed
+    storage.close()
+    samples.sort()
+    return {
+        "mean": sum(samples) / len(samples) * 1e6,
+        "p50": percentile(samples, 50) * 1e6,
+        "p99": percentile(samples, 99) * 1e6,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--rows", type=int, nargs="+",
+                        default=[10000, 100000, 1000000])
+    parser.add_argument("--lookups", type=int, default=1000)
+    args = parser.parse_args()
+
+    print("{:>10} {:>6} {:>10} {:>10} {:>10}".format(
+        "rows", "mode", "mean(us)", "p50(us)", "p99(us)"))
+    for rows in sorted(args.rows):
+        seed(rows)
+        for cold in (True, False):
+            stats = measure(rows, args.lookups, cold)
+            print("{:>10} {:>6} {:>10.1f} {:>10.1f} {:>10.1f}".format(
+                rows, "cold" if cold else "warm",
+                stats["mean"], stats["p50"], stats["p99"]))
+
+
+if __name__ == "__main__":
+    main()
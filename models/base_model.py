@@ -10,8 +10,13 @@ from __init__ import app
 from datetime import datetime
 from flask_sqlalchemy import SQLAlchemy
 from sqlalchemy.orm import declarative_base
+from sqlalchemy.dialects import mysql
 from api.v1 import db  # type: ignore
+from models.engine.serializer import schema_for  # type: ignore
 
+# Timestamps keep their microseconds on MySQL, they are used for cursors
+# and HTTP validators
+DATETIME = db.DateTime().with_variant(mysql.DATETIME(fsp=6), 'mysql')
 
 
 class BaseModel:
@@ -22,21 +27,28 @@ class BaseModel:
     and deleting records.
     '''
     # Common attributes for all models: id, created_at, and updated_at
+    # Set by the server only, like every column marked `readonly`
+    # (see `read_only` in models/engine/serializer.py)
     id = db.Column(
         db.String(60),
         primary_key=True,
         nullable=False,
-        unique=True
+        unique=True,
+        info={'readonly': True}
         )
     created_at = db.Column(
-        db.DateTime(),
+        DATETIME,
         nullable=False,
-        default=datetime.utcnow()
+        default=datetime.utcnow,
+        index=True,
+        info={'readonly': True}
         )
     updated_at = db.Column(
-        db.DateTime(),
+        DATETIME,
         nullable=False,
-        default=datetime.utcnow()
+        default=datetime.utcnow,
+        index=True,
+        info={'readonly': True}
         )
 
     def __init__(self, *args, **kwargs):
@@ -99,20 +111,14 @@ class BaseModel:
         '''
         Converts the instance into a dictionary format, including the class name 
         and ISO-formatted timestamps for serialization purposes.
+        Only the loaded columns are serialized, relationships are left out;
+        the work is done by the schema of the class (see
+        models/engine/serializer.py).
         
         Returns:
             dict: A dictionary containing the instance's attributes and class name.
         '''
-        instance_dict = self.__dict__.copy()
-        instance_dict["__class__"] = self.__class__.__name__
-        if "created_at" in instance_dict:
-            instance_dict["created_at"] = self.created_at.isoformat()
-        if "updated_at" in instance_dict:
-            instance_dict["updated_at"] = self.updated_at.isoformat()
-
-        if "_sa_instance_state" in instance_dict.keys():
-            del instance_dict["_sa_instance_state"]
-        return instance_dict
+        return schema_for(type(self)).dump(self)
 
     def delete(self):
         """
@@ -8,6 +8,9 @@ class Category(BaseModel, db.Model):
     """Category Class"""
     __tablename__ = 'categories'
     name = db.Column(db.String(128), unique=True, nullable=False)
+    # Maintained by models/engine/counters.py
+    post_count = db.Column(db.Integer, nullable=False, default=0,
+                            server_default='0', info={'readonly': True})
 
     posts = relationship(
         "Post",
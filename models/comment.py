@@ -6,6 +6,10 @@ from sqlalchemy.orm import relationship
 class Comment(BaseModel, db.Model):
     """Comment Class"""
     __tablename__ = 'comments'
+    __table_args__ = (
+        # Serves the keyset-paginated comment list of a post
+        db.Index('ix_comments_post_id_created_at', 'post_id', 'created_at', 'id'),
+    )
     post_id = db.Column(db.String(60), db.ForeignKey('posts.id'))
     user_id = db.Column(db.String(60), db.ForeignKey('users.id'))
     content = db.Column(db.Text(512), nullable=False)
@@ -0,0 +1,502 @@
+#!/usr/bin/python3
+"""
+Read-through object cache used by DBStorage.
+
+Objects are cached as the values of their columns, keyed by class and id,
+and rebuilt into the current session on a hit. Pages of small list queries
+are cached as lists of ids under a per-class generation token, so a write
+to any object of a class invalidates every cached page of that class.
+
+A reader may load a row just before another worker commits a write to it
+and drops its entry; storing what it read afterwards would serve the old
+state until the entry expires. Every commit therefore replaces a global
+write generation before dropping its entries, and a session only stores
+what it read if the generation is still the one recorded when its
+transaction began (see `ObjectCache.begin`), checked again once stored.
+
+Two backends are available: an in-process LRU with a TTL and a size limit,
+and a client for the memcached text protocol, see `cache_from_env`. Only
+memcached is shared by the workers: the invalidations of an LRU do not
+reach the other processes, so it only suits single-process deployments,
+tests and tools. The cache is off unless WordFlow_CACHE enables it.
+"""
+import hashlib
+import json
+import socket
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from os import getenv
+from uuid import uuid4
+from sqlalchemy.orm import make_transient_to_detached
+from sqlalchemy.orm.attributes import instance_state, set_committed_value
+
+# Replaced by every commit, see `ObjectCache.begin`
+WRITES_KEY = "gen:*"
+# Marks the datetimes encoded in memcached values, see `MemcachedCache`
+DATETIME_TAG = "$datetime"
+# Seconds a token revocation time stays cached, bounding how long a write
+# bypassing the storage goes unseen
+REVOCATION_TTL = 10
+
+
+class LRUCache:
+    """
+    In-process cache backend evicting the least recently used entries once
+    `maxsize` is reached. Entries expire `ttl` seconds after being set.
+    """
+
+    def __init__(self, maxsize=10000, ttl=60):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.__entries = OrderedDict()
+        self.__lock = threading.Lock()
+
+    def get(self, key):
+        """Returns the value stored under `key`, or None."""
+        with self.__lock:
+            entry = self.__entries.get(key)
+            if entry is None:
+                return None
+            value, expires = entry
+            if expires < time.monotonic():
+                del self.__entries[key]
+                return None
+            self.__entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        """
+        Stores `value` under `key` for `ttl` seconds (default `self.ttl`),
+        evicting the oldest entries.
+        """
+        with self.__lock:
+            self.__entries[key] = (value, time.monotonic()
+                                   + (self.ttl if ttl is None else ttl))
+            self.__entries.move_to_end(key)
+            while len(self.__entries) > self.maxsize:
+                self.__entries.popitem(last=False)
+
+    def delete(self, key):
+        """Removes the entry stored under `key`, if any."""
+        with self.__lock:
+            self.__entries.pop(key, None)
+
+    def clear(self):
+        """Removes every entry."""
+        with self.__lock:
+            self.__entries.clear()
+
+    def __len__(self):
+        return len(self.__entries)
+
+
+class MemcachedCache:
+    """
+    Shared cache backend speaking the memcached text protocol. Values are
+    encoded as JSON, datetimes as {DATETIME_TAG: ISO string}, so that what
+    is read from the network is never executed; tuples come back as
+    lists. Network errors, and values that cannot be encoded or decoded,
+    are treated as misses so that an unavailable cache server only costs
+    database queries.
+    """
+
+    def __init__(self, host='127.0.0.1', port=11211, ttl=60, timeout=0.5,
+                 prefix='wordflow:'):
+        self.host = host
+        self.port = port
+        self.ttl = ttl
+        self.timeout = timeout
+        self.prefix = prefix
+        self.__local = threading.local()
+
+    def get(self, key):
+        """Returns the value stored under `key`, or None."""
+        data = self.__call(b"get " + self.__key(key) + b"\r\n",
+                           self.__read_value)
+        if data is None:
+            return None
+        try:
+            return json.loads(data, object_hook=self.__decode)
+        except ValueError:
+            return None
+
+    def set(self, key, value, ttl=None):
+        """Stores `value` under `key` for `ttl` seconds (default `self.ttl`)."""
+        try:
+            data = json.dumps(value, default=self.__encode,
+                              separators=(',', ':')).encode()
+        except (TypeError, ValueError):
+            self.delete(key)
+            return
+        command = b"set %s 0 %d %d\r\n" % (
+            self.__key(key), self.ttl if ttl is None else ttl, len(data))
+        self.__call(command + data + b"\r\n", self.__read_line)
+
+    def delete(self, key):
+        """Removes the entry stored under `key`, if any."""
+        self.__call(b"delete " + self.__key(key) + b"\r\n", self.__read_line)
+
+    def clear(self):
+        """Removes every entry of the server."""
+        self.__call(b"flush_all\r\n", self.__read_line)
+
+    @staticmethod
+    def __encode(value):
+        """Encodes the values JSON lacks, datetimes."""
+        if isinstance(value, datetime):
+            return {DATETIME_TAG: value.isoformat()}
+        raise TypeError("Cannot cache {}".format(type(value).__name__))
+
+    @staticmethod
+    def __decode(obj):
+        """Decodes the datetimes encoded by `__encode`."""
+        if len(obj) == 1 and DATETIME_TAG in obj:
+            return datetime.fromisoformat(obj[DATETIME_TAG])
+        return obj
+
+    def __key(self, key):
+        """Memcached keys are limited to 250 bytes without whitespace."""
+        key = (self.prefix + key).encode()
+        if len(key) > 200 or any(c <= 32 for c in key):
+            key = self.prefix.encode() + hashlib.sha1(key).hexdigest().encode()
+        return key
+
+    @staticmethod
+    def __read_line(reader):
+        """Reads a one-line reply such as STORED or DELETED."""
+        line = reader.readline()
+        if not line.endswith(b"\r\n"):
+            raise OSError("Connection closed by the cache server")
+        return line
+
+    @classmethod
+    def __read_value(cls, reader):
+        """Reads the reply of a get: at most one VALUE block, then END."""
+        line = cls.__read_line(reader)
+        if line == b"END\r\n":
+            return None
+        if not line.startswith(b"VALUE "):
+            raise OSError("Unexpected reply from the cache server")
+        length = int(line.split()[3])
+        data = reader.read(length + 2)[:length]
+        if cls.__read_line(reader) != b"END\r\n":
+            raise OSError("Unexpected reply from the cache server")
+        return data
+
+    def __call(self, command, read_reply):
+        """
+        Sends a command and parses its reply with `read_reply`, returning
+        None if the server cannot be reached.
+        """
+        try:
+            reader = getattr(self.__local, 'reader', None)
+            if reader is None:
+                conn = socket.create_connection((self.host, self.port),
+                                                self.timeout)
+                self.__local.conn = conn
+                self.__local.reader = reader = conn.makefile('rb')
+            self.__local.conn.sendall(command)
+            return read_reply(reader)
+        except (OSError, ValueError, IndexError):
+            conn = getattr(self.__local, 'conn', None)
+            if conn is not None:
+                conn.close()
+            self.__local.conn = self.__local.reader = None
+            return None
+
+
+class ObjectCache:
+    """
+    Caches the column values of model objects and the ids of list pages on
+    top of a backend, and counts hits and misses.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.__lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def begin(self, session):
+        """
+        Records the write generation when a transaction of `session`
+        begins, before its first read.
+        """
+        generation = self.backend.get(WRITES_KEY)
+        if generation is None:
+            generation = uuid4().hex
+            self.backend.set(WRITES_KEY, generation)
+        session.info['wordflow_generation'] = generation
+
+    def load(self, session, cls, id):
+        """
+        Returns the object of class `cls` with `id` from the session
+        identity map, or from the cache attached to the session, or None.
+        """
+        obj = session.identity_map.get(session.identity_key(cls, id))
+        if obj is not None:
+            return obj
+        values = self.backend.get(self.object_key(cls, id))
+        self.__count(values is not None)
+        if values is None:
+            return None
+        return self.__attach(session, cls, values)
+
+    def store(self, session, obj):
+        """
+        Caches the column values of `obj`, provided they are fully loaded
+        and match what is committed in the database.
+        """
+        if not self.cacheable(session, obj):
+            return
+        mapper = obj.__mapper__
+        values = {attr.key: obj.__dict__[attr.key]
+                  for attr in mapper.column_attrs}
+        self.__set(session, self.object_key(type(obj), obj.id), values)
+
+    def load_page(self, session, cls, key, query_ids):
+        """
+        Returns a cached page as (objects, next cursor), or None on a miss.
+        `query_ids` loads the objects whose state is not cached, in one
+        query, from a list of ids.
+        """
+        page = self.backend.get(self.page_key(cls, key))
+        self.__count(page is not None)
+        if page is None:
+            return None
+        ids, next_cursor = page
+        objs = {}
+        missing = []
+        for id in ids:
+            obj = self.load(session, cls, id)
+            if obj is None:
+                missing.append(id)
+            else:
+                objs[id] = obj
+        if missing:
+            for obj in query_ids(missing):
+                objs[obj.id] = obj
+                self.store(session, obj)
+        if len(objs) != len(ids):
+            return None
+        return [objs[id] for id in ids], next_cursor
+
+    def store_page(self, session, cls, key, objs, next_cursor):
+        """Caches a page of objects as their ids and the next cursor."""
+        if not self.shareable(session):
+            return
+        for obj in objs:
+            self.store(session, obj)
+        self.__set(session, self.page_key(cls, key),
+                   ([obj.id for obj in objs], next_cursor))
+
+    def load_name(self, cls, name):
+        """Returns the cached id of the object of `cls` named `name`."""
+        id = self.backend.get(self.name_key(cls, name))
+        self.__count(id is not None)
+        return id
+
+    def store_name(self, session, obj):
+        """Caches `obj` and its id under its name, if it is committed."""
+        if self.cacheable(session, obj):
+            self.store(session, obj)
+            self.__set(session, self.name_key(type(obj), obj.name), obj.id)
+
+    def load_revocation(self, user_id):
+        """
+        Returns the cached (exists, revocation time) of a user, see
+        `DBStorage.tokens_revoked_at`, or None on a miss.
+        """
+        entry = self.backend.get(self.revocation_key(user_id))
+        self.__count(entry is not None)
+        if entry is None:
+            return None
+        exists, revoked_at = entry
+        return exists, (datetime.fromisoformat(revoked_at)
+                        if revoked_at is not None else None)
+
+    def store_revocation(self, session, user_id, exists, revoked_at):
+        """
+        Caches the (exists, revocation time) of a user read by `session`,
+        unless a write was committed since its transaction began.
+        """
+        if 'wordflow_generation' not in session.info:
+            return
+        self.__set(session, self.revocation_key(user_id),
+                   self.__revocation(exists, revoked_at), REVOCATION_TTL)
+
+    def write_revocation(self, user_id, exists, revoked_at):
+        """
+        Writes through the (exists, revocation time) of a user committed by
+        this worker, so that every worker sees it at once.
+        """
+        self.backend.set(self.revocation_key(user_id),
+                         self.__revocation(exists, revoked_at),
+                         REVOCATION_TTL)
+
+    def invalidate(self, objs):
+        """
+        Drops the cached state of `objs` and every cached page of their
+        classes.
+        """
+        ids = {}
+        for obj in objs:
+            ids.setdefault(type(obj), []).append(obj.id)
+        # First, so that a reader storing an older state afterwards sees
+        # the new generation and drops it again
+        self.backend.delete(WRITES_KEY)
+        for cls in ids:
+            self.invalidate_ids(cls, ids[cls])
+
+    def invalidate_ids(self, cls, ids):
+        """
+        Drops the cached state of the objects of `cls` with `ids` and every
+        cached page of `cls`.
+        """
+        self.backend.delete(WRITES_KEY)
+        for id in ids:
+            self.backend.delete(self.object_key(cls, id))
+        self.invalidate_class(cls)
+
+    def invalidate_class(self, cls):
+        """Drops every cached page of `cls`."""
+        self.backend.delete("gen:" + cls.__name__)
+        with self.__lock:
+            self.invalidations += 1
+
+    def cacheable(self, session, obj):
+        """
+        Tells if the loaded state of `obj` can be shared: every column is
+        loaded, nothing is modified and the session has no flushed but
+        uncommitted changes.
+        """
+        state = instance_state(obj)
+        if not state.persistent or state.modified:
+            return False
+        if not self.shareable(session):
+            return False
+        return not (state.unloaded & set(obj.__mapper__.column_attrs.keys()))
+
+    def shareable(self, session):
+        """
+        Tells if what `session` reads can be cached: its transaction began
+        with the cache on, it has no flushed but uncommitted changes, and
+        has not read from a replica that may lag behind a recent write (see
+        models/engine/replicas.py).
+        """
+        return ('wordflow_generation' in session.info
+                and not (session.info.get('wordflow_flushed')
+                         or session.info.get('wordflow_stale')))
+
+    def object_key(self, cls, id):
+        """Returns the cache key of an object."""
+        return "obj:{}:{}".format(cls.__name__, id)
+
+    def name_key(self, cls, name):
+        """Returns the cache key of the id of a named object."""
+        return "name:{}:{}".format(cls.__name__, name)
+
+    def revocation_key(self, user_id):
+        """Returns the cache key of the revocation time of a user."""
+        return "revoked:{}".format(user_id)
+
+    def page_key(self, cls, key):
+        """Returns the cache key of a page under the class generation."""
+        generation = self.backend.get("gen:" + cls.__name__)
+        if generation is None:
+            generation = uuid4().hex
+            self.backend.set("gen:" + cls.__name__, generation)
+        return "page:{}:{}:{}".format(cls.__name__, generation, key)
+
+    def stats(self):
+        """
+        Returns the hit and miss counters of the cache.
+
+        Returns:
+            dict: The backend name, hits, misses, hit ratio and
+                  invalidations, plus the size of in-process backends.
+        """
+        with self.__lock:
+            hits, misses = self.hits, self.misses
+            invalidations = self.invalidations
+        stats = {
+            'backend': type(self.backend).__name__,
+            'hits': hits,
+            'misses': misses,
+            'hit_ratio': hits / (hits + misses) if hits + misses else 0.0,
+            'invalidations': invalidations,
+        }
+        if hasattr(self.backend, '__len__'):
+            stats['size'] = len(self.backend)
+        return stats
+
+    def __count(self, hit):
+        with self.__lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    @staticmethod
+    def __revocation(exists, revoked_at):
+        """Returns the cached form of a revocation time."""
+        return [exists, revoked_at.isoformat() if revoked_at else None]
+
+    def __set(self, session, key, value, ttl=None):
+        """
+        Stores `value` under `key` unless a write was committed since the
+        transaction of `session` began. The generation is checked once the
+        value is set: a commit replacing it in between has dropped its
+        entries before the value was set, so the value is dropped again.
+        """
+        generation = session.info.get('wordflow_generation')
+        if generation is None or self.backend.get(WRITES_KEY) != generation:
+            return
+        self.backend.set(key, value, ttl)
+        if self.backend.get(WRITES_KEY) != generation:
+            self.backend.delete(key)
+
+    def __attach(self, session, cls, values):
+        """Rebuilds a persistent object of `cls` from its column values."""
+        obj = cls.__mapper__.class_manager.new_instance()
+        for key, value in values.items():
+            set_committed_value(obj, key, value)
+        make_transient_to_detached(obj)
+        session.add(obj)
+        return obj
+
+
+def cache_from_env():
+    """
+    Builds the object cache from the environment.
+
+    Environment:
+        WordFlow_CACHE: `none` (default), `memcached`, or `lru` for a
+            single process.
+        WordFlow_CACHE_TTL: Seconds an entry stays valid (default 60).
+        WordFlow_CACHE_SIZE: Entries kept by the LRU (default 10000).
+        WordFlow_CACHE_SERVER: host:port of the memcached server
+            (default 127.0.0.1:11211).
+
+    Returns:
+        ObjectCache: The cache, or None when caching is disabled.
+
+    Raises:
+        ValueError: If WordFlow_CACHE names an unknown backend.
+    """
+    backend = getenv('WordFlow_CACHE', 'none').lower()
+    if backend == 'none':
+        return None
+    ttl = int(getenv('WordFlow_CACHE_TTL', '60'))
+    if backend == 'lru':
+        return ObjectCache(LRUCache(
+            int(getenv('WordFlow_CACHE_SIZE', '10000')), ttl))
+    if backend != 'memcached':
+        raise ValueError("Unknown cache backend: {}".format(backend))
+    server = getenv('WordFlow_CACHE_SERVER', '127.0.0.1:11211')
+    host, _, port = server.partition(':')
+    return ObjectCache(MemcachedCache(host, int(port or 11211), ttl))
+
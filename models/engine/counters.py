@@ -0,0 +1,186 @@
+#!/usr/bin/python3
+"""
+Denormalized counters: the number of comments of a post, the number of
+posts of a user, a category or a tag, and the number of followers of a
+user, kept in a column of the counted object so that `to_dict` serves
+them without a query.
+
+Counters are changed in the transaction of the write they follow, by
+relative updates (`SET n = n + :delta`), so concurrent writers do not
+overwrite each other:
+- rows written through the session are counted after each flush, from the
+  new and deleted objects, their changed foreign keys and the history of
+  the many-to-many collections of posts;
+- rows written on the tables directly (`DBStorage.link`, `unlink`,
+  `bulk_insert`) are counted by the storage with `inserted` and
+  `deleting`.
+
+Links added through the `posts` collection of a category or a tag are not
+counted, and the rows of deleted users or posts are not recounted. The
+drift they leave is fixed by `reconcile`, see reconcile_counters.py.
+"""
+from collections import Counter
+from datetime import datetime
+from itertools import chain
+from sqlalchemy import bindparam, func, inspect, select, update
+from sqlalchemy.orm.attributes import set_committed_value
+from models.base_model import db  # type: ignore
+from models.user import User  # type: ignore
+from models.post import Post  # type: ignore
+from models.category import Category  # type: ignore
+from models.tag import Tag  # type: ignore
+
+
+# Counter columns: (counted table, referencing column, class, counter)
+COUNTERS = (
+    ('comments', 'post_id', Post, 'comment_count'),
+    ('posts', 'user_id', User, 'post_count'),
+    ('post_categories', 'category_id', Category, 'post_count'),
+    ('post_tags', 'tag_id', Tag, 'post_count'),
+    # The target ids of category and tag follows match no user
+    ('follows', 'target_id', User, 'follower_count'),
+)
+
+
+def counters_of(table):
+    """Returns the counters of the rows of `table`, by referencing column."""
+    return [(column, cls, counter)
+            for name, column, cls, counter in COUNTERS if name == table.name]
+
+
+def original(obj, key):
+    """Returns the value of attribute `key` of `obj` before the flush."""
+    history = inspect(obj).attrs[key].history
+    if history.deleted:
+        return history.deleted[0]
+    if history.unchanged:
+        return history.unchanged[0]
+    return None
+
+
+def flushed(session):
+    """
+    Returns the counter changes of the objects written by the flush that
+    just ended: {(class, counter, id): delta}.
+    """
+    deltas = Counter()
+    for obj in session.new:
+        for column, cls, counter in counters_of(type(obj).__table__):
+            deltas[cls, counter, getattr(obj, column)] += 1
+    for obj in session.deleted:
+        for column, cls, counter in counters_of(type(obj).__table__):
+            deltas[cls, counter, original(obj, column)] -= 1
+    for obj in session.dirty:
+        for column, cls, counter in counters_of(type(obj).__table__):
+            history = inspect(obj).attrs[column].history
+            if history.has_changes():
+                for value in history.deleted:
+                    deltas[cls, counter, value] -= 1
+                for value in history.added:
+                    deltas[cls, counter, value] += 1
+    for obj in chain(session.new, session.dirty):
+        for relation in inspect(type(obj)).relationships:
+            if relation.secondary is None:
+                continue
+            remote = relation.secondary_synchronize_pairs[0][1]
+            for column, cls, counter in counters_of(relation.secondary):
+                if column != remote.name:
+                    continue
+                history = inspect(obj).attrs[relation.key].history
+                for other in history.added:
+                    deltas[cls, counter, other.id] += 1
+                for other in history.deleted:
+                    deltas[cls, counter, other.id] -= 1
+    return deltas
+
+
+def inserted(table, rows):
+    """
+    Returns the counter changes of `rows` inserted in `table`.
+    """
+    deltas = Counter()
+    for column, cls, counter in counters_of(table):
+        for row in rows:
+            deltas[cls, counter, row.get(column)] += 1
+    return deltas
+
+
+def deleting(session, table, *criteria):
+    """
+    Returns the counter changes of the rows of `table` matching `criteria`,
+    before they are deleted.
+    """
+    deltas = Counter()
+    for column, cls, counter in counters_of(table):
+        query = select(table.c[column], func.count()).where(
+            *criteria).group_by(table.c[column])
+        for id, count in session.execute(query):
+            deltas[cls, counter, id] -= count
+    return deltas
+
+
+def apply(session, deltas):
+    """
+    Writes counter changes with one relative UPDATE per counter, which also
+    sets `updated_at` so that cached copies of the objects are refreshed.
+    The objects already loaded by the session are updated in place.
+
+    Returns:
+        set: The (class, id) of the objects whose counters changed.
+    """
+    changes = {}
+    for (cls, counter, id), delta in deltas.items():
+        if id is not None and delta:
+            changes.setdefault((cls, counter), []).append((id, delta))
+    now = datetime.utcnow()
+    touched = set()
+    for (cls, counter), rows in changes.items():
+        table = cls.__table__
+        column = table.c[counter]
+        session.connection().execute(
+            update(table).where(table.c.id == bindparam('_id')).values(
+                {counter: column + bindparam('_delta'), 'updated_at': now}),
+            [{'_id': id, '_delta': delta} for id, delta in rows])
+        for id, delta in rows:
+            touched.add((cls, id))
+            obj = session.identity_map.get(session.identity_key(cls, id))
+            if obj is not None and counter in obj.__dict__:
+                set_committed_value(obj, counter, obj.__dict__[counter] + delta)
+                set_committed_value(obj, 'updated_at', now)
+    return touched
+
+
+def reconcile(session, batch_size=1000):
+    """
+    Recounts every counter from the counted rows and fixes the ones that
+    drifted, checking `batch_size` objects per query with one commit per
+    batch, so that rows are not locked for long.
+
+    Returns:
+        dict: The ids of the objects fixed, by class.
+    """
+    fixed = {}
+    for name, column, cls, counter in COUNTERS:
+        table = cls.__table__
+        counted = db.metadata.tables[name]
+        actual = select(func.count()).where(
+            counted.c[column] == table.c.id).scalar_subquery()
+        fixed.setdefault(cls, [])
+        last = None
+        while True:
+            query = select(table.c.id).order_by(table.c.id).limit(batch_size)
+            if last is not None:
+                query = query.where(table.c.id > last)
+            ids = session.execute(query).scalars().all()
+            if not ids:
+                break
+            last = ids[-1]
+            wrong = session.execute(select(table.c.id).where(
+                table.c.id.in_(ids), table.c[counter] != actual)).scalars().all()
+            if wrong:
+                session.execute(update(table).where(
+                    table.c.id.in_(wrong)).values(
+                    {counter: actual, 'updated_at': datetime.utcnow()}))
+            session.commit()
+            fixed[cls].extend(wrong)
+    return fixed
@@ -3,16 +3,28 @@
 Database storage model for the WordFlow application. This module defines 
 the DBStorage class, which handles interaction with the MySQL database using SQLAlchemy ORM.
 """
-from os import getenv
+import base64
+from datetime import datetime
+from itertools import islice
+from uuid import uuid4
 from sqlalchemy.orm import scoped_session
 from sqlalchemy.orm import sessionmaker
-from sqlalchemy import create_engine
+from sqlalchemy.orm import joinedload, load_only, selectinload
+from sqlalchemy import and_, delete, event, func, insert, inspect, literal
+from sqlalchemy import or_, select
 from models.base_model import db, BaseModel  # type: ignore
+from models.engine.cache import cache_from_env  # type: ignore
+from models.engine.search import search_from_env  # type: ignore
+from models.engine.feed import feed_from_env  # type: ignore
+from models.engine import counters  # type: ignore
+from models.engine.replicas import RoutingSession  # type: ignore
+from models.engine.replicas import replicas_from_env  # type: ignore
 from models.user import User  # type: ignore
 from models.post import Post  # type: ignore
 from models.comment import Comment  # type: ignore
 from models.category import Category  # type: ignore
 from models.tag import Tag  # type: ignore
+from models.follow import Follow  # type: ignore
 
 
 # Mapping of model names to their corresponding classes
@@ -21,9 +33,47 @@ classes = {
     "Post": Post,
     "Comment": Comment,
     "Category": Category,
-    "Tag": Tag
+    "Tag": Tag,
+    "Follow": Follow
 }
 
+# Named loading profiles: the relationships that can be loaded together
+# with the objects of a class, with a fixed number of queries per page
+# (one JOIN for many-to-one, one SELECT ... IN per collection)
+load_profiles = {
+    "Post": {
+        "author": joinedload(Post.author),
+        "comments": selectinload(Post.comments),
+        "categories": selectinload(Post.categories),
+        "tags": selectinload(Post.tags),
+    },
+    "Comment": {
+        "user": joinedload(Comment.user),
+        "post": joinedload(Comment.post),
+    },
+}
+
+
+def encode_cursor(created_at, id):
+    """
+    Encodes a (created_at, id) position into an opaque, URL-safe token.
+    """
+    raw = "{}|{}".format(created_at.isoformat(), id)
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor):
+    """
+    Decodes a token produced by `encode_cursor` back into its
+    (created_at, id) position. Raises ValueError on malformed tokens.
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode()).decode()
+        created_at, id = raw.split("|", 1)
+        return datetime.fromisoformat(created_at), id
+    except (TypeError, ValueError, UnicodeError) as e:
+        raise ValueError("Invalid cursor") from e
+
 
 class DBStorage:
     """
@@ -33,19 +83,38 @@ class DBStorage:
     """
     __engine = None
     __session = None
+    __cache = None
+    __search = None
+    __feed = None
+    __router = None
 
-    def __init__(self):
+    def __init__(self, replicas=None):
         """
-        Initializes the DBStorage object by setting up a connection to the 
-        MySQL database using environment variables for configuration. 
-        If the environment variables are not provided, default values are used.
+        Initializes the DBStorage object with the engine of the Flask-SQLAlchemy
+        extension, so that the application holds a single connection pool.
+        The connection and pool settings come from the WordFlow_MYSQL_*
+        environment variables read in `api.v1`, the object cache settings
+        from the WordFlow_CACHE_* ones (see models/engine/cache.py), the
+        search backend from the WordFlow_SEARCH_* ones (see
+        models/engine/search.py) and the feed settings from the
+        WordFlow_FEED_* ones (see models/engine/feed.py).
+        Reads are sent to the replicas given, or to those of the
+        WordFlow_REPLICA_* variables (see models/engine/replicas.py).
+
+        Args:
+            replicas: Database URLs of read replicas of the primary
+                      (optional).
         """
-        USER = getenv('WordFlow_MYSQL_USER', 'wordflow_dev')
-        PWD = getenv('WordFlow_MYSQL_PWD', 'wordflow_dev_pwd')
-        HOST = 'localhost'
-        DB = getenv('WordFlow_MYSQL_DB', 'WordFlow')
-        self.__engine = create_engine('mysql+mysqldb://{}:{}@{}/{}'.
-                                      format(USER, PWD, HOST, DB))
+        from api.v1 import app  # type: ignore
+        if not hasattr(app, 'app_context'):
+            # Once imported, the `api.v1.app` module hides the Flask app
+            app = app.app
+        with app.app_context():
+            self.__engine = db.engine
+        self.__cache = cache_from_env()
+        self.__search = search_from_env(self.__engine)
+        self.__feed = feed_from_env()
+        self.__router = replicas_from_env(replicas)
 
     def all(self, cls=None):
         """
@@ -68,6 +137,122 @@ class DBStorage:
                     new_dict[key] = obj
         return (new_dict)
 
+    def paginate(self, cls, limit, after=None, expand=(), fields=None,
+                 **filters):
+        """
+        Returns one page of objects of a class ordered by (created_at, id),
+        using keyset pagination: the page starts right after the position
+        encoded in `after`, so deep pages cost the same as the first one.
+
+        Args:
+            cls: The class (or class name) of the objects to list.
+            limit: The maximum number of objects in the page.
+            after: The cursor returned with the previous page (optional).
+            expand: Names of loading profiles of `cls` to apply (optional).
+            fields: Names of the columns to read, all of them when None
+                    (optional). Pages served by the cache hold whole
+                    objects.
+            **filters: Column equality filters, e.g. post_id=<id>, or
+                       many-to-many membership, e.g. tags=<tag id>
+                       (optional).
+
+        Returns:
+            tuple: The list of objects and the cursor of the next page, or
+                   None if this is the last page.
+
+        Raises:
+            ValueError: If `after` is not a valid cursor, a profile in
+                        `expand` or a field does not exist.
+        """
+        cls = self.__resolve(cls)
+        if cls is None:
+            return [], None
+        options = (self.__load_options(cls, expand)
+                   + self.__projection(cls, fields))
+        cache = self.__cache if not expand else None
+        if cache is not None:
+            session = self.__session()
+            page_key = repr((limit, after, sorted(filters.items())))
+            page = cache.load_page(
+                session, cls, page_key,
+                lambda ids: session.query(cls).options(*options).filter(
+                    cls.id.in_(ids)).all())
+            if page is not None:
+                return page
+        criteria, order_created_at, order_id = self.__ordering(cls, filters)
+        query = self.__session.query(cls, order_created_at).filter(*criteria)
+        query = query.options(*options)
+        if after:
+            created_at, id = decode_cursor(after)
+            query = query.filter(or_(
+                order_created_at > created_at,
+                and_(order_created_at == created_at, order_id > id)))
+        rows = query.order_by(order_created_at, order_id).limit(
+            limit + 1).all()
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            # The stored timestamp is taken from the row itself, objects
+            # from the identity map may hold a more precise value
+            last, created_at = rows[-1]
+            next_cursor = encode_cursor(created_at, last.id)
+        objs = [obj for obj, _ in rows]
+        if cache is not None:
+            cache.store_page(session, cls, page_key, objs, next_cursor)
+        return objs, next_cursor
+
+    def stream(self, cls, batch_size=1000, **filters):
+        """
+        Yields all objects of a class, ordered by (created_at, id), in
+        batches read from a server-side cursor, so that only one batch of
+        rows is held in memory at a time.
+
+        Args:
+            cls: The class (or class name) of the objects to read.
+            batch_size: The number of rows fetched per batch (optional).
+            **filters: Column equality filters, e.g. post_id=<id>, or
+                       many-to-many membership, e.g. tags=<tag id>
+                       (optional).
+
+        Yields:
+            list: The objects of the next batch.
+        """
+        cls = self.__resolve(cls)
+        if cls is None:
+            return
+        criteria, created_at, id = self.__ordering(cls, filters)
+        query = select(cls).where(*criteria).order_by(created_at, id)
+        result = self.__session.execute(
+            query, execution_options={'yield_per': batch_size})
+        for batch in result.scalars().partitions():
+            yield batch
+
+    def stream_rows(self, cls, columns, batch_size=1000, **filters):
+        """
+        Like `stream`, but yields batches of plain rows holding the values
+        of `columns` instead of objects, so no ORM instance is built. Rows
+        bypass the identity map and the object cache.
+
+        Args:
+            cls: The class (or class name) of the objects to read.
+            columns: The columns to read, e.g. `Schema.columns()`.
+            batch_size: The number of rows fetched per batch (optional).
+            **filters: Column equality or many-to-many membership filters
+                       (optional).
+
+        Yields:
+            list: Rows of column values, ordered by (created_at, id).
+        """
+        cls = self.__resolve(cls)
+        if cls is None:
+            return
+        criteria, created_at, id = self.__ordering(cls, filters)
+        query = select(*columns).where(*criteria).order_by(created_at, id)
+        result = self.__session.execute(
+            query, execution_options={'yield_per': batch_size})
+        for batch in result.partitions():
+            yield batch
+
     def new(self, obj):
         """
         Adds a new object to the current database session, marking it for 
@@ -96,19 +281,177 @@ class DBStorage:
         if obj is not None:
             self.__session.delete(obj)
 
+    def bulk_insert(self, target, rows, chunk_size=1000):
+        """
+        Inserts rows given as dicts without building ORM objects, with one
+        multi-row INSERT (executemany) and one commit per chunk. Model rows
+        get an id and timestamps when they lack them.
+        Rows bypass the session, so the cached pages of the classes
+        involved are dropped once the rows are written, and the counters
+        of the objects they reference are updated with each chunk.
+        Association rows lacking the created_at copied from their post get
+        it with one query per chunk.
+
+        Args:
+            target: A class, a class name, or the name of an association
+                    table such as `post_categories` or `post_tags`.
+            rows: An iterable of dicts of column values, read lazily.
+            chunk_size: The number of rows per INSERT (optional).
+
+        Returns:
+            int: The number of rows inserted.
+
+        Raises:
+            ValueError: If `target` is neither a storage class nor a table.
+        """
+        cls = self.__resolve(target)
+        if cls is not None:
+            table = cls.__table__
+        else:
+            table = db.metadata.tables.get(target)
+            if table is None:
+                raise ValueError("Unknown table: {}".format(target))
+        rows = iter(rows)
+        statement = insert(table)
+        inserted = 0
+        while True:
+            chunk = list(islice(rows, chunk_size))
+            if not chunk:
+                break
+            if cls is not None:
+                now = datetime.utcnow()
+                chunk = [{'id': str(uuid4()), 'created_at': now,
+                          'updated_at': now, **row} for row in chunk]
+            session = self.__session()
+            if cls is None and 'created_at' in table.c:
+                chunk = self.__copy_created_at(session, table, chunk)
+            session.execute(statement, chunk)
+            self.__count(session, counters.inserted(table, chunk))
+            session.commit()
+            inserted += len(chunk)
+            if cls is Post and self.__search.ready:
+                for row in chunk:
+                    self.__search.add(row['id'], row.get('title'),
+                                      row.get('content'))
+        if self.__cache is not None and inserted:
+            # Association rows change the collections of both sides
+            tables = {table} if cls is not None else {
+                fk.column.table for fk in table.foreign_keys}
+            for clss in classes.values():
+                if clss.__table__ in tables:
+                    self.__cache.invalidate_class(clss)
+        return inserted
+
     def reload(self):
         from models.base_model import db  # type: ignore
         """
         Reloads the database by creating all defined tables and establishing 
         a new session. This method is typically called when initializing or 
         resetting the database state.
+        The session registry also replaces `db.session`, so `Model.query`
+        and the storage share one identity map per thread.
         """
         db.metadata.create_all(self.__engine)
+        routing = {}
+        if self.__router is not None:
+            routing = {'class_': RoutingSession,
+                       'info': {'wordflow_router': self.__router}}
         sess_factory = db.sessionmaker(
             bind=self.__engine,
-            expire_on_commit=False)
+            expire_on_commit=False,
+            **routing)
+        event.listen(sess_factory, 'before_flush', self.__touch_modified)
+        event.listen(sess_factory, 'before_flush', self.__count_deleted)
+        event.listen(sess_factory, 'after_flush', self.__track_changes)
+        event.listen(sess_factory, 'after_flush', self.__count_flushed)
+        event.listen(sess_factory, 'after_begin', self.__begin)
+        event.listen(sess_factory, 'after_commit', self.__apply_changes)
+        event.listen(sess_factory, 'after_soft_rollback',
+                     self.__forget_changes)
         Session = db.scoped_session(sess_factory)
         self.__session = Session
+        db.session = Session
+        self.__search.start(self.__indexed_posts)
+
+    def pool_stats(self):
+        """
+        Returns the health figures of the connection pool: size, checked out
+        connections, utilization and checkout wait times in seconds.
+        
+        Returns:
+            dict: The pool statistics, empty if the pool does not record them.
+        """
+        pool = self.__engine.pool
+        if hasattr(pool, 'stats'):
+            return pool.stats()
+        return {}
+
+    def cache_stats(self):
+        """
+        Returns the hit and miss counters of the object cache.
+
+        Returns:
+            dict: The cache statistics, empty if caching is disabled.
+        """
+        if self.__cache is None:
+            return {}
+        return self.__cache.stats()
+
+    def replica_stats(self):
+        """
+        Returns the health and read counts of the read replicas.
+
+        Returns:
+            dict: The statistics by replica, empty without replicas.
+        """
+        if self.__router is None:
+            return {}
+        return self.__router.stats()
+
+    def bind_client(self, last_write):
+        """
+        Starts serving a client on the current thread: for a few seconds
+        after it commits a write, its reads go to the primary instead of a
+        replica (see models/engine/replicas.py).
+
+        Args:
+            last_write: The time of the last write of the client, as
+                        returned by `last_write`, or None.
+        """
+        if self.__router is not None:
+            self.__router.bind_client(last_write)
+
+    def last_write(self):
+        """
+        Returns the time of the last write committed for the client of the
+        current thread, for the client to send back with its next requests,
+        or None if it did not write or there are no replicas.
+        """
+        if self.__router is None:
+            return None
+        return self.__router.written()
+
+    def stop_replicas(self):
+        """
+        Stops the health checks of the read replicas and closes their
+        connections; reads go to the primary from then on.
+        """
+        if self.__router is not None:
+            self.__router.stop()
+            self.__router = None
+
+    def use_cache(self, cache):
+        """
+        Replaces the object cache of the storage.
+
+        Args:
+            cache: An ObjectCache, or None to disable caching.
+
+        Returns:
+            The previous cache.
+        """
+        previous, self.__cache = self.__cache, cache
+        return previous
 
     def close(self):
         """
@@ -117,30 +460,344 @@ class DBStorage:
         """
         self.__session.remove()
 
-    def get(self, cls, id):
+    def get(self, cls, id, expand=(), fields=None):
         """
         Retrieves a specific object based on its class and ID.
+        The session identity map is checked first, then the object cache;
+        on a miss a single primary-key SELECT is issued, so the cost does
+        not depend on the number of rows stored. With `expand` the SELECT
+        is always issued, so the relationships of the profiles are loaded
+        even for an object already in the session.
         
         Args:
             cls: The class of the object to be retrieved.
             id: The ID of the object to be retrieved.
+            expand: Names of loading profiles of `cls` to apply (optional).
+            fields: Names of the columns to read on a miss, all of them
+                    when None (optional).
             
         Returns:
             The object if found, otherwise None.
+
+        Raises:
+            ValueError: If a profile in `expand` or a field does not exist.
         """
+        cls = self.__resolve(cls)
         if cls is None or id is None:
             return None
-        objects = self.all()
-        key = "{}.{}".format(cls.__name__, id)
-        if key in objects.keys():
-            return objects[key]
-        return None
+        options = (self.__load_options(cls, expand)
+                   + self.__projection(cls, fields))
+        if expand:
+            # Session.get would return an object of the identity map as it
+            # is, without running the loaders of the profiles
+            return self.__session.execute(
+                select(cls).options(*options).where(cls.id == id)
+            ).unique().scalars().first()
+        if self.__cache is None:
+            return self.__session.get(cls, id, options=options)
+        session = self.__session()
+        obj = self.__cache.load(session, cls, id)
+        if obj is None:
+            obj = session.get(cls, id, options=options)
+            if obj is not None:
+                self.__cache.store(session, obj)
+        return obj
+
+    def get_many(self, cls, ids, expand=(), fields=None):
+        """
+        Retrieves the objects of a class with the given IDs in a single
+        SELECT ... IN query.
+
+        Args:
+            cls: The class (or class name) of the objects.
+            ids: The IDs of the objects to retrieve.
+            expand: Names of loading profiles of `cls` to apply (optional).
+            fields: Names of the columns to read, all of them when None
+                    (optional).
+
+        Returns:
+            dict: A dictionary mapping the ID of each object found to it.
+
+        Raises:
+            ValueError: If a profile in `expand` or a field does not exist.
+        """
+        cls = self.__resolve(cls)
+        ids = {id for id in ids if id is not None}
+        if cls is None or not ids:
+            return {}
+        options = (self.__load_options(cls, expand)
+                   + self.__projection(cls, fields))
+        objs = self.__session.query(cls).options(*options).filter(
+            cls.id.in_(ids)).all()
+        return {obj.id: obj for obj in objs}
+
+    def search(self, query, limit, offset=0):
+        """
+        Ranks the posts whose title or content match `query`, best first.
+
+        Args:
+            query: The words to look for.
+            limit: The maximum number of posts returned.
+            offset: The number of better ranked posts to skip (optional).
+
+        Returns:
+            tuple: The list of (post, score) pairs of the page and the
+                   total number of matching posts.
+
+        Raises:
+            SearchUnavailable: If the in-memory index is still being built
+                               or the search ran out of time.
+        """
+        hits, total = self.__search.search(self.__session(), query, limit,
+                                           offset)
+        posts = self.get_many(Post, [id for id, _ in hits])
+        return [(posts[id], score) for id, score in hits if id in posts], total
+
+    def first(self, cls, **filters):
+        """
+        Returns the first object of a class matching column equality
+        filters, or None.
+        """
+        cls = self.__resolve(cls)
+        if cls is None:
+            return None
+        return self.__session.query(cls).filter_by(**filters).first()
+
+    def get_by_name(self, cls, name):
+        """
+        Retrieves an object of a class with a unique `name` column, such as
+        a tag or a category. The name to id map is kept in the object
+        cache, so repeated lookups are served without a query.
+
+        Args:
+            cls: The class (or class name) of the object.
+            name: The name of the object.
+
+        Returns:
+            The object if found, otherwise None.
+        """
+        cls = self.__resolve(cls)
+        if cls is None or name is None or 'name' not in inspect(cls).columns:
+            return None
+        cache = self.__cache
+        if cache is not None:
+            id = cache.load_name(cls, name)
+            if id is not None:
+                obj = self.get(cls, id)
+                # A renamed or deleted object leaves a stale entry behind
+                if obj is not None and obj.name == name:
+                    return obj
+        obj = self.__session.query(cls).filter_by(name=name).first()
+        if obj is not None and cache is not None:
+            cache.store_name(self.__session(), obj)
+        return obj
+
+    def link(self, obj, key, other):
+        """
+        Adds `other` to the many-to-many relationship `key` of `obj` with a
+        single INSERT ... SELECT into the association table, without loading
+        the collection: it skips an existing link and copies the created_at
+        of the post from the posts table. The change is written with the
+        next `save`.
+
+        Args:
+            obj: The object owning the relationship, e.g. a post.
+            key: The name of the relationship, e.g. 'tags'.
+            other: The object to add, e.g. a tag.
+
+        Returns:
+            bool: False if the objects were already linked.
+
+        Raises:
+            ValueError: If `key` is not a many-to-many relationship.
+        """
+        local, remote = self.__association(type(obj), key)
+        session = self.__session()
+        session.flush()
+        row = {local.name: obj.id, remote.name: other.id}
+        columns = [local, remote]
+        values = [literal(obj.id), literal(other.id)]
+        copy = local.table.c.get('created_at')
+        if copy is not None:
+            column = local.table.c[copy.info['copy_of']]
+            columns.append(copy)
+        else:
+            column = local
+        # The row of the object the link copies from, or of `obj`
+        source = next(iter(column.foreign_keys)).column
+        if copy is not None:
+            values.append(source.table.c.created_at)
+        linked = select(local).where(local == obj.id, remote == other.id)
+        rows = select(*values).where(source == row[column.name],
+                                     ~linked.exists())
+        if not session.execute(insert(local.table).from_select(
+                columns, rows)).rowcount:
+            return False
+        self.__count(session, counters.inserted(local.table, [row]))
+        self.__touch_links(session, obj, key, other)
+        return True
+
+    def unlink(self, obj, key, other=None):
+        """
+        Removes `other`, or every object when it is None, from the
+        many-to-many relationship `key` of `obj` with a single DELETE on
+        the association table. The change is written with the next `save`.
+
+        Returns:
+            int: The number of links removed.
+
+        Raises:
+            ValueError: If `key` is not a many-to-many relationship.
+        """
+        local, remote = self.__association(type(obj), key)
+        session = self.__session()
+        session.flush()
+        criteria = [local == obj.id]
+        if other is not None:
+            criteria.append(remote == other.id)
+        self.__count(session,
+                     counters.deleting(session, local.table, *criteria))
+        removed = session.execute(delete(local.table).where(
+            *criteria)).rowcount
+        if removed:
+            self.__touch_links(session, obj, key, other)
+        return removed
+
+    def feed(self, user_id, limit, after=None, fields=None):
+        """
+        Returns one page of the home feed of a user, newest posts first.
+
+        Args:
+            user_id: The ID of the reader.
+            limit: The maximum number of posts in the page.
+            after: The cursor returned with the previous page (optional).
+            fields: Names of the post columns to read, all of them when
+                    None (optional).
+
+        Returns:
+            tuple: The list of posts and the cursor of the next page, or
+                   None if this is the last page.
+
+        Raises:
+            ValueError: If `after` is not a valid cursor or a field does
+                        not exist.
+        """
+        before = decode_cursor(after) if after else None
+        entries = self.__feed.read(self.__session(), user_id, limit + 1,
+                                   before)
+        next_cursor = None
+        if len(entries) > limit:
+            entries = entries[:limit]
+            next_cursor = encode_cursor(entries[-1][1], entries[-1][0])
+        posts = self.get_many(Post, [id for id, _ in entries], fields=fields)
+        return [posts[id] for id, _ in entries if id in posts], next_cursor
+
+    def publish(self, post):
+        """
+        Updates the feeds with the publication state of `post`: pushes it
+        to its followers if it is published, removes it otherwise. The
+        change is written with the next `save`.
+        """
+        self.__feed.publish(self.__session(), post)
+
+    def retract(self, post):
+        """
+        Removes `post` from every feed, e.g. before deleting it. The change
+        is written with the next `save`.
+        """
+        self.__feed.retract(self.__session(), post.id)
+
+    def backfill_feed(self, follow):
+        """
+        Copies the latest posts of a newly followed source to the feed of
+        the follower. The change is written with the next `save`.
+        """
+        self.__feed.backfill(self.__session(), follow)
+
+    def rebuild_feed(self, user_id):
+        """
+        Refills the feed of a user from the sources they follow, e.g. to
+        repair it. The change is written with the next `save`.
+        """
+        self.__feed.rebuild(self.__session(), user_id)
+
+    def trim_feeds(self, batch_size=1000):
+        """
+        Trims the feeds holding more entries than the feed cap, committing
+        every `batch_size` feeds. Meant for a periodic job, see
+        trim_feeds.py.
+
+        Returns:
+            int: The number of feed entries removed.
+        """
+        return self.__feed.trim_all(self.__session(), batch_size)
+
+    def unfollow(self, follow):
+        """
+        Deletes `follow` and removes from the feed of the follower the posts
+        that only its source brought. The change is written with the next
+        `save`.
+        """
+        self.__feed.drop_target(self.__session(), follow.target_type,
+                                follow.target_id, follow.follower_id)
+        self.__session.delete(follow)
+
+    def remove_follows(self, user):
+        """
+        Prepares the deletion of `user`: removes their feed and the follows
+        they made, which updates the follower counts of the users they
+        followed, then the follows of their followers, along with the
+        posts only they brought to their followers' feeds. The change is
+        written with the next `save`.
+        """
+        self.unfollow_all(user)
+        session = self.__session()
+        self.__feed.clear(session, user.id)
+        follows = session.scalars(select(Follow).where(
+            Follow.follower_id == user.id))
+        for follow in follows.all():
+            session.delete(follow)
+        session.flush()
+
+    def unfollow_all(self, target):
+        """
+        Removes the follows of a user, category or tag being deleted, and
+        the posts that only it brought to the feeds of its followers. The
+        change is written with the next `save`.
+        """
+        session = self.__session()
+        target_type = type(target).__name__.lower()
+        self.__feed.drop_target(session, target_type, target.id)
+        follows = session.scalars(select(Follow).where(
+            Follow.target_type == target_type,
+            Follow.target_id == target.id))
+        for follow in follows.all():
+            session.delete(follow)
+
+    def reconcile_counters(self, batch_size=1000):
+        """
+        Recounts the denormalized counters (comment_count, post_count,
+        follower_count) from the counted rows and fixes the ones that
+        drifted, committing every `batch_size` objects. Meant for a periodic job, see
+        reconcile_counters.py.
+
+        Returns:
+            dict: The number of objects fixed, by class name.
+        """
+        fixed = counters.reconcile(self.__session(), batch_size)
+        if self.__cache is not None:
+            for cls, ids in fixed.items():
+                if ids:
+                    self.__cache.invalidate_ids(cls, ids)
+        return {cls.__name__: len(ids) for cls, ids in fixed.items()}
 
     def count(self, cls=None):
         """
         Counts the number of objects in the storage. If a class is provided,
         it returns the count of objects of that specific class. If no class is 
         provided, it returns the count of all objects across all classes.
+        The counting is done by the database with SELECT COUNT, no object
+        is loaded.
         
         Args:
             cls: The class to filter by (optional).
@@ -149,9 +806,57 @@ class DBStorage:
             int: The count of matching objects in the database.
         """
         if cls:
-            return len(self.all(cls))
-        return len(self.all())
-    
+            cls = self.__resolve(cls)
+            if cls is None:
+                return 0
+            return self.__session.query(func.count(cls.id)).scalar()
+        return sum(self.count(clss) for clss in classes.values())
+
+    def count_by(self, cls, key, ids=None):
+        """
+        Counts objects of a class grouped by one of its columns, or by the
+        other side of one of its many-to-many relationships, in a single
+        aggregate query.
+
+        Examples:
+            count_by(Comment, 'post_id')   -> comments per post
+            count_by(Post, 'user_id')      -> posts per user
+            count_by(Post, 'categories')   -> posts per category
+            count_by(Post, 'tags')         -> posts per tag
+
+        Args:
+            cls: The class (or class name) of the counted objects.
+            key: A column name of `cls` or the name of a many-to-many
+                 relationship of `cls`.
+            ids: Restricts the result to these group values (optional).
+                 Values without any row are reported with a count of 0.
+
+        Returns:
+            dict: A dictionary mapping each group value to its count.
+        """
+        cls = self.__resolve(cls)
+        if cls is None:
+            return {}
+        mapper = inspect(cls)
+        if key in mapper.relationships:
+            counted, group = self.__association(cls, key)
+        elif key in mapper.columns:
+            counted = mapper.columns['id']
+            group = mapper.columns[key]
+        else:
+            raise ValueError("{} has no attribute {}".format(
+                cls.__name__, key))
+        query = select(group, func.count(counted)).group_by(group)
+        if ids is not None:
+            ids = list(ids)
+            if not ids:
+                return {}
+            query = query.where(group.in_(ids))
+        counts = dict(self.__session.execute(query).all())
+        if ids is not None:
+            return {group_id: counts.get(group_id, 0) for group_id in ids}
+        return counts
+
     def get_user_by_email(self, cls, email):
         """
         Retrieves a user based on their email address.
@@ -169,3 +874,280 @@ class DBStorage:
             user = self.__session.query(User).filter_by(email=email).first()
             return user
         return None
+
+    def tokens_revoked_at(self, user_id):
+        """
+        Reads the time up to which the tokens of a user are revoked. With
+        the object cache on, the time is served from the cache: commits
+        write it through, so a revocation is seen at once by every worker,
+        and entries expire after a few seconds (see
+        `cache.REVOCATION_TTL`). On a miss, or without cache, it is read
+        with a single-column primary-key SELECT run on the primary. The
+        identity map is bypassed.
+
+        Args:
+            user_id: The ID of the user.
+
+        Returns:
+            tuple: Whether the user exists, and the revocation time or
+                   None.
+        """
+        cache = self.__cache
+        if cache is not None:
+            entry = cache.load_revocation(user_id)
+            if entry is not None:
+                return entry
+        session = self.__session()
+        query = select(User.tokens_revoked_at).where(
+            User.id == user_id).execution_options(wordflow_primary=True)
+        row = session.execute(query).first()
+        exists, revoked_at = row is not None, row[0] if row else None
+        if cache is not None:
+            cache.store_revocation(session, user_id, exists, revoked_at)
+        return exists, revoked_at
+
+    def __resolve(self, cls):
+        """
+        Returns the model class for `cls`, which may be a class or a class
+        name, or None if it is not one of the storage classes.
+        """
+        if isinstance(cls, str):
+            return classes.get(cls)
+        if cls in classes.values():
+            return cls
+        return None
+
+    def __criteria(self, cls, filters):
+        """
+        Returns the WHERE criteria of equality filters on columns of `cls`,
+        or of membership filters on its many-to-many relationships, which
+        read the association table only (see its indexes) instead of
+        loading a collection.
+        """
+        mapper = inspect(cls)
+        criteria = []
+        for key, value in filters.items():
+            if key in mapper.relationships:
+                local, remote = self.__association(cls, key)
+                criteria.append(cls.id.in_(
+                    select(local).where(remote == value)))
+            else:
+                criteria.append(getattr(cls, key) == value)
+        return criteria
+
+    def __ordering(self, cls, filters):
+        """
+        Returns the WHERE criteria of `filters` and the (created_at, id)
+        columns ordering the objects. A membership filter on an association
+        table keeping a copy of the created_at of `cls` (see
+        models/post.py) orders by the columns of the table instead, so that
+        a page is a slice of its index, whatever the size of the tag or
+        category.
+        """
+        mapper = inspect(cls)
+        for key, value in filters.items():
+            if key not in mapper.relationships:
+                continue
+            local, remote = self.__association(cls, key)
+            created_at = local.table.c.get('created_at')
+            if created_at is None or created_at.info['copy_of'] != local.name:
+                continue
+            others = {k: v for k, v in filters.items() if k != key}
+            criteria = [local == cls.id, remote == value]
+            return (criteria + self.__criteria(cls, others), created_at,
+                    local)
+        return self.__criteria(cls, filters), cls.created_at, cls.id
+
+    def __copy_created_at(self, session, table, rows):
+        """
+        Completes the association rows lacking the created_at of the object
+        they copy it from, with one query per chunk.
+        """
+        column = table.c[table.c.created_at.info['copy_of']]
+        missing = {row[column.name] for row in rows if 'created_at' not in row}
+        if not missing:
+            return rows
+        source = next(iter(column.foreign_keys)).column
+        created = dict(session.execute(
+            select(source, source.table.c.created_at).where(
+                source.in_(missing))).all())
+        return [row if 'created_at' in row else
+                {**row, 'created_at': created.get(row[column.name])}
+                for row in rows]
+
+    def __association(self, cls, key):
+        """
+        Returns the columns of the association table of the many-to-many
+        relationship `key` of `cls`: the one referencing `cls` and the one
+        referencing the related class.
+
+        Raises:
+            ValueError: If `key` is not a many-to-many relationship.
+        """
+        relation = inspect(cls).relationships.get(key)
+        if relation is None or relation.secondary is None:
+            raise ValueError(
+                "{} is not a many-to-many relationship".format(key))
+        return (relation.synchronize_pairs[0][1],
+                relation.secondary_synchronize_pairs[0][1])
+
+    def __touch_links(self, session, obj, key, other):
+        """
+        Marks `obj` as modified after a change of its links and expires the
+        collections that may hold the previous links.
+        """
+        obj.updated_at = datetime.utcnow()
+        session.expire(obj, [key])
+        back = inspect(type(obj)).relationships[key].back_populates
+        if other is not None and back:
+            session.expire(other, [back])
+
+    def __projection(self, cls, fields):
+        """
+        Returns the loader option reading only the columns named in
+        `fields`, plus the primary key and the timestamps used by cursors
+        and validators, or no option when `fields` is None. The other
+        columns are loaded on first access.
+
+        Raises:
+            ValueError: If a name is not a column of `cls`.
+        """
+        if fields is None:
+            return []
+        columns = inspect(cls).column_attrs
+        unknown = [name for name in fields if name not in columns]
+        if unknown:
+            raise ValueError("Unknown field: {}".format(", ".join(unknown)))
+        return [load_only(cls.created_at, cls.updated_at,
+                          *(getattr(cls, name) for name in fields))]
+
+    def __load_options(self, cls, expand):
+        """
+        Returns the loader options of the loading profiles named in
+        `expand`, raising ValueError for names `cls` does not define.
+        """
+        profiles = load_profiles.get(cls.__name__, {})
+        unknown = [name for name in expand if name not in profiles]
+        if unknown:
+            raise ValueError("Unknown expansion: {}".format(
+                ", ".join(unknown)))
+        return [profiles[name] for name in expand]
+
+    def __touch_modified(self, session, flush_context, instances):
+        """
+        Sets `updated_at` on every modified object before it is written,
+        including objects whose only change is in a collection.
+        """
+        now = datetime.utcnow()
+        for obj in session.dirty:
+            if isinstance(obj, BaseModel) and session.is_modified(obj):
+                obj.updated_at = now
+
+    def __track_changes(self, session, flush_context):
+        """
+        Remembers the objects written by a flush, their cache entries are
+        dropped once the transaction commits.
+        """
+        changed = session.info.setdefault('wordflow_changed', [])
+        changed.extend(session.new)
+        changed.extend(session.dirty)
+        changed.extend(session.deleted)
+        session.info['wordflow_flushed'] = True
+
+    def __count(self, session, deltas):
+        """
+        Writes counter changes (see models/engine/counters.py) and remembers
+        the objects they touch, their cache entries are dropped once the
+        transaction commits.
+        """
+        touched = counters.apply(session, deltas)
+        session.info.setdefault('wordflow_counted', set()).update(touched)
+
+    def __count_deleted(self, session, flush_context, instances):
+        """
+        Counts the links of the objects about to be deleted, before the
+        flush removes them from the association tables.
+        """
+        for obj in session.deleted:
+            for relation in inspect(type(obj)).relationships:
+                if relation.secondary is not None:
+                    local = relation.synchronize_pairs[0][1]
+                    self.__count(session, counters.deleting(
+                        session, relation.secondary, local == obj.id))
+
+    def __count_flushed(self, session, flush_context):
+        """Counts the rows written by a flush."""
+        self.__count(session, counters.flushed(session))
+
+    def __indexed_posts(self):
+        """
+        Yields the batches of posts that the search index is built from,
+        in a session of the calling thread, closed once they are read.
+        """
+        try:
+            yield from self.stream(Post)
+        finally:
+            self.close()
+
+    def __begin(self, session, transaction, connection):
+        """
+        Records the write generation of the object cache before the first
+        read of a transaction, see `ObjectCache.begin`.
+        """
+        session.info.pop('wordflow_generation', None)
+        if self.__cache is not None:
+            self.__cache.begin(session)
+
+    def __apply_changes(self, session):
+        """
+        Drops the cache entries of the objects written by a commit, or whose
+        counters changed, and updates the search index with the posts among
+        them.
+        """
+        changed = session.info.pop('wordflow_changed', [])
+        counted = session.info.pop('wordflow_counted', set())
+        session.info.pop('wordflow_flushed', None)
+        if self.__router is not None and session.info.pop('wordflow_wrote',
+                                                          None):
+            self.__router.wrote()
+        if self.__cache is not None and changed:
+            self.__cache.invalidate(changed)
+            for obj in changed:
+                if isinstance(obj, User):
+                    self.__write_revocation(obj)
+        if self.__cache is not None and counted:
+            ids = {}
+            for cls, id in counted:
+                ids.setdefault(cls, []).append(id)
+            for cls in ids:
+                self.__cache.invalidate_ids(cls, ids[cls])
+        if self.__search.ready:
+            for obj in changed:
+                if not isinstance(obj, Post):
+                    continue
+                if inspect(obj).was_deleted:
+                    self.__search.remove(obj.id)
+                else:
+                    self.__search.add(obj.id, obj.title, obj.content)
+
+    def __write_revocation(self, user):
+        """
+        Writes the revocation time of a user just committed through to the
+        cache, or drops it when the column is not loaded.
+        """
+        cache = self.__cache
+        if inspect(user).was_deleted:
+            cache.write_revocation(user.id, False, None)
+        elif 'tokens_revoked_at' in user.__dict__:
+            cache.write_revocation(user.id, True, user.tokens_revoked_at)
+        else:
+            cache.backend.delete(cache.revocation_key(user.id))
+
+    def __forget_changes(self, session, previous_transaction):
+        """Forgets the objects written by a transaction rolled back."""
+        if session.in_transaction():
+            return
+        session.info.pop('wordflow_changed', None)
+        session.info.pop('wordflow_counted', None)
+        session.info.pop('wordflow_flushed', None)
+        session.info.pop('wordflow_wrote', None)
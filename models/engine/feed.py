@@ -0,0 +1,273 @@
+#!/usr/bin/python3
+"""
+Home feeds: the latest published posts of the authors, categories and tags
+a user follows.
+
+Feeds are materialized in the `feed_items` table (fan-out on write). When
+a post is published, one INSERT ... SELECT copies its id to the feed of
+every follower of its author, categories and tags. Reading a feed is a
+slice of the index on (user_id, created_at, post_id).
+
+Authors with more than `fanout_limit` followers are not fanned out, so
+that one post does not write millions of rows. Their posts are merged in
+when a feed is read instead (fan-out on read), from the index on
+(user_id, created_at, id) of posts. Whether an author is popular is read
+from the `follower_count` counter of users (see
+models/engine/counters.py), not counted from the follows.
+
+A feed keeps its newest `max_items` entries: feeds growing through a
+backfill are trimmed right away, those growing through the fan-out of
+new posts by `trim_all`, run periodically by trim_feeds.py. The settings
+come from the WordFlow_FEED_* environment variables, see `feed_from_env`.
+"""
+from os import getenv
+from sqlalchemy import and_, delete, exists, func, insert, literal, or_
+from sqlalchemy import select
+from models.base_model import DATETIME  # type: ignore
+from models.follow import Follow, feed_items  # type: ignore
+from models.post import Post, post_categories, post_tags  # type: ignore
+from models.user import User  # type: ignore
+
+
+class Feed:
+    """
+    Maintains and reads the materialized home feeds.
+    """
+
+    def __init__(self, fanout_limit=10000, backfill=100, max_items=1000):
+        self.fanout_limit = fanout_limit
+        self.backfill_size = backfill
+        self.max_items = max_items
+
+    def publish(self, session, post):
+        """
+        Pushes `post` to the feeds of the followers of its author,
+        categories and tags, or removes it from every feed if it is not
+        published. Publishing again refreshes the recipients.
+        """
+        session.flush()
+        self.retract(session, post.id)
+        if not post.published:
+            return
+        sources = [
+            and_(Follow.target_type == 'category',
+                 Follow.target_id.in_(
+                     select(post_categories.c.category_id)
+                     .where(post_categories.c.post_id == post.id))),
+            and_(Follow.target_type == 'tag',
+                 Follow.target_id.in_(
+                     select(post_tags.c.tag_id)
+                     .where(post_tags.c.post_id == post.id))),
+        ]
+        if not self.popular_authors(session, [post.user_id]):
+            sources.append(and_(Follow.target_type == 'user',
+                                Follow.target_id == post.user_id))
+        followers = select(
+            Follow.follower_id, literal(post.id),
+            literal(post.created_at, DATETIME)).where(or_(*sources)).distinct()
+        session.execute(insert(feed_items).from_select(
+            ['user_id', 'post_id', 'created_at'], followers))
+
+    def retract(self, session, post_id):
+        """Removes a post from every feed."""
+        session.execute(delete(feed_items).where(
+            feed_items.c.post_id == post_id))
+
+    def drop_target(self, session, target_type, target_id, follower_id=None):
+        """
+        Removes the posts of a source from the feeds of its followers, or
+        of the follower `follower_id` only, unless another source they
+        follow brings them. Used on unfollow, and before deleting a source.
+        """
+        session.flush()
+        if target_type == 'user':
+            posts = select(Post.id).where(Post.user_id == target_id)
+        elif target_type == 'category':
+            posts = select(post_categories.c.post_id).where(
+                post_categories.c.category_id == target_id)
+        else:
+            posts = select(post_tags.c.post_id).where(
+                post_tags.c.tag_id == target_id)
+        if follower_id is not None:
+            followers = feed_items.c.user_id == follower_id
+        else:
+            followers = feed_items.c.user_id.in_(
+                select(Follow.follower_id).where(
+                    Follow.target_type == target_type,
+                    Follow.target_id == target_id))
+        others = or_(
+            and_(Follow.target_type == 'user',
+                 Follow.target_id == select(Post.user_id).where(
+                     Post.id == feed_items.c.post_id)
+                 .correlate(feed_items).scalar_subquery()),
+            and_(Follow.target_type == 'category',
+                 Follow.target_id.in_(
+                     select(post_categories.c.category_id).where(
+                         post_categories.c.post_id == feed_items.c.post_id)
+                     .correlate(feed_items))),
+            and_(Follow.target_type == 'tag',
+                 Follow.target_id.in_(
+                     select(post_tags.c.tag_id).where(
+                         post_tags.c.post_id == feed_items.c.post_id)
+                     .correlate(feed_items))))
+        session.execute(delete(feed_items).where(
+            followers, feed_items.c.post_id.in_(posts),
+            ~exists().where(
+                Follow.follower_id == feed_items.c.user_id, others,
+                or_(Follow.target_type != target_type,
+                    Follow.target_id != target_id))))
+
+    def backfill(self, session, follow):
+        """
+        Copies the latest published posts of a newly followed source to the
+        feed of the follower. Popular authors are read at read time.
+        """
+        query = select(literal(follow.follower_id), Post.id, Post.created_at)
+        if follow.target_type == 'user':
+            if self.popular_authors(session, [follow.target_id]):
+                return
+            query = query.where(Post.user_id == follow.target_id)
+        elif follow.target_type == 'category':
+            query = query.join(
+                post_categories, post_categories.c.post_id == Post.id).where(
+                post_categories.c.category_id == follow.target_id)
+        else:
+            query = query.join(
+                post_tags, post_tags.c.post_id == Post.id).where(
+                post_tags.c.tag_id == follow.target_id)
+        query = query.where(
+            Post.published.is_(True),
+            ~exists().where(feed_items.c.user_id == follow.follower_id,
+                            feed_items.c.post_id == Post.id))
+        query = query.order_by(Post.created_at.desc()).limit(
+            self.backfill_size)
+        session.flush()
+        session.execute(insert(feed_items).from_select(
+            ['user_id', 'post_id', 'created_at'], query))
+        self.trim(session, follow.follower_id)
+
+    def trim(self, session, user_id):
+        """
+        Removes the entries of a feed beyond its newest `max_items`.
+
+        Returns:
+            int: The number of entries removed.
+        """
+        cutoff = session.execute(
+            select(feed_items.c.created_at, feed_items.c.post_id)
+            .where(feed_items.c.user_id == user_id)
+            .order_by(feed_items.c.created_at.desc(),
+                      feed_items.c.post_id.desc())
+            .offset(self.max_items).limit(1)).first()
+        if cutoff is None:
+            return 0
+        created_at, post_id = cutoff
+        result = session.execute(delete(feed_items).where(
+            feed_items.c.user_id == user_id,
+            or_(feed_items.c.created_at < created_at,
+                and_(feed_items.c.created_at == created_at,
+                     feed_items.c.post_id <= post_id))))
+        return result.rowcount
+
+    def trim_all(self, session, batch_size=1000):
+        """
+        Trims every feed holding more than `max_items` entries, committing
+        every `batch_size` feeds. Meant for a periodic job.
+
+        Returns:
+            int: The number of entries removed.
+        """
+        over = session.scalars(
+            select(feed_items.c.user_id)
+            .group_by(feed_items.c.user_id)
+            .having(func.count() > self.max_items)).all()
+        removed = 0
+        for i, user_id in enumerate(over, 1):
+            removed += self.trim(session, user_id)
+            if i % batch_size == 0:
+                session.commit()
+        session.commit()
+        return removed
+
+    def clear(self, session, user_id):
+        """Removes every entry of the feed of a user."""
+        session.execute(delete(feed_items).where(
+            feed_items.c.user_id == user_id))
+
+    def rebuild(self, session, user_id):
+        """Refills the feed of a user from the sources they still follow."""
+        session.flush()
+        session.execute(delete(feed_items).where(
+            feed_items.c.user_id == user_id))
+        follows = session.query(Follow).filter_by(follower_id=user_id).all()
+        for follow in follows:
+            self.backfill(session, follow)
+
+    def read(self, session, user_id, limit, before=None):
+        """
+        Reads the newest entries of a feed.
+
+        Args:
+            session: The session to read with.
+            user_id: The ID of the reader.
+            limit: The maximum number of entries.
+            before: The (created_at, post id) position the entries must
+                    precede (optional).
+
+        Returns:
+            list: (post id, created_at) pairs, newest first.
+        """
+        pushed = select(feed_items.c.post_id, feed_items.c.created_at).where(
+            feed_items.c.user_id == user_id)
+        pushed = self.__before(pushed, feed_items.c.created_at,
+                               feed_items.c.post_id, before)
+        entries = dict(session.execute(pushed.order_by(
+            feed_items.c.created_at.desc(), feed_items.c.post_id.desc())
+            .limit(limit)).all())
+        popular = session.scalars(
+            select(User.id).join(Follow, Follow.target_id == User.id).where(
+                Follow.follower_id == user_id, Follow.target_type == 'user',
+                User.follower_count > self.fanout_limit)).all()
+        if popular:
+            pulled = select(Post.id, Post.created_at).where(
+                Post.user_id.in_(popular), Post.published.is_(True))
+            pulled = self.__before(pulled, Post.created_at, Post.id, before)
+            entries.update(session.execute(pulled.order_by(
+                Post.created_at.desc(), Post.id.desc()).limit(limit)).all())
+        return sorted(entries.items(), key=lambda entry: (entry[1], entry[0]),
+                      reverse=True)[:limit]
+
+    def popular_authors(self, session, author_ids):
+        """Returns the authors among `author_ids` that are not fanned out."""
+        author_ids = [id for id in author_ids if id is not None]
+        if not author_ids:
+            return set()
+        return set(session.scalars(select(User.id).where(
+            User.id.in_(author_ids),
+            User.follower_count > self.fanout_limit)))
+
+    @staticmethod
+    def __before(query, created_at, id, before):
+        """Restricts `query` to the rows preceding `before`, if given."""
+        if before is None:
+            return query
+        position, last_id = before
+        return query.where(or_(
+            created_at < position,
+            and_(created_at == position, id < last_id)))
+
+
+def feed_from_env():
+    """
+    Builds the feed from the environment.
+
+    Environment:
+        WordFlow_FEED_FANOUT_LIMIT: Followers above which the posts of an
+            author are merged in at read time (default 10000).
+        WordFlow_FEED_BACKFILL: Posts copied to a feed when a source is
+            followed (default 100).
+        WordFlow_FEED_MAX_ITEMS: Entries a feed keeps (default 1000).
+    """
+    return Feed(int(getenv('WordFlow_FEED_FANOUT_LIMIT', '10000')),
+                int(getenv('WordFlow_FEED_BACKFILL', '100')),
+                int(getenv('WordFlow_FEED_MAX_ITEMS', '1000')))
@@ -0,0 +1,252 @@
+"""
+Read/write splitting over read replicas.
+The sessions of DBStorage send their SELECT statements to a replica and
+everything else (writes, locking reads, raw SQL) to the primary, the
+engine of the app. Reads are spread over the healthy replicas in turn; a
+session keeps the replica it started reading from, so one request does
+not mix states of different replicas.
+
+Replicas lag behind the primary, so reads go to the primary:
+    - for statements with the `wordflow_primary` execution option;
+    - for the rest of a session once it has flushed a write;
+    - for a few seconds after a client committed a write. The time of the
+      write is handed back to the client, which sends it with its next
+      requests (the API uses the X-Last-Write header or the last_write
+      cookie, see api/v1/app.py) and is given to
+      `ReplicaRouter.bind_client`. The marker travels with the client, so
+      every worker and process honours it, and clients behind a shared
+      proxy address are told apart.
+While any write is that recent, objects read from a replica are not put
+in the object cache, which could otherwise keep a stale copy after the
+commit dropped the fresh one.
+
+A background thread checks the replicas with `SELECT 1`; a replica that
+fails a check or drops a connection gets no reads until it passes one.
+When no replica is healthy, reads go to the primary.
+
+Settings come from the environment:
+    WordFlow_REPLICA_URLS: Comma-separated database URLs of the replicas
+        (default none, everything goes to the primary).
+    WordFlow_REPLICA_STICKY_SECONDS: How long a client reads from the
+        primary after a write; should exceed the replication lag
+        (default 5).
+    WordFlow_REPLICA_CHECK_INTERVAL: Seconds between health checks
+        (default 5).
+"""
+import logging
+import threading
+import time
+from itertools import count
+from os import getenv
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+
+class Replica:
+    """A replica engine and its health."""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.name = engine.url.render_as_string(hide_password=True)
+        self.healthy = True
+        self.reads = 0
+        self.failures = 0
+        event.listen(engine, 'handle_error', self.__failed)
+
+    def check(self):
+        """Runs `SELECT 1` on the replica and records whether it worked."""
+        try:
+            with self.engine.connect() as conn:
+                conn.execute(text('SELECT 1'))
+        except Exception as e:
+            self.mark_down(e)
+        else:
+            if not self.healthy:
+                logger.warning("Replica %s is back", self.name)
+            self.healthy = True
+
+    def mark_down(self, error):
+        """Takes the replica out of the rotation."""
+        if self.healthy:
+            logger.warning("Replica %s is down: %s", self.name, error)
+        self.healthy = False
+        self.failures += 1
+
+    def __failed(self, context):
+        """Takes the replica out when one of its connections drops."""
+        if context.is_disconnect:
+            self.mark_down(context.original_exception)
+
+
+class ReplicaRouter:
+    """
+    Chooses the engine of read statements and tracks the recent writes
+    that make clients read from the primary.
+    """
+
+    def __init__(self, engines, sticky_seconds=5, check_interval=5):
+        self.replicas = [Replica(engine) for engine in engines]
+        self.sticky_seconds = sticky_seconds
+        self.check_interval = check_interval
+        self.__turn = count()
+        self.__local = threading.local()
+        self.__last_write = None
+        self.__stop = threading.Event()
+        self.__thread = None
+
+    def bind_client(self, last_write):
+        """
+        Starts serving a client on the current thread.
+
+        Args:
+            last_write: The time (seconds since the epoch) of the last
+                        write of the client, as returned by `written`, or
+                        None.
+        """
+        self.__local.last_write = last_write
+        self.__local.written = None
+
+    def read_engine(self):
+        """
+        Returns the engine of the next healthy replica, in turn, or None
+        when none is healthy.
+        """
+        healthy = [replica for replica in self.replicas if replica.healthy]
+        if not healthy:
+            return None
+        replica = healthy[next(self.__turn) % len(healthy)]
+        replica.reads += 1
+        return replica.engine
+
+    def wrote(self):
+        """Records a write committed for the client of the current thread."""
+        now = time.time()
+        self.__last_write = now
+        self.__local.last_write = now
+        self.__local.written = now
+
+    def written(self):
+        """
+        Returns the time of the last write committed for the client of the
+        current thread since it was bound, to be handed back to it, or None.
+        """
+        return getattr(self.__local, 'written', None)
+
+    def sticky(self):
+        """Tells if the client of the current thread wrote recently."""
+        last_write = getattr(self.__local, 'last_write', None)
+        # A marker from the future, e.g. forged, counts for one window
+        return (last_write is not None
+                and -self.sticky_seconds < time.time() - last_write
+                < self.sticky_seconds)
+
+    def lagging(self):
+        """Tells if the replicas may not have the latest write yet."""
+        last_write = self.__last_write
+        return (last_write is not None
+                and time.time() - last_write < self.sticky_seconds)
+
+    def check(self):
+        """Checks every replica once."""
+        for replica in self.replicas:
+            replica.check()
+
+    def start(self):
+        """Starts checking the replicas in a background thread."""
+        if self.__thread is None and self.replicas:
+            self.__thread = threading.Thread(target=self.__watch,
+                                             daemon=True)
+            self.__thread.start()
+
+    def stop(self):
+        """Stops the health checks and closes the replica connections."""
+        self.__stop.set()
+        if self.__thread is not None:
+            self.__thread.join()
+            self.__thread = None
+        for replica in self.replicas:
+            replica.engine.dispose()
+
+    def stats(self):
+        """
+        Returns the health and read counts of the replicas.
+
+        Returns:
+            dict: {replica URL: {'healthy', 'reads', 'failures'}}.
+        """
+        return {replica.name: {'healthy': replica.healthy,
+                               'reads': replica.reads,
+                               'failures': replica.failures}
+                for replica in self.replicas}
+
+    def __watch(self):
+        """Checks the replicas every `check_interval` seconds."""
+        while not self.__stop.wait(self.check_interval):
+            self.check()
+
+
+class RoutingSession(Session):
+    """
+    Session sending its SELECT statements to the replicas of the router
+    in `info['wordflow_router']`, unless it has written or its client
+    wrote recently.
+    """
+
+    def get_bind(self, mapper=None, clause=None, **kw):
+        """Returns the engine of a statement, see the module docstring."""
+        router = self.info.get('wordflow_router')
+        if self._flushing or getattr(clause, 'is_dml', False):
+            # Committed writes are reported by DBStorage to the router
+            self.info['wordflow_primary'] = True
+            self.info['wordflow_wrote'] = True
+        if (router is None or self.info.get('wordflow_primary')
+                or not getattr(clause, 'is_select', False)
+                or getattr(clause, '_for_update_arg', None) is not None
+                or clause.get_execution_options().get('wordflow_primary')
+                or router.sticky()):
+            return super().get_bind(mapper, clause=clause, **kw)
+        engine = self.info.get('wordflow_replica')
+        if engine is None:
+            engine = router.read_engine()
+            if engine is None:
+                return super().get_bind(mapper, clause=clause, **kw)
+            self.info['wordflow_replica'] = engine
+        if router.lagging():
+            self.info['wordflow_stale'] = True
+        return engine
+
+
+def replicas_from_env(urls=None):
+    """
+    Builds the replica router from the WordFlow_REPLICA_* variables, and
+    starts its health checks. The replica engines are profiled along with
+    the primary (see api/v1/profiling.py).
+
+    Args:
+        urls: The replica URLs, instead of WordFlow_REPLICA_URLS (optional).
+
+    Returns:
+        ReplicaRouter: The router, or None without replicas.
+    """
+    from api.v1 import profiler  # type: ignore
+    from api.v1.database import options_for, tune_engine  # type: ignore
+    if urls is None:
+        urls = [url.strip() for url in
+                getenv('WordFlow_REPLICA_URLS', '').split(',')
+                if url.strip()]
+    if not urls:
+        return None
+    engines = []
+    for url in urls:
+        engine = create_engine(url, **options_for(url))
+        tune_engine(engine)
+        engines.append(engine)
+    profiler.configure(engines=engines)
+    router = ReplicaRouter(
+        engines,
+        sticky_seconds=float(getenv('WordFlow_REPLICA_STICKY_SECONDS', '5')),
+        check_interval=float(getenv('WordFlow_REPLICA_CHECK_INTERVAL', '5')))
+    router.start()
+    return router
@@ -0,0 +1,354 @@
+#!/usr/bin/python3
+"""
+Full-text search over post titles and content.
+
+Two backends share one interface:
+- `FullTextIndex` ranks posts with the FULLTEXT index of MySQL, which the
+  server keeps up to date itself.
+- `MemoryIndex` is a pure-Python inverted index ranked with BM25, for
+  tests and single-process development setups only. Each process that
+  starts the storage builds its own from the posts table in a background
+  thread, then DBStorage updates it as that process commits posts.
+  Searches made before it is built raise `SearchUnavailable`. Nothing is
+  shared: with several app workers, each one holds a full copy and misses
+  the posts written by the others until it restarts, and any other
+  process importing `models`, such as a multiprocessing child running the
+  parent's `__main__` again (see api/v1/passwords.py), builds one too.
+  Deployments with more than one worker use `FullTextIndex` on MySQL.
+
+Both bound the work of a search: the MySQL query carries a
+MAX_EXECUTION_TIME hint, and the in-memory index reads a bounded number
+of postings, common terms only re-ranking the posts matched by rarer
+ones. A MySQL search running out of time raises `SearchUnavailable`, and
+a count running out of time gives a lower bound. The backend is chosen
+with the WordFlow_SEARCH_* environment variables, see `search_from_env`.
+"""
+import heapq
+import html
+import logging
+import math
+import re
+import threading
+from collections import Counter
+from itertools import islice
+from os import getenv
+from sqlalchemy import func, select
+from sqlalchemy.dialects.mysql import match
+from sqlalchemy.exc import OperationalError
+from models.post import Post  # type: ignore
+
+logger = logging.getLogger(__name__)
+
+
+TOKEN = re.compile(r"\w+")
+TITLE_BOOST = 2
+MAX_TERMS = 10
+# MySQL error raised when MAX_EXECUTION_TIME is exceeded
+ER_QUERY_TIMEOUT = 3024
+
+
+class SearchUnavailable(Exception):
+    """
+    Raised when a search cannot be answered now: the index is still being
+    built, or the database ran out of its time budget.
+    """
+
+    def __init__(self, retry_after=1):
+        super().__init__("Search is unavailable, retry later")
+        self.retry_after = retry_after
+
+
+def tokenize(text):
+    """Splits a text into lowercase terms."""
+    return [token.lower() for token in TOKEN.findall(text or "")]
+
+
+def highlight(text, terms, width=160):
+    """
+    Returns an HTML-escaped extract of `text` around its first matching
+    term, with every match wrapped in <mark>.
+
+    Args:
+        text: The text to extract from.
+        terms: The lowercase terms to highlight.
+        width: The maximum length of the extract, in characters.
+    """
+    text = text or ""
+    matches = [m for m in TOKEN.finditer(text) if m.group().lower() in terms]
+    start = 0
+    if matches and matches[0].end() > width:
+        start = max(0, matches[0].start() - width // 4)
+    end = min(len(text), start + width)
+    parts = ["…"] if start else []
+    position = start
+    for m in matches:
+        if m.start() < start:
+            continue
+        if m.end() > end:
+            break
+        parts.append(html.escape(text[position:m.start()]))
+        parts.append("<mark>{}</mark>".format(html.escape(m.group())))
+        position = m.end()
+    parts.append(html.escape(text[position:end]))
+    if end < len(text):
+        parts.append("…")
+    return "".join(parts)
+
+
+class MemoryIndex:
+    """
+    In-process inverted index of posts, ranked with BM25. Title terms
+    weigh TITLE_BOOST times as much as content terms. Only the commits of
+    the owning process reach it, so it is meant for a single process (see
+    the module docstring).
+    """
+
+    def __init__(self, max_postings=100000, k1=1.2, b=0.75):
+        self.max_postings = max_postings
+        self.k1 = k1
+        self.b = b
+        self.ready = True
+        self.__postings = {}
+        self.__lengths = {}
+        self.__total_length = 0
+        # Changes made while a rebuild reads the posts, or None
+        self.__pending = None
+        self.__thread = None
+        self.__lock = threading.RLock()
+
+    def start(self, load):
+        """
+        Builds the index in a background thread from `load()`, an iterable
+        of lists of posts. Searches raise SearchUnavailable until it is
+        done.
+        """
+        with self.__lock:
+            if self.__thread is not None:
+                return
+            self.ready = False
+            self.__thread = threading.Thread(
+                target=self.__build, args=(load,), daemon=True,
+                name='search-index')
+            self.__thread.start()
+
+    def wait(self, timeout=None):
+        """Waits for the build started by `start`, tells if it is done."""
+        thread = self.__thread
+        if thread is not None:
+            thread.join(timeout)
+        return self.ready
+
+    def add(self, id, title, content):
+        """Indexes a post, replacing its previous version."""
+        frequencies = Counter(tokenize(content))
+        for term in tokenize(title):
+            frequencies[term] += TITLE_BOOST
+        with self.__lock:
+            if self.__pending is not None:
+                self.__pending.append((id, title, content))
+            self.__remove(id)
+            for term, frequency in frequencies.items():
+                self.__postings.setdefault(term, {})[id] = frequency
+            length = sum(frequencies.values())
+            self.__lengths[id] = (length, tuple(frequencies))
+            self.__total_length += length
+
+    def remove(self, id):
+        """Removes a post from the index."""
+        with self.__lock:
+            if self.__pending is not None:
+                self.__pending.append((id, None, None))
+            self.__remove(id)
+
+    def rebuild(self, batches):
+        """
+        Replaces the content of the index with the posts of `batches`, an
+        iterable of lists of posts. The posts are indexed without holding
+        the lock, so searches go on meanwhile; the posts added or removed
+        in the meantime are applied again before the new content replaces
+        the old one.
+        """
+        fresh = MemoryIndex(self.max_postings, self.k1, self.b)
+        with self.__lock:
+            self.__pending = []
+        try:
+            for batch in batches:
+                for post in batch:
+                    fresh.add(post.id, post.title, post.content)
+        except Exception:
+            with self.__lock:
+                self.__pending = None
+            raise
+        with self.__lock:
+            for id, title, content in self.__pending:
+                if title is None:
+                    fresh.remove(id)
+                else:
+                    fresh.add(id, title, content)
+            self.__pending = None
+            self.__postings = fresh.__postings
+            self.__lengths = fresh.__lengths
+            self.__total_length = fresh.__total_length
+            self.ready = True
+
+    def search(self, session, query, limit, offset=0):
+        """
+        Ranks the posts matching any term of `query`. Terms are read from
+        the rarest to the most common; once the page is filled, a longer
+        posting list only adds to the score of the posts already found,
+        and at most `max_postings` postings are read in total.
+
+        Returns:
+            tuple: The (id, score) pairs of the page, best first, and the
+                   number of matching posts found, which is a lower bound
+                   when the budget was reached.
+
+        Raises:
+            SearchUnavailable: If the index is still being built.
+        """
+        if not self.ready:
+            raise SearchUnavailable()
+        terms = list(dict.fromkeys(tokenize(query)))[:MAX_TERMS]
+        wanted = offset + limit
+        with self.__lock:
+            count = len(self.__lengths)
+            if not count:
+                return [], 0
+            average = self.__total_length / count
+            postings = sorted((self.__postings[term] for term in terms
+                               if term in self.__postings), key=len)
+            scores = {}
+            budget = self.max_postings
+            for posting in postings:
+                idf = math.log(1 + (count - len(posting) + 0.5) /
+                               (len(posting) + 0.5))
+                if len(scores) >= wanted and len(posting) > len(scores):
+                    entries = [(id, posting[id]) for id in scores
+                               if id in posting]
+                else:
+                    entries = islice(posting.items(), max(budget, 0))
+                for id, frequency in entries:
+                    budget -= 1
+                    norm = self.k1 * (1 - self.b + self.b *
+                                      self.__lengths[id][0] / average)
+                    scores[id] = scores.get(id, 0.0) + idf * (
+                        frequency * (self.k1 + 1) / (frequency + norm))
+        best = heapq.nlargest(wanted, scores.items(),
+                              key=lambda item: (item[1], item[0]))
+        return best[offset:], len(scores)
+
+    def __build(self, load):
+        """Runs the build started by `start`."""
+        try:
+            self.rebuild(load())
+        except Exception:
+            logger.exception("Building the search index failed")
+        finally:
+            with self.__lock:
+                self.__thread = None
+
+    def __remove(self, id):
+        """Removes a post, the lock being held."""
+        entry = self.__lengths.pop(id, None)
+        if entry is None:
+            return
+        length, terms = entry
+        self.__total_length -= length
+        for term in terms:
+            posting = self.__postings.get(term)
+            if posting is not None:
+                posting.pop(id, None)
+                if not posting:
+                    del self.__postings[term]
+
+
+class FullTextIndex:
+    """
+    Ranks posts with the FULLTEXT index of MySQL on (title, content), in
+    natural language mode. Updates are made by the server.
+    """
+    ready = True
+
+    def __init__(self, budget_ms=200):
+        self.budget_ms = budget_ms
+
+    def add(self, id, title, content):
+        """Nothing to do, MySQL maintains the index."""
+
+    def remove(self, id):
+        """Nothing to do, MySQL maintains the index."""
+
+    def rebuild(self, batches):
+        """Nothing to do, MySQL maintains the index."""
+
+    def start(self, load):
+        """Nothing to do, MySQL maintains the index."""
+
+    def wait(self, timeout=None):
+        """The index is always ready."""
+        return True
+
+    def search(self, session, query, limit, offset=0):
+        """
+        Ranks the posts matching `query`.
+
+        Returns:
+            tuple: The (id, score) pairs of the page, best first, and the
+                   total number of matching posts, a lower bound when
+                   counting them ran out of time.
+
+        Raises:
+            SearchUnavailable: If ranking the posts ran out of time.
+        """
+        hint = "/*+ MAX_EXECUTION_TIME({}) */".format(int(self.budget_ms))
+        score = match(Post.title, Post.content, against=query)
+        try:
+            rows = session.execute(
+                select(Post.id, score.label('score'))
+                .where(score > 0)
+                .order_by(score.desc(), Post.id)
+                .limit(limit).offset(offset)
+                .prefix_with(hint)).all()
+        except OperationalError as e:
+            if not timed_out(e):
+                raise
+            raise SearchUnavailable() from e
+        page = [(id, float(value)) for id, value in rows]
+        try:
+            total = session.scalar(
+                select(func.count()).select_from(Post)
+                .where(score > 0).prefix_with(hint))
+        except OperationalError as e:
+            if not timed_out(e):
+                raise
+            total = offset + len(page)
+        return page, total
+
+
+def timed_out(error):
+    """Tells if a database error is MySQL running out of execution time."""
+    args = getattr(error.orig, 'args', ())
+    return bool(args) and args[0] == ER_QUERY_TIMEOUT
+
+
+def search_from_env(engine):
+    """
+    Builds the search backend from the environment.
+
+    Environment:
+        WordFlow_SEARCH: `fulltext` or `memory`; defaults to `fulltext` on
+            MySQL and `memory` elsewhere. `memory` is for a single process
+            only.
+        WordFlow_SEARCH_BUDGET_MS: Execution time limit of a MySQL search
+            (default 200).
+        WordFlow_SEARCH_MAX_POSTINGS: Postings read by an in-memory search
+            at most (default 100000).
+    """
+    default = 'fulltext' if engine.dialect.name == 'mysql' else 'memory'
+    backend = getenv('WordFlow_SEARCH', default).lower()
+    if backend == 'fulltext':
+        return FullTextIndex(int(getenv('WordFlow_SEARCH_BUDGET_MS', '200')))
+    if backend == 'memory':
+        return MemoryIndex(
+            int(getenv('WordFlow_SEARCH_MAX_POSTINGS', '100000')))
+    raise ValueError("Unknown search backend: {}".format(backend))
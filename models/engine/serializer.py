@@ -0,0 +1,174 @@
+#!/usr/bin/python3
+"""
+Schema-driven serialization of the models.
+
+A `Schema` knows the columns of a class, and which of them hold
+timestamps, ahead of time. Serializing an object is then one dict built
+from the loaded column values, without copying the instance `__dict__` or
+looking at its mapper. Rows read as plain tuples (see
+`DBStorage.stream_rows`) are serialized the same way without building ORM
+instances. A schema can be narrowed to a subset of the columns with
+`only`, which serves the `fields` query parameter. The summary schema of
+a class, used by the list endpoints, leaves out the large columns marked
+with `info={'in_lists': False}`, such as the content of posts. The
+embedded schema of a class, used for the objects embedded by `expand`,
+also leaves out the columns marked with `info={'embedded': False}`, such
+as the email of users. Columns marked with `info={'private': True}`, such
+as the password hash of users, are internal to the server: no schema
+serializes them and `fields` cannot name them. Columns marked with
+`info={'readonly': True}`, such as the ids, timestamps and counters, are
+written by the server only: the update endpoints skip them, see
+`read_only`.
+
+Schemas are built once per class and field set, and kept in a bounded
+cache: `schema_for` validates the requested names and turns them into a
+canonical tuple first, so that clients cannot grow the cache with
+misspelled, repeated or reordered names.
+"""
+from functools import lru_cache
+from sqlalchemy import Date, DateTime, inspect
+
+# Field sets of all classes whose schema is kept
+SCHEMA_CACHE_SIZE = 256
+
+
+class Schema:
+    """
+    The serialized form of a model class: its column names, in mapper
+    order, and the `__class__` marker of `BaseModel.to_dict`.
+    """
+
+    def __init__(self, cls, fields=None, summary=False, embedded=False):
+        """
+        Args:
+            cls: The model class.
+            fields: The names of the columns to serialize, all of them when
+                    None. The output of a narrowed schema has no
+                    `__class__` key.
+            summary: Leaves out the columns not shown in lists, when
+                     `fields` is None (optional).
+            embedded: Leaves out the columns not shown in the objects
+                      embedded in others, when `fields` is None (optional).
+
+        Raises:
+            ValueError: If a name in `fields` is not a column of `cls`.
+        """
+        attrs = [attr for attr in inspect(cls).column_attrs
+                 if not attr.columns[0].info.get('private')]
+        columns = [attr.key for attr in attrs]
+        if fields is None:
+            self.fields = tuple(
+                attr.key for attr in attrs
+                if (not summary or attr.columns[0].info.get('in_lists', True))
+                and (not embedded
+                     or attr.columns[0].info.get('embedded', True)))
+        else:
+            unknown = [name for name in fields if name not in columns]
+            if unknown:
+                raise ValueError("Unknown field: {}".format(
+                    ", ".join(unknown)))
+            self.fields = tuple(dict.fromkeys(fields))
+        self.cls = cls
+        # The columns to read from the database, None for all of them,
+        # private ones included
+        self.projection = (None if len(self.fields) == len(columns)
+                           else self.fields)
+        self.marker = cls.__name__ if fields is None else None
+        # Only timestamp columns need converting, the rest is JSON as is
+        temporal = {attr.key for attr in inspect(cls).column_attrs
+                    if isinstance(attr.columns[0].type, (Date, DateTime))}
+        self.timestamps = tuple(key for key in self.fields if key in temporal)
+
+    def only(self, fields):
+        """
+        Returns the schema of the columns named in `fields` of this class.
+
+        Raises:
+            ValueError: If a name is not a column of the class.
+        """
+        return schema_for(self.cls, fields)
+
+    def columns(self):
+        """Returns the table columns of the schema, in field order."""
+        table = self.cls.__table__
+        return [table.c[key] for key in self.fields]
+
+    def dump(self, obj):
+        """
+        Serializes an object. Columns that are not loaded are left out
+        rather than loaded.
+        """
+        values = obj.__dict__
+        data = {key: values[key] for key in self.fields if key in values}
+        for key in self.timestamps:
+            value = data.get(key)
+            if value is not None:
+                data[key] = value.isoformat()
+        if self.marker is not None:
+            data['__class__'] = self.marker
+        return data
+
+    def dump_many(self, objs):
+        """Serializes a list of objects."""
+        return [self.dump(obj) for obj in objs]
+
+    def dump_row(self, row):
+        """
+        Serializes a row holding the values of the schema columns, in
+        field order, e.g. read with `select(*schema.columns())`.
+        """
+        data = dict(zip(self.fields, row))
+        for key in self.timestamps:
+            value = data[key]
+            if value is not None:
+                data[key] = value.isoformat()
+        if self.marker is not None:
+            data['__class__'] = self.marker
+        return data
+
+
+@lru_cache(maxsize=None)
+def read_only(cls):
+    """
+    Returns the names of the columns of `cls` that requests cannot write,
+    the ones marked with `info={'readonly': True}`.
+    """
+    return frozenset(attr.key for attr in inspect(cls).column_attrs
+                     if attr.columns[0].info.get('readonly'))
+
+
+def field_names(cls, fields):
+    """
+    Returns the canonical form of the column names `fields` of `cls`: each
+    name once, in mapper order.
+
+    Raises:
+        ValueError: If a name is not a column of `cls`, or a private one.
+    """
+    columns = [attr.key for attr in inspect(cls).column_attrs
+               if not attr.columns[0].info.get('private')]
+    unknown = sorted(set(fields) - set(columns))
+    if unknown:
+        raise ValueError("Unknown field: {}".format(", ".join(unknown)))
+    wanted = set(fields)
+    return tuple(key for key in columns if key in wanted)
+
+
+def schema_for(cls, fields=None, summary=False, embedded=False):
+    """
+    Returns the schema of `cls`, narrowed to `fields` (column names) when
+    given, its summary for lists or its embedded form. Schemas are built
+    once and shared, see `SCHEMA_CACHE_SIZE`.
+
+    Raises:
+        ValueError: If a name in `fields` is not a column of `cls`.
+    """
+    if fields is not None:
+        fields = field_names(cls, fields)
+    return cached_schema(cls, fields, summary, embedded)
+
+
+@lru_cache(maxsize=SCHEMA_CACHE_SIZE)
+def cached_schema(cls, fields, summary, embedded):
+    """Builds the schema of canonical arguments, see `schema_for`."""
+    return Schema(cls, fields, summary, embedded)
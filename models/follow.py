@@ -0,0 +1,33 @@
+"""Follow Model"""
+from models.base_model import BaseModel, db, DATETIME  # type: ignore
+from sqlalchemy import Column, ForeignKey, Table
+
+# Kinds of objects a user can follow
+FOLLOW_TARGETS = ('user', 'category', 'tag')
+
+# Materialized home feeds: one row per (user, post) pushed to the user,
+# read newest first (see models/engine/feed.py)
+feed_items = Table(
+    'feed_items', db.metadata,
+    Column('user_id', db.String(60), ForeignKey('users.id'), primary_key=True),
+    Column('post_id', db.String(60), ForeignKey('posts.id'), primary_key=True),
+    Column('created_at', DATETIME, nullable=False),
+    db.Index('ix_feed_items_user_id_created_at',
+             'user_id', 'created_at', 'post_id'),
+    db.Index('ix_feed_items_post_id', 'post_id'),
+)
+
+
+class Follow(BaseModel, db.Model):
+    """Follow Class"""
+    __tablename__ = 'follows'
+    __table_args__ = (
+        db.UniqueConstraint('follower_id', 'target_type', 'target_id',
+                            name='uq_follows_follower_target'),
+        # Serves the fan-out of a post to the followers of its sources
+        db.Index('ix_follows_target', 'target_type', 'target_id'),
+    )
+    follower_id = db.Column(db.String(60), db.ForeignKey('users.id'),
+                            nullable=False)
+    target_type = db.Column(db.String(16), nullable=False)
+    target_id = db.Column(db.String(60), nullable=False)
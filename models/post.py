@@ -1,7 +1,21 @@
 """Post Model"""
-from models.base_model import BaseModel, db  # type: ignore
+from models.base_model import BaseModel, db, DATETIME  # type: ignore
 from sqlalchemy.orm import relationship
-from sqlalchemy import Column, ForeignKey, Table
+from sqlalchemy import Column, ForeignKey, Table, select
+
+
+def post_created_at(context):
+    """
+    Default of the created_at column of the association tables: the
+    creation time of the linked post, read with one query per link when a
+    link is inserted without it, e.g. from an ORM collection. The API
+    goes through DBStorage.link and bulk_insert instead, which copy it
+    without that query.
+    """
+    post_id = context.get_current_parameters()['post_id']
+    return context.connection.execute(
+        select(Post.created_at).where(Post.id == post_id)).scalar()
+
 
 # Many-to-many relationship between posts and categories
 post_categories = Table(
@@ -12,6 +26,14 @@ post_categories = Table(
         db.String(60),
         ForeignKey('categories.id'),
         primary_key=True),
+    # Copy of the created_at of the post, so that the posts of a category
+    # are listed from this index alone (see DBStorage.paginate)
+    Column('created_at', DATETIME, nullable=False, default=post_created_at,
+           info={'copy_of': 'post_id'}),
+    # The primary key serves the categories of a post, this index the
+    # posts of a category, oldest first
+    db.Index('ix_post_categories_category_id_created_at', 'category_id',
+             'created_at', 'post_id'),
 )
 
 # Many-to-many relationship between posts and tags
@@ -19,16 +41,35 @@ post_tags = Table(
     'post_tags', db.metadata,
     Column('post_id', db.String(60), ForeignKey('posts.id'), primary_key=True),
     Column('tag_id', db.String(60), ForeignKey('tags.id'), primary_key=True),
+    # Copy of the created_at of the post, see post_categories
+    Column('created_at', DATETIME, nullable=False, default=post_created_at,
+           info={'copy_of': 'post_id'}),
+    # The primary key serves the tags of a post, this index the posts of
+    # a tag, oldest first
+    db.Index('ix_post_tags_tag_id_created_at', 'tag_id', 'created_at',
+             'post_id'),
 )
 
 
 class Post(BaseModel, db.Model):
     """Post Class"""
     __tablename__ = "posts"
+    __table_args__ = (
+        # Serves GET /posts/search on MySQL (see models/engine/search.py)
+        db.Index('ft_posts_title_content', 'title', 'content',
+                 mysql_prefix='FULLTEXT').ddl_if(dialect='mysql'),
+        # Serves the feeds reading popular authors (models/engine/feed.py)
+        db.Index('ix_posts_user_id_created_at', 'user_id', 'created_at', 'id'),
+    )
     user_id = db.Column(db.String(60), db.ForeignKey('users.id'))
     title = db.Column(db.String(128), nullable=False)
-    content = db.Column(db.Text(512), nullable=False)
+    # The largest column, left out of lists unless asked for with `fields`
+    content = db.Column(db.Text(512), nullable=False,
+                        info={'in_lists': False})
     published = db.Column(db.Boolean, default=False)
+    # Maintained by models/engine/counters.py
+    comment_count = db.Column(db.Integer, nullable=False, default=0,
+                               server_default='0', info={'readonly': True})
 
     author = relationship("User", back_populates="posts")
     comments = relationship("Comment", back_populates="post")
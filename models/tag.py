@@ -7,4 +7,10 @@ class Tag(BaseModel, db.Model):
     """Tag Class"""
     __tablename__ = 'tags'
     name = db.Column(db.String(128), unique=True, nullable=False)
+    # The creator, who can rename or delete the tag along with the admins
+    user_id = db.Column(db.String(60), db.ForeignKey('users.id'),
+                        nullable=True)
+    # Maintained by models/engine/counters.py
+    post_count = db.Column(db.Integer, nullable=False, default=0,
+                            server_default='0', info={'readonly': True})
     posts = relationship("Post", secondary='post_tags', back_populates="tags")
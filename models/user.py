@@ -1,5 +1,6 @@
 """User Model"""
-from models.base_model import BaseModel, db  # type: ignore
+from models.base_model import DATETIME, BaseModel, db  # type: ignore
+from sqlalchemy import false
 from sqlalchemy.orm import relationship
 from flask_login import UserMixin
 
@@ -8,8 +9,24 @@ class User(UserMixin, BaseModel, db.Model):
     """User Class"""
     __tablename__ = "users"
     username = db.Column(db.String(128), unique=True, nullable=False)
-    email = db.Column(db.String(128), unique=True, nullable=False)
-    password_hash = db.Column(db.String(128), nullable=False)
+    # Left out of the users embedded in other objects, see serializer.py
+    email = db.Column(db.String(128), unique=True, nullable=False,
+                      info={'embedded': False})
+    # Never serialized, see serializer.py
+    password_hash = db.Column(db.String(128), nullable=False,
+                              info={'private': True})
+    # Admins manage the objects of every user; set in the database only
+    is_admin = db.Column(db.Boolean, nullable=False, default=False,
+                         server_default=false(),
+                         info={'private': True, 'readonly': True})
+    # Tokens issued up to this time are rejected, see api/v1/identity.py
+    tokens_revoked_at = db.Column(DATETIME, nullable=True,
+                                  info={'private': True, 'readonly': True})
+    # Maintained by models/engine/counters.py
+    post_count = db.Column(db.Integer, nullable=False, default=0,
+                            server_default='0', info={'readonly': True})
+    follower_count = db.Column(db.Integer, nullable=False, default=0,
+                                server_default='0', info={'readonly': True})
 
     posts = relationship("Post", back_populates="author")
     comments = relationship("Comment", back_populates="user")
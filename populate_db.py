@@ -1,76 +1,167 @@
+#!/usr/bin/python3
+"""
+Fills the database with fake users, categories, tags, posts and comments,
+for development and load tests.
+
+Rows are generated as plain dicts and written with `storage.bulk_insert`,
+a chunk per multi-row INSERT, so millions of rows can be loaded without
+building ORM objects. Faker only supplies a vocabulary once; rows are
+assembled from it with `random`, which keeps generation cheaper than the
+inserts. Unique names carry a run prefix so the script can be run again
+on the same database. Every user has the password given with --password.
+
+Usage:
+    python3 populate_db.py --users 100000 --posts 1000000 \\
+        --comments 5000000 --rate 50000
+"""
+import argparse
+import random
+import time
+from uuid import uuid4
 from faker import Faker
-from models.engine import db_storage
-from models.user import User
-from models.post import Post
-from models.comment import Comment
-from models.category import Category
-from models.tag import Tag
+from flask_bcrypt import generate_password_hash
+from api.v1 import hasher  # type: ignore
+from models import storage  # type: ignore
+from models.user import User  # type: ignore
+from models.post import Post  # type: ignore
+from models.comment import Comment  # type: ignore
+from models.category import Category  # type: ignore
+from models.tag import Tag  # type: ignore
 
-fake = Faker()
 
-# Get the storage instance
-storage = db_storage.DBStorage()
-storage.reload()
+def throttle(rows, rate, every=1000):
+    """
+    Yields `rows`, sleeping as needed to stay under `rate` rows per second.
+    A rate of 0 disables throttling.
+    """
+    start = time.monotonic()
+    for count, row in enumerate(rows, 1):
+        yield row
+        if rate and count % every == 0:
+            ahead = count / rate - (time.monotonic() - start)
+            if ahead > 0:
+                time.sleep(ahead)
 
-def create_users(n):
-    users = []
-    for _ in range(n):
-        username = fake.user_name()
-        email = fake.email()
-        password_hash = fake.password()  # You should use proper hashing
-        user = User(username=username, email=email, password_hash=password_hash)
-        users.append(user)
-        storage.new(user)
-    storage.save()
-    return users
-
-def create_categories(n):
-    categories = []
-    for _ in range(n):
-        name = fake.word()
-        category = Category(name=name)
-        categories.append(category)
-        storage.new(category)
-    storage.save()
-    return categories
-
-def create_posts(users, categories, n):
-    posts = []
+
+def text(words, low, high):
+    """Returns between `low` and `high` random words."""
+    return " ".join(random.choices(words, k=random.randint(low, high)))
+
+
+def users(n, prefix, password_hash, ids):
+    """Generates user rows, recording their ids in `ids`."""
+    for i in range(n):
+        id = str(uuid4())
+        ids.append(id)
+        yield {'id': id, 'username': "{}_user{}".format(prefix, i),
+               'email': "{}_user{}@example.com".format(prefix, i),
+               'password_hash': password_hash}
+
+
+def names(n, prefix, kind, words, ids):
+    """Generates category or tag rows, recording their ids in `ids`."""
+    for i in range(n):
+        id = str(uuid4())
+        ids.append(id)
+        yield {'id': id,
+               'name': "{}-{}{}-{}".format(random.choice(words), kind, i,
+                                           prefix)}
+
+
+def posts(n, words, user_ids, ids):
+    """Generates post rows, recording their ids in `ids`."""
     for _ in range(n):
-        title = fake.sentence()
-        content = fake.text()
-        user = fake.random_element(users)
-        category = fake.random_element(categories)
-        post = Post(title=title, content=content, user_id=user.id, category_id=category.id)
-        posts.append(post)
-        storage.new(post)
-    storage.save()
-    return posts
-
-def create_comments(users, posts, n):
-    comments = []
+        id = str(uuid4())
+        ids.append(id)
+        yield {'id': id, 'user_id': random.choice(user_ids),
+               'title': text(words, 3, 8).capitalize(),
+               'content': text(words, 20, 80),
+               'published': random.random() < 0.8}
+
+
+def links(post_ids, other_ids, column, most):
+    """
+    Generates association rows giving each post up to `most` distinct
+    objects among `other_ids`.
+    """
+    if not other_ids:
+        return
+    for post_id in post_ids:
+        k = random.randint(0, min(most, len(other_ids)))
+        for other_id in random.sample(other_ids, k):
+            yield {'post_id': post_id, column: other_id}
+
+
+def comments(n, words, user_ids, post_ids):
+    """Generates comment rows."""
     for _ in range(n):
-        content = fake.text()
-        user = fake.random_element(users)
-        post = fake.random_element(posts)
-        comment = Comment(content=content, user_id=user.id, post_id=post.id)
-        comments.append(comment)
-        storage.new(comment)
-    storage.save()
-    return comments
+        yield {'user_id': random.choice(user_ids),
+               'post_id': random.choice(post_ids),
+               'content': text(words, 5, 40)}
 
-if __name__ == "__main__":
-    # Create fake data for testing
-    print("Creating users...")
-    users = create_users(10)
 
-    print("Creating categories...")
-    categories = create_categories(5)
+def load(target, rows, args):
+    """Inserts `rows` into `target` and reports the throughput."""
+    start = time.monotonic()
+    count = storage.bulk_insert(target, throttle(rows, args.rate),
+                                chunk_size=args.chunk_size)
+    elapsed = time.monotonic() - start
+    name = target if isinstance(target, str) else target.__tablename__
+    print("{}: {} rows in {:.1f}s ({:.0f} rows/s)".format(
+        name, count, elapsed, count / elapsed if elapsed else 0))
 
-    print("Creating posts...")
-    posts = create_posts(users, categories, 20)
 
-    print("Creating comments...")
-    comments = create_comments(users, posts, 50)
+def parse_args():
+    """Reads the command line options."""
+    parser = argparse.ArgumentParser(
+        description="Fill the WordFlow database with fake data.")
+    parser.add_argument('--users', type=int, default=10)
+    parser.add_argument('--categories', type=int, default=5)
+    parser.add_argument('--tags', type=int, default=20)
+    parser.add_argument('--posts', type=int, default=20)
+    parser.add_argument('--comments', type=int, default=50)
+    parser.add_argument('--categories-per-post', type=int, default=2)
+    parser.add_argument('--tags-per-post', type=int, default=3)
+    parser.add_argument('--chunk-size', type=int, default=1000,
+                        help="rows per INSERT (default 1000)")
+    parser.add_argument('--rate', type=int, default=0,
+                        help="target rows per second per table, "
+                             "0 for as fast as possible (default)")
+    parser.add_argument('--password', default='password',
+                        help="password of every generated user")
+    parser.add_argument('--seed', type=int, help="random seed")
+    return parser.parse_args()
 
+
+def main():
+    """Generates and inserts the fake data."""
+    args = parse_args()
+    random.seed(args.seed)
+    fake = Faker()
+    if args.seed is not None:
+        fake.seed_instance(args.seed)
+    words = fake.words(nb=2000)
+    prefix = uuid4().hex[:6]
+    password_hash = generate_password_hash(
+        args.password, hasher.rounds).decode('utf-8')
+
+    user_ids, category_ids, tag_ids, post_ids = [], [], [], []
+    load(User, users(args.users, prefix, password_hash, user_ids), args)
+    load(Category, names(args.categories, prefix, 'category', words,
+                         category_ids), args)
+    load(Tag, names(args.tags, prefix, 'tag', words, tag_ids), args)
+    if not user_ids:
+        return
+    load(Post, posts(args.posts, words, user_ids, post_ids), args)
+    load('post_categories', links(post_ids, category_ids, 'category_id',
+                                  args.categories_per_post), args)
+    load('post_tags', links(post_ids, tag_ids, 'tag_id',
+                            args.tags_per_post), args)
+    if post_ids:
+        load(Comment, comments(args.comments, words, user_ids, post_ids),
+             args)
     print("Fake data successfully inserted into the database!")
+
+
+if __name__ == "__main__":
+    main()
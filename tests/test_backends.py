@@ -0,0 +1,117 @@
+import os
+import sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import pytest
+from uuid import uuid4
+from sqlalchemy import create_engine, text
+from api.v1.app import app
+from api.v1.database import database_from_env, in_memory, tune_engine
+
+
+@pytest.fixture
+def environment(monkeypatch):
+    """Fixture that clears the storage settings."""
+    for name in ('WordFlow_STORAGE', 'WordFlow_DATABASE_URL',
+                 'WordFlow_SQLITE_PATH', 'WordFlow_SQLITE_POOL_SIZE',
+                 'WordFlow_SQLITE_POOL_TIMEOUT'):
+        monkeypatch.delenv(name, raising=False)
+    return monkeypatch
+
+
+def test_backend_selection(environment):
+    """
+    Test that the backend follows WordFlow_STORAGE, or the scheme of
+    WordFlow_DATABASE_URL
+    """
+    url, options = database_from_env()
+    assert url.startswith('mysql+pymysql://')
+    assert 'connect_args' not in options
+    environment.setenv('WordFlow_STORAGE', 'sqlite')
+    environment.setenv('WordFlow_SQLITE_PATH', '/tmp/wordflow.db')
+    url, options = database_from_env()
+    assert url == 'sqlite:////tmp/wordflow.db'
+    assert options['connect_args'] == {'check_same_thread': False}
+    environment.setenv('WordFlow_STORAGE', 'memory')
+    url, options = database_from_env()
+    assert 'mode=memory' in url
+    assert (options['pool_size'], options['max_overflow']) == (1, 0)
+    environment.setenv('WordFlow_DATABASE_URL', 'sqlite://')
+    assert 'mode=memory' in database_from_env()[0]
+    environment.setenv('WordFlow_DATABASE_URL', 'mysql+pymysql://u@h/db')
+    assert database_from_env()[0] == 'mysql+pymysql://u@h/db'
+    environment.setenv('WordFlow_STORAGE', 'oracle')
+    with pytest.raises(ValueError):
+        database_from_env()
+
+
+def test_sqlite_file_pragmas(environment, tmp_path):
+    """
+    Test that SQLite files are opened in WAL mode with foreign keys on
+    """
+    environment.setenv('WordFlow_STORAGE', 'sqlite')
+    environment.setenv('WordFlow_SQLITE_PATH', str(tmp_path / 'wf.db'))
+    url, options = database_from_env()
+    engine = create_engine(url, **options)
+    tune_engine(engine)
+    with engine.connect() as conn:
+        assert conn.execute(text('PRAGMA journal_mode')).scalar() == 'wal'
+        assert conn.execute(text('PRAGMA foreign_keys')).scalar() == 1
+        assert conn.execute(text('PRAGMA busy_timeout')).scalar() == 5000
+    engine.dispose()
+
+
+def test_memory_database_persists(environment):
+    """
+    Test that the in-memory database keeps its data between checkouts
+    """
+    environment.setenv('WordFlow_STORAGE', 'memory')
+    url, options = database_from_env()
+    engine = create_engine(url, **options)
+    tune_engine(engine)
+    with engine.begin() as conn:
+        conn.execute(text('CREATE TABLE t (x INTEGER)'))
+        conn.execute(text('INSERT INTO t VALUES (1)'))
+    with engine.connect() as conn:
+        assert conn.execute(text('SELECT x FROM t')).scalar() == 1
+    engine.dispose()
+
+
+def test_sqlite_pool_settings(environment):
+    """
+    Test that the SQLite pools follow the WordFlow_SQLITE_* settings, not
+    the MySQL ones
+    """
+    environment.setenv('WordFlow_MYSQL_POOL_SIZE', '3')
+    environment.setenv('WordFlow_MYSQL_POOL_TIMEOUT', '7')
+    environment.setenv('WordFlow_STORAGE', 'sqlite')
+    options = database_from_env()[1]
+    assert (options['pool_size'], options['pool_timeout']) == (10, 30)
+    environment.setenv('WordFlow_SQLITE_POOL_SIZE', '4')
+    environment.setenv('WordFlow_SQLITE_POOL_TIMEOUT', '2')
+    assert database_from_env()[1]['pool_size'] == 4
+    environment.setenv('WordFlow_STORAGE', 'memory')
+    url, options = database_from_env()
+    assert options['pool_timeout'] == 2
+    assert in_memory(url) and not in_memory('sqlite:////tmp/wordflow.db')
+
+
+def test_no_streams_in_memory(environment):
+    """
+    Test that streamed lists are refused on the in-memory database, whose
+    only connection they would hold
+    """
+    suffix = uuid4().hex[:8]
+    credentials = {"email": f"mem_{suffix}@example.com", "password": "pwd"}
+    with app.test_client() as client:
+        client.post('/api/v1/signup',
+                    json={**credentials, "username": f"mem_{suffix}"})
+        token = client.post('/api/v1/login',
+                            json=credentials).get_json()['access_token']
+        headers = {"Authorization": f"Bearer {token}"}
+        environment.setitem(app.config, 'SQLALCHEMY_DATABASE_URI',
+                            'sqlite:///file:wordflow?mode=memory&uri=true')
+        response = client.get('/api/v1/posts?stream=ndjson',
+                              headers=headers)
+        assert response.status_code == 501
+        assert client.get('/api/v1/posts?limit=1',
+                          headers=headers).status_code == 200
@@ -0,0 +1,151 @@
+import os
+import sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import pytest
+from uuid import uuid4
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from models import storage
+from models.category import Category
+from models.comment import Comment
+from api.v1.app import app
+
+
+@pytest.fixture(scope='module')
+def test_client():
+    flask_app = app
+    flask_app.config['TESTING'] = True
+    with flask_app.test_client() as testing_client:
+        yield testing_client
+
+
+@pytest.fixture(scope='module')
+def auth_headers(test_client):
+    """
+    Fixture that signs up a user and returns its authorization header.
+    """
+    suffix = uuid4().hex[:8]
+    credentials = {"email": f"batch_{suffix}@example.com", "password": "pwd"}
+    test_client.post('/api/v1/signup',
+                     json={**credentials, "username": f"batch_{suffix}"})
+    response = test_client.post('/api/v1/login', json=credentials)
+    token = response.get_json()['access_token']
+    return {"Authorization": f"Bearer {token}"}
+
+
+@pytest.fixture
+def post_ids(test_client, auth_headers):
+    """
+    Fixture that creates two posts with the batch endpoint.
+    """
+    response = test_client.post('/api/v1/posts/batch', headers=auth_headers,
+                                json=[{"title": "a", "content": "a"},
+                                      {"title": "b", "content": "b"}])
+    assert response.status_code == 201
+    return [result['id'] for result in response.get_json()]
+
+
+def test_create_posts_partial(test_client, auth_headers):
+    """
+    Test that invalid posts are reported and the valid ones written
+    """
+    response = test_client.post('/api/v1/posts/batch', headers=auth_headers,
+                                json=[{"title": "ok", "content": "c"},
+                                      {"title": "no content"},
+                                      "not an object"])
+    assert response.status_code == 207
+    results = response.get_json()
+    assert [result['status'] for result in results] == [201, 400, 400]
+    assert results[1]['error'] == 'Missing content'
+    response = test_client.get(f"/api/v1/posts/{results[0]['id']}",
+                               headers=auth_headers)
+    assert response.status_code == 200
+
+
+def test_add_comments_one_commit(test_client, auth_headers, post_ids):
+    """
+    Test that a batch of comments is written with a single commit
+    """
+    commits = []
+
+    def record(conn):
+        commits.append(conn)
+
+    items = [{"post_id": post_ids[i % 2], "content": str(i)}
+             for i in range(200)]
+    event.listen(Engine, 'commit', record)
+    try:
+        response = test_client.post('/api/v1/comments/batch',
+                                    headers=auth_headers, json=items)
+    finally:
+        event.remove(Engine, 'commit', record)
+    assert response.status_code == 201
+    assert len(commits) == 1
+    assert storage.count_by(Comment, 'post_id', post_ids) == {
+        post_ids[0]: 100, post_ids[1]: 100}
+
+
+def test_atomic_batch(test_client, auth_headers, post_ids):
+    """
+    Test that an atomic batch with an invalid item writes nothing
+    """
+    items = [{"post_id": post_ids[0], "content": "kept out"},
+             {"post_id": str(uuid4()), "content": "unknown post"}]
+    response = test_client.post('/api/v1/comments/batch?atomic=1',
+                                headers=auth_headers, json=items)
+    assert response.status_code == 400
+    assert [result['status'] for result in response.get_json()] == [424, 404]
+    assert storage.count_by(Comment, 'post_id', post_ids[:1]) == {
+        post_ids[0]: 0}
+
+
+def test_assign_categories(test_client, auth_headers, post_ids):
+    """
+    Test that categories are assigned and removed in batches, with one
+    statement per link that copies the creation time of the post
+    """
+    category = Category(name=f"batch_{uuid4().hex[:8]}")
+    storage.new(category)
+    storage.save()
+    items = [{"post_id": post_id, "category_id": category.id}
+             for post_id in post_ids]
+    url = '/api/v1/posts/categories/batch'
+    statements = []
+
+    def record(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    event.listen(Engine, 'before_cursor_execute', record)
+    try:
+        response = test_client.post(url, headers=auth_headers,
+                                    json=items + items[:1])
+    finally:
+        event.remove(Engine, 'before_cursor_execute', record)
+    assert len([statement for statement in statements
+                if statement.startswith('INSERT INTO post_categories')]) == 3
+    assert not [statement for statement in statements
+                if statement.startswith('SELECT posts.created_at')]
+    assert [result['status'] for result in response.get_json()] == [
+        201, 201, 200]
+    assert storage.count_by('Post', 'categories', [category.id]) == {
+        category.id: 2}
+    response = test_client.delete(url, headers=auth_headers, json=items)
+    assert response.status_code == 201
+    assert storage.count_by('Post', 'categories', [category.id]) == {
+        category.id: 0}
+    response = test_client.delete(url, headers=auth_headers, json=items[:1])
+    assert response.get_json()[0]['status'] == 400
+
+
+def test_batch_limits(test_client, auth_headers):
+    """
+    Test that empty, non-list and oversized batches are rejected
+    """
+    url = '/api/v1/posts/batch'
+    assert test_client.post(url, headers=auth_headers,
+                            json=[]).status_code == 400
+    assert test_client.post(url, headers=auth_headers,
+                            json={"title": "t"}).status_code == 400
+    items = [{"title": "t", "content": "c"}] * 1001
+    assert test_client.post(url, headers=auth_headers,
+                            json=items).status_code == 400
@@ -0,0 +1,246 @@
+import os
+import sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import json
+import pickle
+import socketserver
+import threading
+import time
+import pytest
+from datetime import datetime
+from uuid import uuid4
+from models import storage
+from models.user import User
+from models.engine.cache import LRUCache, MemcachedCache, ObjectCache
+from models.engine.cache import cache_from_env
+from api.v1.app import app
+from api.v1.database import in_memory
+
+
+class MemcachedStandIn(socketserver.StreamRequestHandler):
+    """Minimal memcached server: get, set, delete and flush_all"""
+
+    def handle(self):
+        data = self.server.data
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.split()
+            if command[0] == b"get":
+                value = data.get(command[1])
+                if value is not None:
+                    self.wfile.write(b"VALUE %s 0 %d\r\n%s\r\n" % (
+                        command[1], len(value), value))
+                self.wfile.write(b"END\r\n")
+            elif command[0] == b"set":
+                value = self.rfile.read(int(command[4]) + 2)[:-2]
+                data[command[1]] = value
+                self.wfile.write(b"STORED\r\n")
+            elif command[0] == b"delete":
+                found = data.pop(command[1], None) is not None
+                self.wfile.write(b"DELETED\r\n" if found else b"NOT_FOUND\r\n")
+            elif command[0] == b"flush_all":
+                data.clear()
+                self.wfile.write(b"OK\r\n")
+
+
+def memcached_server():
+    """Starts a memcached stand-in on a free port and returns it."""
+    server = socketserver.ThreadingTCPServer(('127.0.0.1', 0),
+                                             MemcachedStandIn)
+    server.daemon_threads = True
+    server.data = {}
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+@pytest.fixture(params=['lru', 'memcached'])
+def cache(request):
+    """
+    Fixture that installs an object cache on the storage, with either the
+    in-process backend or a memcached client talking to a local stand-in.
+    """
+    server = None
+    if request.param == 'lru':
+        backend = LRUCache(100, 60)
+    else:
+        server = memcached_server()
+        backend = MemcachedCache(*server.server_address)
+    cache = ObjectCache(backend)
+    previous = storage.use_cache(cache)
+    yield cache
+    storage.use_cache(previous)
+    if server is not None:
+        server.shutdown()
+        server.server_close()
+
+
+@pytest.fixture
+def new_user():
+    """
+    Fixture that stores a user and removes it once the test is done.
+    """
+    suffix = uuid4().hex[:8]
+    user = User(email=f"cache_{suffix}@example.com",
+                username=f"cache_{suffix}",
+                password_hash="x")
+    storage.new(user)
+    storage.save()
+    storage.close()
+    yield user
+    user = storage.get(User, user.id)
+    if user is not None:
+        storage.delete(user)
+        storage.save()
+    storage.close()
+
+
+def test_lru_eviction_and_ttl():
+    """
+    Test that the LRU backend evicts the oldest entries and expires them
+    """
+    lru = LRUCache(maxsize=2, ttl=60)
+    lru.set('a', 1)
+    lru.set('b', 2)
+    lru.get('a')
+    lru.set('c', 3)
+    assert lru.get('b') is None
+    assert lru.get('a') == 1 and lru.get('c') == 3
+    lru.ttl = 0
+    lru.set('d', 4)
+    time.sleep(0.01)
+    assert lru.get('d') is None
+
+
+def test_get_hit(cache, new_user):
+    """
+    Test that a second get in a new session is served by the cache
+    """
+    assert storage.get(User, new_user.id).email == new_user.email
+    storage.close()
+    assert cache.stats()['misses'] == 1
+    user = storage.get(User, new_user.id)
+    assert user.email == new_user.email
+    assert cache.stats()['hits'] == 1
+    storage.close()
+
+
+def test_save_invalidates(cache, new_user):
+    """
+    Test that updating an object drops its cached state
+    """
+    storage.get(User, new_user.id)
+    storage.close()
+    user = storage.get(User, new_user.id)
+    user.username = f"renamed_{uuid4().hex[:8]}"
+    storage.save()
+    storage.close()
+    assert storage.get(User, new_user.id).username == user.username
+    storage.close()
+
+
+def test_delete_invalidates(cache, new_user):
+    """
+    Test that a deleted object is not served by the cache
+    """
+    storage.get(User, new_user.id)
+    storage.close()
+    storage.delete(storage.get(User, new_user.id))
+    storage.save()
+    storage.close()
+    assert storage.get(User, new_user.id) is None
+
+
+@pytest.mark.skipif(in_memory(app.config['SQLALCHEMY_DATABASE_URI']),
+                    reason="the in-memory database has a single connection, "
+                           "held by the reading session")
+def test_no_store_after_concurrent_write(cache, new_user):
+    """
+    Test that a session does not cache what it read once another session
+    committed a write after its transaction began
+    """
+    storage.close()
+    storage.count(User)
+    renamed = f"renamed_{uuid4().hex[:8]}"
+
+    def write():
+        user = storage.get(User, new_user.id)
+        user.username = renamed
+        storage.save()
+        storage.close()
+
+    writer = threading.Thread(target=write)
+    writer.start()
+    writer.join()
+    storage.get(User, new_user.id)
+    storage.close()
+    assert cache.backend.get(cache.object_key(User, new_user.id)) is None
+    assert storage.get(User, new_user.id).username == renamed
+    storage.close()
+    assert cache.backend.get(cache.object_key(User, new_user.id)) is not None
+
+
+def test_page_invalidated_by_new(cache, new_user):
+    """
+    Test that cached pages of a class are dropped when an object is added
+    """
+    first = [user.id for user in storage.paginate(User, 100)[0]]
+    storage.close()
+    assert [user.id for user in storage.paginate(User, 100)[0]] == first
+    assert cache.stats()['hits'] >= 1
+    other = User(email=f"cache_{uuid4().hex[:8]}@example.com",
+                 username=f"cache_{uuid4().hex[:8]}", password_hash="x")
+    storage.new(other)
+    storage.save()
+    storage.close()
+    ids = [user.id for user in storage.paginate(User, 100)[0]]
+    assert other.id in ids or len(first) == 100
+    storage.delete(storage.get(User, other.id))
+    storage.save()
+    storage.close()
+
+
+def test_unreachable_memcached_is_a_miss():
+    """
+    Test that an unreachable memcached server behaves as an empty cache
+    """
+    backend = MemcachedCache('127.0.0.1', 1, timeout=0.1)
+    backend.set('a', 1)
+    assert backend.get('a') is None
+
+
+def test_memcached_values_are_json():
+    """
+    Test that memcached values are stored as JSON with their datetimes,
+    and that a value that is not JSON is a miss rather than unpickled
+    """
+    server = memcached_server()
+    try:
+        backend = MemcachedCache(*server.server_address)
+        now = datetime.utcnow()
+        backend.set('values', {'created_at': now, 'title': 't', 'count': 2})
+        assert backend.get('values') == {'created_at': now, 'title': 't',
+                                         'count': 2}
+        assert json.loads(server.data[b'wordflow:values'])['title'] == 't'
+        backend.set('page', (['a', 'b'], None))
+        assert backend.get('page') == [['a', 'b'], None]
+        server.data[b'wordflow:pickled'] = pickle.dumps({'title': 't'})
+        assert backend.get('pickled') is None
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_lru_from_env(monkeypatch):
+    """
+    Test that the in-process cache can be configured
+    """
+    monkeypatch.setenv('WordFlow_CACHE', 'lru')
+    monkeypatch.setenv('WordFlow_CACHE_SIZE', '5')
+    cache = cache_from_env()
+    assert isinstance(cache.backend, LRUCache)
+    assert cache.backend.maxsize == 5
+    monkeypatch.setenv('WordFlow_CACHE', 'redis')
+    with pytest.raises(ValueError):
+        cache_from_env()
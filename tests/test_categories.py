@@ -0,0 +1,146 @@
+import os
+import sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import json
+import pytest
+from uuid import uuid4
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from models import storage
+from models.category import Category
+from api.v1.app import app
+from api.v1.database import in_memory
+
+
+@pytest.fixture(scope='module')
+def test_client():
+    flask_app = app
+    flask_app.config['TESTING'] = True
+    with flask_app.test_client() as testing_client:
+        yield testing_client
+
+
+@pytest.fixture(scope='module')
+def auth_headers(test_client):
+    """
+    Fixture that signs up a user and returns its authorization header.
+    """
+    suffix = uuid4().hex[:8]
+    credentials = {"email": f"cats_{suffix}@example.com", "password": "pwd"}
+    test_client.post('/api/v1/signup',
+                     json={**credentials, "username": f"cats_{suffix}"})
+    response = test_client.post('/api/v1/login', json=credentials)
+    token = response.get_json()['access_token']
+    return {"Authorization": f"Bearer {token}"}
+
+
+@pytest.fixture
+def category():
+    """
+    Fixture that creates a category.
+    """
+    category = Category(name=f"cat-{uuid4().hex[:8]}")
+    storage.new(category)
+    storage.save()
+    return category
+
+
+def test_category_posts(test_client, auth_headers, category):
+    """
+    Test that the posts of a category are listed page by page, by category
+    id and name, as they are assigned and removed
+    """
+    post_ids = []
+    for i in range(3):
+        response = test_client.post('/api/v1/posts', headers=auth_headers,
+                                    json={"title": f"c{i}", "content": "c"})
+        post_ids.append(response.get_json()['id'])
+        response = test_client.post(
+            f"/api/v1/posts/{post_ids[-1]}/categories/{category.id}",
+            headers=auth_headers)
+        assert response.status_code == 200
+    response = test_client.get(
+        f"/api/v1/categories/{category.id}/posts?limit=2",
+        headers=auth_headers)
+    seen = [post['id'] for post in response.get_json()]
+    response = test_client.get(
+        f"/api/v1/categories/{category.name}/posts?limit=2"
+        f"&after={response.headers['X-Next-Cursor']}", headers=auth_headers)
+    seen += [post['id'] for post in response.get_json()]
+    assert seen == post_ids
+    response = test_client.delete(
+        f"/api/v1/posts/{post_ids[1]}/categories/{category.id}",
+        headers=auth_headers)
+    assert response.status_code == 200
+    response = test_client.delete(
+        f"/api/v1/posts/{post_ids[1]}/categories/{category.id}",
+        headers=auth_headers)
+    assert response.status_code == 400
+    response = test_client.get(f"/api/v1/posts?category={category.name}",
+                               headers=auth_headers)
+    assert [post['id'] for post in response.get_json()] == [
+        post_ids[0], post_ids[2]]
+    response = test_client.get(f"/api/v1/posts?category={uuid4()}",
+                               headers=auth_headers)
+    assert response.status_code == 404
+
+
+def test_assign_does_not_load_collection(test_client, auth_headers, category):
+    """
+    Test that assigning a category checks and writes the association table
+    with a single statement, without reading the categories of the post
+    """
+    response = test_client.post('/api/v1/posts', headers=auth_headers,
+                                json={"title": "t", "content": "c"})
+    post_id = response.get_json()['id']
+    test_client.post(f"/api/v1/posts/{post_id}/categories/{category.id}",
+                     headers=auth_headers)
+    statements = []
+
+    def record(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    event.listen(Engine, 'before_cursor_execute', record)
+    try:
+        response = test_client.post(
+            f"/api/v1/posts/{post_id}/categories/{category.id}",
+            headers=auth_headers)
+    finally:
+        event.remove(Engine, 'before_cursor_execute', record)
+    assert response.status_code == 200
+    assert not [statement for statement in statements
+                if 'JOIN post_categories' in statement]
+    assert len([statement for statement in statements
+                if 'post_categories' in statement]) == 1
+    assert storage.count_by('Post', 'categories', [category.id]) == {
+        category.id: 1}
+
+
+@pytest.mark.skipif(in_memory(app.config['SQLALCHEMY_DATABASE_URI']),
+                    reason="streams are refused on the in-memory database")
+def test_category_posts_stream(test_client, auth_headers, category):
+    """
+    Test that `stream=ndjson` sends every post of the category, one JSON
+    object per line, oldest first, with the fields asked for
+    """
+    post_ids = []
+    for i in range(4):
+        response = test_client.post('/api/v1/posts', headers=auth_headers,
+                                    json={"title": f"s{i}", "content": "c"})
+        post_ids.append(response.get_json()['id'])
+        test_client.post(
+            f"/api/v1/posts/{post_ids[-1]}/categories/{category.id}",
+            headers=auth_headers)
+    response = test_client.get(
+        f"/api/v1/categories/{category.id}/posts?stream=ndjson"
+        "&fields=id,title", headers=auth_headers)
+    assert response.status_code == 200
+    assert response.mimetype == 'application/x-ndjson'
+    lines = response.get_data(as_text=True).splitlines()
+    rows = [json.loads(line) for line in lines]
+    assert [row['id'] for row in rows] == post_ids
+    assert [row['title'] for row in rows] == ['s0', 's1', 's2', 's3']
+    response = test_client.get(
+        f"/api/v1/categories/{category.id}/posts?stream=xml",
+        headers=auth_headers)
+    assert response.status_code == 400
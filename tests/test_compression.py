@@ -0,0 +1,89 @@
+import os
+import sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import gzip
+import json
+import zlib
+import pytest
+from uuid import uuid4
+from api.v1 import compressor
+from api.v1.app import app
+from api.v1.database import in_memory
+
+
+@pytest.fixture(scope='module')
+def test_client():
+    flask_app = app
+    flask_app.config['TESTING'] = True
+    with flask_app.test_client() as testing_client:
+        yield testing_client
+
+
+@pytest.fixture(scope='module')
+def auth_headers(test_client):
+    """
+    Fixture that signs up a user with a few long posts and returns its
+    authorization header.
+    """
+    suffix = uuid4().hex[:8]
+    credentials = {"email": f"zip_{suffix}@example.com", "password": "pwd"}
+    test_client.post('/api/v1/signup',
+                     json={**credentials, "username": f"zip_{suffix}"})
+    response = test_client.post('/api/v1/login', json=credentials)
+    token = response.get_json()['access_token']
+    headers = {"Authorization": f"Bearer {token}"}
+    for i in range(5):
+        test_client.post('/api/v1/posts', headers=headers,
+                         json={"title": f"zip {i}", "content": "word " * 200})
+    return headers
+
+
+def test_negotiated_encodings(test_client, auth_headers):
+    """
+    Test that large bodies are compressed with the accepted encoding and
+    small ones, or refused encodings, are sent as is
+    """
+    url = '/api/v1/posts?limit=100&fields=*'
+    plain = test_client.get(url, headers=auth_headers)
+    assert 'Content-Encoding' not in plain.headers
+    assert plain.headers['Vary'] == 'Accept-Encoding'
+    before = compressor.stats().get('gzip', {}).get('bytes_out', 0)
+    response = test_client.get(url, headers={
+        **auth_headers, 'Accept-Encoding': 'gzip, deflate'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert gzip.decompress(response.data) == plain.data
+    assert int(response.headers['Content-Length']) < len(plain.data)
+    assert compressor.stats()['gzip']['bytes_out'] - before == len(
+        response.data)
+    response = test_client.get(url, headers={
+        **auth_headers, 'Accept-Encoding': 'gzip;q=0, deflate;q=0.5'})
+    assert response.headers['Content-Encoding'] == 'deflate'
+    assert zlib.decompress(response.data) == plain.data
+    response = test_client.get(url, headers={
+        **auth_headers, 'Accept-Encoding': 'identity'})
+    assert 'Content-Encoding' not in response.headers
+    response = test_client.get('/api/v1/posts?limit=1&fields=id', headers={
+        **auth_headers, 'Accept-Encoding': 'gzip'})
+    assert 'Content-Encoding' not in response.headers
+
+
+@pytest.mark.skipif(in_memory(app.config['SQLALCHEMY_DATABASE_URI']),
+                    reason="streams are refused on the in-memory database")
+def test_streamed_and_conditional(test_client, auth_headers):
+    """
+    Test that streams are compressed chunk by chunk and that compressed
+    responses can still be revalidated
+    """
+    headers = {**auth_headers, 'Accept-Encoding': 'gzip'}
+    response = test_client.get('/api/v1/posts?stream=ndjson&fields=*',
+                               headers=headers)
+    assert response.headers['Content-Encoding'] == 'gzip'
+    lines = gzip.decompress(response.data).decode().splitlines()
+    assert all(json.loads(line)['id'] for line in lines)
+    response = test_client.get('/api/v1/posts?limit=100&fields=*',
+                               headers=headers)
+    etag = response.headers['ETag']
+    assert etag.startswith('W/')
+    response = test_client.get('/api/v1/posts?limit=100&fields=*',
+                               headers={**headers, 'If-None-Match': etag})
+    assert response.status_code == 304
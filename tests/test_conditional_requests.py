@@ -0,0 +1,145 @@
+import os
+import sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import pytest
+from datetime import datetime
+from uuid import uuid4
+from werkzeug.http import http_date
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from models import storage
+from api.v1.app import app
+
+
+@pytest.fixture(scope='module')
+def test_client():
+    flask_app = app
+    flask_app.config['TESTING'] = True
+    with flask_app.test_client() as testing_client:
+        yield testing_client
+
+
+@pytest.fixture(scope='module')
+def auth_headers(test_client):
+    """
+    Fixture that signs up a user and returns its authorization header.
+    """
+    suffix = uuid4().hex[:8]
+    credentials = {"email": f"etag_{suffix}@example.com", "password": "pwd"}
+    test_client.post('/api/v1/signup',
+                     json={**credentials, "username": f"etag_{suffix}"})
+    response = test_client.post('/api/v1/login', json=credentials)
+    token = response.get_json()['access_token']
+    return {"Authorization": f"Bearer {token}"}
+
+
+@pytest.fixture
+def post_id(test_client, auth_headers):
+    """
+    Fixture that creates a post through the API.
+    """
+    response = test_client.post('/api/v1/posts', headers=auth_headers,
+                                json={"title": "etag", "content": "content"})
+    return response.get_json()['id']
+
+
+def test_post_not_modified(test_client, auth_headers, post_id):
+    """
+    Test that a post is answered with 304 until it is updated
+    """
+    response = test_client.get(f'/api/v1/posts/{post_id}',
+                               headers=auth_headers)
+    assert response.status_code == 200
+    etag = response.headers['ETag']
+    assert response.headers['Last-Modified']
+    response = test_client.get(f'/api/v1/posts/{post_id}',
+                               headers={**auth_headers, 'If-None-Match': etag})
+    assert response.status_code == 304
+    assert response.data == b''
+    test_client.put(f'/api/v1/posts/{post_id}', headers=auth_headers,
+                    json={"title": "changed"})
+    response = test_client.get(f'/api/v1/posts/{post_id}',
+                               headers={**auth_headers, 'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.get_json()['title'] == "changed"
+
+
+def test_collection_not_modified(test_client, auth_headers, post_id):
+    """
+    Test that a collection is answered with 304 until one of its
+    objects changes
+    """
+    url = f'/api/v1/posts/{post_id}/comments'
+    response = test_client.get(url, headers=auth_headers)
+    etag = response.headers['ETag']
+    response = test_client.get(url, headers={**auth_headers,
+                                             'If-None-Match': etag})
+    assert response.status_code == 304
+    test_client.post(url, headers=auth_headers, json={"content": "new"})
+    response = test_client.get(url, headers={**auth_headers,
+                                             'If-None-Match': etag})
+    assert response.status_code == 200
+    assert len(response.get_json()) == 1
+
+
+def test_if_modified_since(test_client, auth_headers, post_id):
+    """
+    Test that If-Modified-Since is honored when no ETag is sent
+    """
+    response = test_client.get(f'/api/v1/posts/{post_id}',
+                               headers=auth_headers)
+    last_modified = response.headers['Last-Modified']
+    response = test_client.get(f'/api/v1/posts/{post_id}', headers={
+        **auth_headers, 'If-Modified-Since': last_modified})
+    assert response.status_code == 304
+
+
+def test_collection_validators_need_no_aggregate(test_client, auth_headers,
+                                                 post_id):
+    """
+    Test that the validators of a page come from the page itself, without
+    an aggregate query over the collection, and change when an object
+    leaves the page
+    """
+    url = f'/api/v1/posts/{post_id}/comments'
+    response = test_client.post(url, headers=auth_headers,
+                                json={"content": "first"})
+    comment_id = response.get_json()['id']
+    statements = []
+
+    def record(conn, cursor, statement, *args):
+        statements.append(statement.lower())
+
+    event.listen(Engine, 'before_cursor_execute', record)
+    try:
+        response = test_client.get(url, headers=auth_headers)
+    finally:
+        event.remove(Engine, 'before_cursor_execute', record)
+    assert not [statement for statement in statements
+                if 'max(' in statement or 'count(' in statement]
+    etag = response.headers['ETag']
+    test_client.delete(f'{url}/{comment_id}', headers=auth_headers)
+    response = test_client.get(url, headers={**auth_headers,
+                                             'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.get_json() == []
+
+
+def test_collection_ignores_if_modified_since(test_client, auth_headers,
+                                              post_id):
+    """
+    Test that pages carry no Last-Modified date, so that a delete, which
+    leaves the newest update time of the page unchanged, is not hidden
+    behind a 304 to If-Modified-Since
+    """
+    url = f'/api/v1/posts/{post_id}/comments'
+    ids = [test_client.post(url, headers=auth_headers,
+                            json={"content": content}).get_json()['id']
+           for content in ("older", "newer")]
+    response = test_client.get(url, headers=auth_headers)
+    assert 'Last-Modified' not in response.headers
+    test_client.delete(f'{url}/{ids[0]}', headers=auth_headers)
+    response = test_client.get(url, headers={
+        **auth_headers, 'If-Modified-Since': http_date(datetime.utcnow())})
+    assert response.status_code == 200
+    assert [comment['id'] for comment in response.get_json()] == [ids[1]]
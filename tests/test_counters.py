@@ -0,0 +1,152 @@
+import os
+import sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import pytest
+from uuid import uuid4
+from sqlalchemy import update
+from models import storage
+from models.base_model import db
+from models.post import Post
+from models.category import Category
+from models.tag import Tag
+from api.v1.app import app
+
+
+@pytest.fixture(scope='module')
+def test_client():
+    flask_app = app
+    flask_app.config['TESTING'] = True
+    with flask_app.test_client() as testing_client:
+        yield testing_client
+
+
+def sign_up(test_client):
+    """
+    Signs up a user and returns its id and authorization header.
+    """
+    suffix = uuid4().hex[:8]
+    credentials = {"email": f"count_{suffix}@example.com", "password": "pwd"}
+    response = test_client.post('/api/v1/signup',
+                                json={**credentials,
+                                      "username": f"count_{suffix}"})
+    user_id = response.get_json()['id']
+    response = test_client.post('/api/v1/login', json=credentials)
+    token = response.get_json()['access_token']
+    return user_id, {"Authorization": f"Bearer {token}"}
+
+
+def named(cls):
+    """Creates an object of `cls` with a unique name."""
+    obj = cls(name=f"count_{uuid4().hex[:8]}")
+    storage.new(obj)
+    storage.save()
+    return obj
+
+
+def counts(cls, id, key):
+    """Returns the counter `key` of an object, as served by the API."""
+    storage.close()
+    return storage.get(cls, id).to_dict()[key]
+
+
+def test_counters_follow_writes(test_client):
+    """
+    Test that the counters follow the creation and deletion of posts,
+    comments, category and tag links
+    """
+    user_id, headers = sign_up(test_client)
+    category, tag = named(Category), named(Tag)
+    response = test_client.post('/api/v1/posts', headers=headers,
+                                json={"title": "t", "content": "c"})
+    post_id = response.get_json()['id']
+    assert response.get_json()['comment_count'] == 0
+    assert counts('User', user_id, 'post_count') == 1
+    comment_ids = []
+    for _ in range(2):
+        response = test_client.post(f'/api/v1/posts/{post_id}/comments',
+                                    headers=headers, json={"content": "c"})
+        comment_ids.append(response.get_json()['id'])
+    response = test_client.get(f'/api/v1/posts/{post_id}', headers=headers)
+    assert response.get_json()['comment_count'] == 2
+    test_client.delete(f'/api/v1/posts/{post_id}/comments/{comment_ids[0]}',
+                       headers=headers)
+    assert counts(Post, post_id, 'comment_count') == 1
+    test_client.post(f'/api/v1/posts/{post_id}/categories/{category.id}',
+                     headers=headers)
+    test_client.post(f'/api/v1/posts/{post_id}/categories/{category.id}',
+                     headers=headers)
+    test_client.post(f'/api/v1/posts/{post_id}/tags/{tag.id}',
+                     headers=headers)
+    assert counts(Category, category.id, 'post_count') == 1
+    assert counts(Tag, tag.id, 'post_count') == 1
+    test_client.delete(f'/api/v1/posts/{post_id}/tags/{tag.id}',
+                       headers=headers)
+    assert counts(Tag, tag.id, 'post_count') == 0
+    test_client.delete(f'/api/v1/posts/{post_id}', headers=headers)
+    assert counts(Category, category.id, 'post_count') == 0
+    assert counts('User', user_id, 'post_count') == 0
+
+
+def test_counters_follow_collections_and_bulk_insert(test_client):
+    """
+    Test that links written through the collections of a post, or with a
+    bulk insert, are counted
+    """
+    user_id, _ = sign_up(test_client)
+    category = named(Category)
+    post = Post(user_id=user_id, title="t", content="c")
+    post.categories.append(category)
+    storage.new(post)
+    storage.save()
+    assert category.post_count == 1
+    assert counts(Category, category.id, 'post_count') == 1
+    assert storage.bulk_insert(Post, [
+        {'user_id': user_id, 'title': "t", 'content': "c"}
+        for _ in range(3)]) == 3
+    assert counts('User', user_id, 'post_count') == 4
+    post = storage.get(Post, post.id)
+    post.categories.clear()
+    storage.save()
+    assert counts(Category, category.id, 'post_count') == 0
+
+
+def test_reconcile_counters(test_client):
+    """
+    Test that reconciliation fixes the counters that drifted, and only them
+    """
+    user_id, headers = sign_up(test_client)
+    response = test_client.post('/api/v1/posts', headers=headers,
+                                json={"title": "t", "content": "c"})
+    post_id = response.get_json()['id']
+    test_client.post(f'/api/v1/posts/{post_id}/comments', headers=headers,
+                     json={"content": "c"})
+    storage.reconcile_counters()
+    db.session.execute(update(Post.__table__).where(
+        Post.__table__.c.id == post_id).values(comment_count=7))
+    db.session.commit()
+    assert counts(Post, post_id, 'comment_count') == 7
+    fixed = storage.reconcile_counters(batch_size=2)
+    assert fixed['Post'] == 1
+    assert fixed['User'] == 0
+    assert counts(Post, post_id, 'comment_count') == 1
+
+
+def test_counters_read_only(test_client):
+    """
+    Test that updates through the API cannot write the counters
+    """
+    user_id, headers = sign_up(test_client)
+    response = test_client.post('/api/v1/posts', headers=headers,
+                                json={"title": "t", "content": "c"})
+    post_id = response.get_json()['id']
+    response = test_client.put(f'/api/v1/users/{user_id}', headers=headers,
+                               json={"follower_count": 999999,
+                                     "post_count": -5})
+    assert response.status_code == 200
+    response = test_client.put(f'/api/v1/posts/{post_id}', headers=headers,
+                               json={"comment_count": 42, "title": "u"})
+    assert response.status_code == 200
+    assert counts('User', user_id, 'post_count') == 1
+    assert counts('User', user_id, 'follower_count') == 0
+    assert counts(Post, post_id, 'comment_count') == 0
+    assert counts(Post, post_id, 'title') == "u"
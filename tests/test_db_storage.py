@@ -0,0 +1,208 @@
+import os
+import sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import pytest
+from uuid import uuid4
+from models import storage
+from models.user import User
+from models.post import Post
+
+
+@pytest.fixture
+def new_user():
+    """
+    Fixture that stores a user and removes it once the test is done.
+    """
+    suffix = uuid4().hex[:8]
+    user = User(email=f"storage_{suffix}@example.com",
+                username=f"storage_{suffix}",
+                password_hash="x")
+    storage.new(user)
+    storage.save()
+    yield user
+    storage.delete(user)
+    storage.save()
+    storage.close()
+
+
+def test_get_by_id(new_user):
+    """
+    Test that get returns the stored object by class and id
+    """
+    assert storage.get(User, new_user.id) is new_user
+    storage.close()
+    user = storage.get(User, new_user.id)
+    assert user is not None
+    assert user.email == new_user.email
+
+
+def test_get_by_class_name(new_user):
+    """
+    Test that get accepts the class name as well as the class
+    """
+    assert storage.get("User", new_user.id).id == new_user.id
+
+
+def test_get_missing():
+    """
+    Test that get returns None for unknown ids, classes and None arguments
+    """
+    assert storage.get(User, str(uuid4())) is None
+    assert storage.get(Post, None) is None
+    assert storage.get(None, str(uuid4())) is None
+    assert storage.get(dict, str(uuid4())) is None
+
+
+def test_count(new_user):
+    """
+    Test that count matches the number of stored objects
+    """
+    users = storage.count(User)
+    assert users >= 1
+    assert storage.count("User") == users
+    assert storage.count() >= users
+    assert storage.count(dict) == 0
+
+
+def test_count_by(new_user):
+    """
+    Test grouped counts on a column and on a many-to-many relationship
+    """
+    from models.category import Category
+    posts = [Post(user_id=new_user.id, title=f"post {i}", content="c")
+             for i in range(3)]
+    category = Category(name=f"count_by_{uuid4().hex[:8]}")
+    posts[0].categories.append(category)
+    posts[1].categories.append(category)
+    for obj in posts + [category]:
+        storage.new(obj)
+    storage.save()
+    missing = str(uuid4())
+    assert storage.count_by(Post, 'user_id', [new_user.id, missing]) == {
+        new_user.id: 3, missing: 0}
+    assert storage.count_by(Post, 'categories', [category.id]) == {
+        category.id: 2}
+    assert storage.count_by(Post, 'user_id')[new_user.id] == 3
+    with pytest.raises(ValueError):
+        storage.count_by(Post, 'author')
+    for post in posts:
+        post.categories.clear()
+        storage.delete(post)
+    storage.delete(category)
+    storage.save()
+
+
+def test_paginate(new_user):
+    """
+    Test that walking the cursors visits every object exactly once, in order
+    """
+    from models.comment import Comment
+    post = Post(user_id=new_user.id, title="paginated", content="c")
+    storage.new(post)
+    comments = [Comment(post_id=post.id, user_id=new_user.id, content=str(i))
+                for i in range(7)]
+    for comment in comments:
+        storage.new(comment)
+    storage.save()
+    seen, after = [], None
+    while True:
+        page, after = storage.paginate(Comment, 3, after, post_id=post.id)
+        assert len(page) <= 3
+        seen.extend(comment.id for comment in page)
+        if after is None:
+            break
+    expected = sorted(comments, key=lambda c: (c.created_at, c.id))
+    assert seen == [comment.id for comment in expected]
+    with pytest.raises(ValueError):
+        storage.paginate(Comment, 3, "not-a-cursor")
+    for comment in comments:
+        storage.delete(comment)
+    storage.delete(post)
+    storage.save()
+
+
+def test_stream(new_user):
+    """
+    Test that stream yields every matching object in bounded batches
+    """
+    posts = [Post(user_id=new_user.id, title=f"streamed {i}", content="c")
+             for i in range(5)]
+    for post in posts:
+        storage.new(post)
+    storage.save()
+    batches = list(storage.stream(Post, 2, user_id=new_user.id))
+    assert all(len(batch) <= 2 for batch in batches)
+    streamed = [post.id for batch in batches for post in batch]
+    assert sorted(streamed) == sorted(post.id for post in posts)
+    for post in posts:
+        storage.delete(post)
+    storage.save()
+
+
+def test_pool_stats():
+    """
+    Test that the shared pool reports checkouts and utilization
+    """
+    before = storage.pool_stats()
+    storage.close()
+    storage.count(User)
+    stats = storage.pool_stats()
+    assert stats['checkouts'] > before['checkouts']
+    assert 0.0 <= stats['utilization'] <= 1.0
+    assert stats['wait_max'] >= stats['wait_avg'] >= 0.0
+
+
+def test_bulk_insert(new_user):
+    """
+    Test that bulk_insert writes model and association rows in chunks and
+    drops the cached pages of the classes involved
+    """
+    from models.category import Category
+    posts = ({'user_id': new_user.id, 'title': f"bulk {i}", 'content': "c"}
+             for i in range(5))
+    assert storage.bulk_insert(Post, posts, chunk_size=2) == 5
+    page, _ = storage.paginate(Post, 100, user_id=new_user.id)
+    assert len(page) == 5
+    assert all(post.id and post.created_at for post in page)
+    category = Category(name=f"bulk_{uuid4().hex[:8]}")
+    storage.new(category)
+    storage.save()
+    page, _ = storage.paginate(Post, 100, user_id=new_user.id)
+    links = [{'post_id': post.id, 'category_id': category.id}
+             for post in page]
+    assert storage.bulk_insert('post_categories', links) == 5
+    assert storage.count_by(Post, 'categories', [category.id]) == {
+        category.id: 5}
+    storage.bulk_insert(Post, [{'user_id': new_user.id, 'title': "bulk 5",
+                                'content': "c"}])
+    page, _ = storage.paginate(Post, 100, user_id=new_user.id)
+    assert len(page) == 6
+    with pytest.raises(ValueError):
+        storage.bulk_insert('no_such_table', [])
+    storage.close()
+    for post in storage.paginate(Post, 100, user_id=new_user.id)[0]:
+        post.categories.clear()
+        storage.delete(post)
+    storage.delete(storage.get(Category, category.id))
+    storage.save()
+
+
+def test_timestamp_defaults():
+    """
+    Test that rows inserted without timestamps get the time of the insert,
+    not the time the models were imported
+    """
+    from datetime import datetime, timedelta
+    from sqlalchemy import delete, insert, select
+    from models.base_model import db
+    from models.category import Category
+    name = f"stamped_{uuid4().hex[:8]}"
+    start = datetime.utcnow() - timedelta(seconds=1)
+    db.session.execute(insert(Category).values(id=str(uuid4()), name=name))
+    stamps = db.session.execute(
+        select(Category.created_at, Category.updated_at)
+        .where(Category.name == name)).one()
+    assert all(stamp >= start for stamp in stamps)
+    db.session.execute(delete(Category).where(Category.name == name))
+    storage.save()
+    storage.close()
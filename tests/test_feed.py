@@ -0,0 +1,233 @@
+import os
+import sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import pytest
+from uuid import uuid4
+from sqlalchemy import event, select
+from sqlalchemy.engine import Engine
+from models import storage
+from models.base_model import db
+from models.category import Category
+from models.follow import Follow, feed_items
+from models.engine.feed import Feed
+from api.v1.app import app
+
+
+@pytest.fixture(scope='module')
+def test_client():
+    flask_app = app
+    flask_app.config['TESTING'] = True
+    with flask_app.test_client() as testing_client:
+        yield testing_client
+
+
+def sign_up(test_client):
+    """
+    Signs up a user and returns its id and authorization header.
+    """
+    suffix = uuid4().hex[:8]
+    credentials = {"email": f"feed_{suffix}@example.com", "password": "pwd"}
+    response = test_client.post('/api/v1/signup',
+                                json={**credentials,
+                                      "username": f"feed_{suffix}"})
+    user_id = response.get_json()['id']
+    response = test_client.post('/api/v1/login', json=credentials)
+    token = response.get_json()['access_token']
+    return user_id, {"Authorization": f"Bearer {token}"}
+
+
+def feed_ids(test_client, headers, **args):
+    """Returns the ids of the posts in the feed."""
+    response = test_client.get('/api/v1/feed', headers=headers,
+                               query_string=args)
+    assert response.status_code == 200
+    return [post['id'] for post in response.get_json()]
+
+
+def create_post(test_client, headers, published=True):
+    """Creates a post and returns its id."""
+    response = test_client.post('/api/v1/posts', headers=headers,
+                                json={"title": "t", "content": "c",
+                                      "published": published})
+    return response.get_json()['id']
+
+
+def test_follow_author(test_client):
+    """
+    Test that published posts of a followed author reach the feed, newest
+    first, and leave it when unpublished or deleted
+    """
+    author_id, author = sign_up(test_client)
+    _, reader = sign_up(test_client)
+    older = create_post(test_client, author)
+    response = test_client.post('/api/v1/follows', headers=reader,
+                                json={"type": "user", "id": author_id})
+    assert response.status_code == 201
+    follow_id = response.get_json()['id']
+    assert feed_ids(test_client, reader) == [older]
+    draft = create_post(test_client, author, published=False)
+    newer = create_post(test_client, author)
+    assert feed_ids(test_client, reader) == [newer, older]
+    response = test_client.get('/api/v1/feed?limit=1', headers=reader)
+    assert [post['id'] for post in response.get_json()] == [newer]
+    assert feed_ids(test_client, reader, limit=1,
+                    after=response.headers['X-Next-Cursor']) == [older]
+    test_client.put(f'/api/v1/posts/{draft}', headers=author,
+                    json={"published": True})
+    assert feed_ids(test_client, reader) == [newer, draft, older]
+    test_client.put(f'/api/v1/posts/{newer}', headers=author,
+                    json={"published": False})
+    test_client.delete(f'/api/v1/posts/{older}', headers=author)
+    assert feed_ids(test_client, reader) == [draft]
+    test_client.delete(f'/api/v1/follows/{follow_id}', headers=reader)
+    assert feed_ids(test_client, reader) == []
+
+
+def test_follow_category(test_client):
+    """
+    Test that a post reaches the followers of a category it is assigned to
+    """
+    _, author = sign_up(test_client)
+    _, reader = sign_up(test_client)
+    category = Category(name=f"feed_{uuid4().hex[:8]}")
+    storage.new(category)
+    storage.save()
+    response = test_client.post('/api/v1/follows', headers=reader,
+                                json={"type": "category", "id": category.id})
+    assert response.status_code == 201
+    post_id = create_post(test_client, author)
+    assert feed_ids(test_client, reader) == []
+    test_client.post(f'/api/v1/posts/{post_id}/categories/{category.id}',
+                     headers=author)
+    assert feed_ids(test_client, reader) == [post_id]
+
+
+def test_follow_validation(test_client):
+    """
+    Test that unknown targets and self follows are rejected
+    """
+    user_id, headers = sign_up(test_client)
+    response = test_client.post('/api/v1/follows', headers=headers,
+                                json={"type": "user", "id": user_id})
+    assert response.status_code == 400
+    response = test_client.post('/api/v1/follows', headers=headers,
+                                json={"type": "tag", "id": str(uuid4())})
+    assert response.status_code == 404
+    response = test_client.post('/api/v1/follows', headers=headers,
+                                json={"type": "planet", "id": "x"})
+    assert response.status_code == 400
+
+
+def test_popular_author_read_fallback(test_client):
+    """
+    Test that the posts of authors above the fan-out limit are merged in
+    at read time instead of being pushed
+    """
+    author_id, author = sign_up(test_client)
+    reader_id, reader = sign_up(test_client)
+    test_client.post('/api/v1/follows', headers=reader,
+                     json={"type": "user", "id": author_id})
+    storage.close()
+    assert storage.get('User', author_id).follower_count == 1
+    feed = Feed(fanout_limit=0)
+    post = storage.get('Post', create_post(test_client, author,
+                                           published=False))
+    post.published = True
+    feed.publish(db.session(), post)
+    storage.save()
+    assert feed.popular_authors(db.session(), [author_id]) == {author_id}
+    assert feed.read(db.session(), reader_id, 10) == [
+        (post.id, post.created_at)]
+    assert feed_ids(test_client, reader) == []
+
+
+def test_feed_cap(test_client):
+    """
+    Test that feeds keep their newest entries, both when backfilled and
+    when trimmed by the periodic job
+    """
+    author_id, author = sign_up(test_client)
+    reader_id, reader = sign_up(test_client)
+    posts = [create_post(test_client, author) for _ in range(3)]
+    response = test_client.post('/api/v1/follows', headers=reader,
+                                json={"type": "user", "id": author_id})
+    assert response.status_code == 201
+    oldest = storage.get('Post', posts[0])
+    feed = Feed(max_items=2)
+    feed.rebuild(db.session(), reader_id)
+    storage.save()
+    assert [id for id, _ in feed.read(db.session(), reader_id, 10)] == [
+        posts[2], posts[1]]
+    db.session.execute(feed_items.insert().values(
+        user_id=reader_id, post_id=oldest.id,
+        created_at=oldest.created_at))
+    storage.save()
+    assert feed.trim_all(db.session()) >= 1
+    assert [id for id, _ in feed.read(db.session(), reader_id, 10)] == [
+        posts[2], posts[1]]
+
+
+def test_unfollow_keeps_other_sources(test_client):
+    """
+    Test that unfollowing removes only the posts of the source that no
+    other followed source brings, without refilling the feed
+    """
+    author_id, author = sign_up(test_client)
+    _, reader = sign_up(test_client)
+    category = Category(name=f"feed_{uuid4().hex[:8]}")
+    storage.new(category)
+    storage.save()
+    shared = create_post(test_client, author)
+    test_client.post(f'/api/v1/posts/{shared}/categories/{category.id}',
+                     headers=author)
+    only = create_post(test_client, author)
+    test_client.post('/api/v1/follows', headers=reader,
+                     json={"type": "category", "id": category.id})
+    response = test_client.post('/api/v1/follows', headers=reader,
+                                json={"type": "user", "id": author_id})
+    follow_id = response.get_json()['id']
+    assert feed_ids(test_client, reader) == [only, shared]
+    statements = []
+
+    def record(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    event.listen(Engine, 'before_cursor_execute', record)
+    try:
+        response = test_client.delete(f'/api/v1/follows/{follow_id}',
+                                      headers=reader)
+    finally:
+        event.remove(Engine, 'before_cursor_execute', record)
+    assert response.status_code == 200
+    assert not [statement for statement in statements
+                if 'INSERT INTO feed_items' in statement]
+    assert feed_ids(test_client, reader) == [shared]
+
+
+def test_delete_user_with_follows(test_client):
+    """
+    Test that a user who follows and is followed can be deleted, along
+    with their follows and feed, and that follower counts follow
+    """
+    author_id, author = sign_up(test_client)
+    user_id, user = sign_up(test_client)
+    _, reader = sign_up(test_client)
+    create_post(test_client, author)
+    test_client.post('/api/v1/follows', headers=user,
+                     json={"type": "user", "id": author_id})
+    test_client.post('/api/v1/follows', headers=reader,
+                     json={"type": "user", "id": user_id})
+    post_id = create_post(test_client, user)
+    assert feed_ids(test_client, reader) == [post_id]
+    storage.close()
+    assert storage.get('User', author_id).follower_count == 1
+    response = test_client.delete(f'/api/v1/users/{user_id}', headers=user)
+    assert response.status_code == 200
+    storage.close()
+    assert storage.get('User', author_id).follower_count == 0
+    assert db.session.scalars(select(Follow.id).where(
+        (Follow.follower_id == user_id) | (Follow.target_id == user_id))
+        ).all() == []
+    assert db.session.scalars(select(feed_items.c.post_id).where(
+        feed_items.c.user_id == user_id)).all() == []
+    assert feed_ids(test_client, reader) == []
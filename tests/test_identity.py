@@ -0,0 +1,152 @@
+import os
+import sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import pytest
+from uuid import uuid4
+from flask_jwt_extended import decode_token
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from api.v1.app import app
+
+
+@pytest.fixture(scope='module')
+def test_client():
+    flask_app = app
+    flask_app.config['TESTING'] = True
+    with flask_app.test_client() as testing_client:
+        yield testing_client
+
+
+def sign_up(test_client):
+    """
+    Signs up a user and returns its id, credentials and token.
+    """
+    suffix = uuid4().hex[:8]
+    credentials = {"email": f"jwt_{suffix}@example.com", "password": "pwd"}
+    response = test_client.post('/api/v1/signup',
+                                json={**credentials,
+                                      "username": f"jwt_{suffix}"})
+    user_id = response.get_json()['id']
+    response = test_client.post('/api/v1/login', json=credentials)
+    return user_id, credentials, response.get_json()['access_token']
+
+
+def test_token_claims(test_client):
+    """
+    Test that the token carries the user id and username
+    """
+    user_id, credentials, token = sign_up(test_client)
+    with app.app_context():
+        payload = decode_token(token)
+    assert payload['sub'] == user_id
+    assert payload['username'] == credentials['email'].replace(
+        '@example.com', '')
+
+
+def test_narrow_user_query(test_client):
+    """
+    Test that reading posts does not load the calling user, only its
+    token revocation time
+    """
+    _, _, token = sign_up(test_client)
+    statements = []
+
+    def record(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    event.listen(Engine, 'before_cursor_execute', record)
+    try:
+        response = test_client.get(
+            '/api/v1/posts', headers={"Authorization": f"Bearer {token}"})
+    finally:
+        event.remove(Engine, 'before_cursor_execute', record)
+    assert response.status_code == 200
+    users = [statement for statement in statements if 'FROM users' in statement]
+    assert len(users) == 1
+    assert users[0].startswith('SELECT users.tokens_revoked_at \nFROM users')
+
+
+def test_deleted_user_token_revoked(test_client):
+    """
+    Test that the tokens of a deleted user are rejected
+    """
+    user_id, _, token = sign_up(test_client)
+    headers = {"Authorization": f"Bearer {token}"}
+    response = test_client.delete(f'/api/v1/users/{user_id}', headers=headers)
+    assert response.status_code == 200
+    response = test_client.get('/api/v1/posts', headers=headers)
+    assert response.status_code == 401
+
+
+def test_credentials_change_revokes_tokens(test_client):
+    """
+    Test that changing the username revokes the previous tokens only
+    """
+    user_id, credentials, token = sign_up(test_client)
+    headers = {"Authorization": f"Bearer {token}"}
+    response = test_client.put(f'/api/v1/users/{user_id}', headers=headers,
+                               json={"username": f"renamed_{user_id[:8]}"})
+    assert response.status_code == 200
+    response = test_client.get('/api/v1/posts', headers=headers)
+    assert response.status_code == 401
+    response = test_client.post('/api/v1/login', json=credentials)
+    token = response.get_json()['access_token']
+    response = test_client.get('/api/v1/posts',
+                               headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 200
+
+
+def test_deleted_user_cannot_write(test_client):
+    """
+    Test that a token outliving its user is rejected by write endpoints
+    instead of failing on the missing user row
+    """
+    from models import storage
+    from models.user import User
+    user_id, _, token = sign_up(test_client)
+    storage.delete(storage.get(User, user_id))
+    storage.save()
+    storage.close()
+    response = test_client.post('/api/v1/posts',
+                                headers={"Authorization": f"Bearer {token}"},
+                                json={"title": "t", "content": "c"})
+    assert response.status_code == 401
+
+
+def test_revocation_time_cached(test_client):
+    """
+    Test that with the object cache on, protected requests stop querying
+    the revocation time, and that a revocation is still seen at once
+    """
+    from models import storage
+    from models.engine.cache import LRUCache, ObjectCache
+    user_id, _, token = sign_up(test_client)
+    headers = {"Authorization": f"Bearer {token}"}
+    previous = storage.use_cache(ObjectCache(LRUCache(100, 60)))
+    statements = []
+
+    def record(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    event.listen(Engine, 'before_cursor_execute', record)
+    try:
+        counts = []
+        for _ in range(2):
+            del statements[:]
+            response = test_client.get('/api/v1/posts', headers=headers)
+            assert response.status_code == 200
+            counts.append(len([statement for statement in statements
+                               if 'tokens_revoked_at' in statement]))
+        response = test_client.put(f'/api/v1/users/{user_id}',
+                                   headers=headers,
+                                   json={"username": f"cached_{user_id[:8]}"})
+        assert response.status_code == 200
+        del statements[:]
+        response = test_client.get('/api/v1/posts', headers=headers)
+    finally:
+        event.remove(Engine, 'before_cursor_execute', record)
+        storage.use_cache(previous)
+    assert counts == [1, 0]
+    assert response.status_code == 401
+    assert not [statement for statement in statements
+                if 'tokens_revoked_at' in statement]
@@ -0,0 +1,138 @@
+import os
+import sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import pytest
+from uuid import uuid4
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from models import storage
+from models.user import User
+from models.post import Post
+from models.comment import Comment
+from models.category import Category
+from models.tag import Tag
+
+
+@pytest.fixture(scope='module')
+def author():
+    """
+    Fixture that stores an author with posts, each having comments,
+    categories and tags. The object cache is disabled so that every
+    statement reaches the database.
+    """
+    cache = storage.use_cache(None)
+    suffix = uuid4().hex[:8]
+    user = User(email=f"profiles_{suffix}@example.com",
+                username=f"profiles_{suffix}",
+                password_hash="x")
+    category = Category(name=f"profiles_{suffix}")
+    tag = Tag(name=f"profiles_{suffix}")
+    storage.new(user)
+    storage.new(category)
+    storage.new(tag)
+    for i in range(5):
+        post = Post(user_id=user.id, title=f"post {i}", content="c")
+        post.categories.append(category)
+        post.tags.append(tag)
+        storage.new(post)
+        storage.new(Comment(post_id=post.id, user_id=user.id, content="c"))
+    storage.save()
+    storage.close()
+    yield user
+    for post in storage.paginate(Post, 10, user_id=user.id)[0]:
+        post.categories.clear()
+        post.tags.clear()
+        for comment in post.comments:
+            storage.delete(comment)
+        storage.delete(post)
+    storage.delete(storage.get(Category, category.id))
+    storage.delete(storage.get(Tag, tag.id))
+    storage.delete(storage.get(User, user.id))
+    storage.save()
+    storage.close()
+    storage.use_cache(cache)
+
+
+class StatementCounter:
+    """Counts the SQL statements sent to the database"""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, *args):
+        self.count += 1
+
+    def __enter__(self):
+        event.listen(Engine, 'before_cursor_execute', self)
+        return self
+
+    def __exit__(self, *args):
+        event.remove(Engine, 'before_cursor_execute', self)
+
+
+@pytest.mark.parametrize('expand, statements', [
+    ((), 1),
+    (('author',), 1),
+    (('comments',), 2),
+    (('categories',), 2),
+    (('tags',), 2),
+    (('author', 'categories', 'tags'), 3),
+    (('author', 'comments', 'categories', 'tags'), 4),
+])
+def test_paginate_statement_count(author, expand, statements):
+    """
+    Test that each loading profile costs a fixed number of statements,
+    including when the expanded relationships are read afterwards
+    """
+    storage.close()
+    with StatementCounter() as counter:
+        posts, _ = storage.paginate(Post, 10, expand=expand,
+                                    user_id=author.id)
+        for post in posts:
+            for name in expand:
+                getattr(post, name)
+    storage.close()
+    assert len(posts) == 5
+    assert counter.count == statements
+
+
+def test_get_statement_count(author):
+    """
+    Test that a post fetched with every profile needs no further query
+    """
+    post_id = storage.paginate(Post, 1, user_id=author.id)[0][0].id
+    storage.close()
+    with StatementCounter() as counter:
+        post = storage.get(Post, post_id,
+                           expand=('author', 'categories', 'tags'))
+        assert post.author.id == author.id
+        assert len(post.categories) == 1
+        assert len(post.tags) == 1
+    storage.close()
+    assert counter.count == 3
+
+
+def test_get_applies_profiles_to_loaded_object(author):
+    """
+    Test that a post already in the session gets the relationships of the
+    profiles loaded when fetched again with them
+    """
+    post_id = storage.paginate(Post, 1, user_id=author.id)[0][0].id
+    storage.close()
+    loaded = storage.get(Post, post_id)
+    post = storage.get(Post, post_id, expand=('author', 'tags'))
+    assert post is loaded
+    assert 'author' in post.__dict__ and 'tags' in post.__dict__
+    with StatementCounter() as counter:
+        assert post.author.id == author.id
+        assert len(post.tags) == 1
+    storage.close()
+    assert counter.count == 0
+
+
+def test_unknown_profile():
+    """
+    Test that an unknown profile name is rejected
+    """
+    with pytest.raises(ValueError):
+        storage.paginate(Post, 10, expand=('password',))
@@ -0,0 +1,107 @@
+import os
+import sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import re
+import threading
+import pytest
+from uuid import uuid4
+from api.v1.app import app
+from api.v1.metrics import Exposition
+
+
+@pytest.fixture(scope='module')
+def test_client():
+    flask_app = app
+    flask_app.config['TESTING'] = True
+    with flask_app.test_client() as testing_client:
+        yield testing_client
+
+
+@pytest.fixture(scope='module')
+def auth_headers(test_client):
+    """
+    Fixture that signs up a user and returns its authorization header.
+    """
+    suffix = uuid4().hex[:8]
+    credentials = {"email": f"met_{suffix}@example.com", "password": "pwd"}
+    test_client.post('/api/v1/signup',
+                     json={**credentials, "username": f"met_{suffix}"})
+    response = test_client.post('/api/v1/login', json=credentials)
+    token = response.get_json()['access_token']
+    return {"Authorization": f"Bearer {token}"}
+
+
+def sample(text, name, **labels):
+    """Returns the value of the sample `name` with `labels`, or None."""
+    for line in text.splitlines():
+        match = re.fullmatch(r'(\w+)(?:\{(.*)\})? (\S+)', line)
+        if not match or match.group(1) != name:
+            continue
+        found = dict(re.findall(r'(\w+)="((?:[^"\\]|\\.)*)"',
+                                match.group(2) or ''))
+        if found == {key: str(value) for key, value in labels.items()}:
+            return float(match.group(3))
+    return None
+
+
+def test_exposition_format():
+    """
+    Test that families are written with their type, escaped labels and
+    cumulative histogram buckets
+    """
+    out = Exposition()
+    out.add('things_total', 'counter', 'Things.', [({'name': 'a"b'}, 3)])
+    out.add_histogram('latency_seconds', 'Latency.', [(
+        {'endpoint': 'x'},
+        {'buckets': [(0.1, 1), (float('inf'), 2)], 'count': 2, 'sum': 0.5})])
+    assert out.render().splitlines() == [
+        '# HELP wordflow_things_total Things.',
+        '# TYPE wordflow_things_total counter',
+        'wordflow_things_total{name="a\\"b"} 3',
+        '# HELP wordflow_latency_seconds Latency.',
+        '# TYPE wordflow_latency_seconds histogram',
+        'wordflow_latency_seconds_bucket{endpoint="x",le="0.1"} 1',
+        'wordflow_latency_seconds_bucket{endpoint="x",le="+Inf"} 2',
+        'wordflow_latency_seconds_sum{endpoint="x"} 0.5',
+        'wordflow_latency_seconds_count{endpoint="x"} 2',
+    ]
+
+
+def test_request_metrics(test_client, auth_headers):
+    """
+    Test that responses and latencies are counted by endpoint, across
+    threads, and that the other subsystems are reported
+    """
+    before = test_client.get('/metrics').data.decode()
+    name = 'wordflow_http_responses_total'
+    labels = {'endpoint': 'app_views.getAllPosts', 'method': 'GET',
+              'status': 200}
+    start = sample(before, name, **labels) or 0
+
+    def fetch():
+        with app.test_client() as client:
+            client.get('/api/v1/posts?limit=1', headers=auth_headers)
+
+    threads = [threading.Thread(target=fetch) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    test_client.get('/api/v1/posts?limit=1', headers=auth_headers)
+    test_client.get('/api/v1/nowhere')
+    response = test_client.get('/metrics')
+    assert response.status_code == 200
+    assert response.content_type.startswith('text/plain')
+    text = response.data.decode()
+    assert sample(text, name, **labels) == start + 5
+    assert sample(text, name, endpoint='unmatched', method='GET',
+                  status=404) >= 1
+    assert sample(text, 'wordflow_http_request_duration_seconds_count',
+                  endpoint='app_views.getAllPosts') >= 5
+    assert sample(text, 'wordflow_http_requests_in_flight',
+                  endpoint='app_views.getAllPosts') == 0
+    assert sample(text, 'wordflow_http_requests_in_flight',
+                  endpoint='metrics') == 1
+    assert sample(text, 'wordflow_bcrypt_queue_depth') == 0
+    assert sample(text, 'wordflow_db_pool_checkouts_total') >= 1
+    assert '# TYPE wordflow_compression_responses_total counter' in text
@@ -0,0 +1,136 @@
+import os
+import sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import threading
+import time
+import pytest
+from uuid import uuid4
+from models import storage
+from models.user import User
+from api.v1 import hasher
+from api.v1.app import app
+from api.v1.passwords import HasherBusy, PasswordHasher
+
+
+@pytest.fixture
+def pool_hasher():
+    """
+    Fixture providing a hasher with one worker process and a cheap work
+    factor.
+    """
+    pool_hasher = PasswordHasher(rounds=4, workers=1, max_queue=1)
+    yield pool_hasher
+    pool_hasher.shutdown()
+
+
+def test_hash_and_verify(pool_hasher):
+    """
+    Test that hashes made in the pool verify and carry the work factor
+    """
+    pw_hash = pool_hasher.hash("secret")
+    assert pw_hash.startswith("$2b$04$")
+    assert pool_hasher.verify(pw_hash, "secret")
+    assert not pool_hasher.verify(pw_hash, "wrong")
+    assert not pool_hasher.needs_rehash(pw_hash)
+    pool_hasher.configure(rounds=5, workers=1, max_queue=1)
+    assert pool_hasher.needs_rehash(pw_hash)
+
+
+def test_queue_full(pool_hasher):
+    """
+    Test that operations beyond the queue limit are rejected
+    """
+    pool_hasher.configure(rounds=14, workers=1, max_queue=1)
+    worker = threading.Thread(target=pool_hasher.hash, args=("slow",))
+    worker.start()
+    while pool_hasher.queue_depth == 0:
+        time.sleep(0.001)
+    with pytest.raises(HasherBusy):
+        pool_hasher.hash("rejected")
+    worker.join()
+    assert pool_hasher.queue_depth == 0
+
+
+def test_busy_response():
+    """
+    Test that a login is answered with 503 and Retry-After while the
+    queue is full
+    """
+    settings = (hasher.rounds, hasher.workers, hasher.max_queue,
+                hasher.retry_after)
+    client = app.test_client()
+    suffix = uuid4().hex[:8]
+    credentials = {"email": f"busy_{suffix}@example.com", "password": "pwd"}
+    try:
+        hasher.configure(rounds=4, workers=0)
+        client.post('/api/v1/signup', json={
+            **credentials, "username": f"busy_{suffix}"})
+        hasher.configure(rounds=14, workers=0, max_queue=1, retry_after=7)
+        worker = threading.Thread(target=hasher.hash, args=("slow",))
+        worker.start()
+        while hasher.queue_depth == 0:
+            time.sleep(0.001)
+        response = client.post('/api/v1/login', json=credentials)
+        worker.join()
+    finally:
+        hasher.configure(*settings)
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '7'
+
+
+def test_login_upgrades_hash():
+    """
+    Test that logging in rehashes a password made with another work factor
+    """
+    settings = (hasher.rounds, hasher.workers, hasher.max_queue,
+                hasher.retry_after)
+    client = app.test_client()
+    suffix = uuid4().hex[:8]
+    credentials = {"email": f"rehash_{suffix}@example.com", "password": "pwd"}
+    try:
+        hasher.configure(rounds=4, workers=0)
+        response = client.post('/api/v1/signup', json={
+            **credentials, "username": f"rehash_{suffix}"})
+        user_id = response.get_json()['id']
+        hasher.configure(rounds=5, workers=0)
+        assert client.post('/api/v1/login', json=credentials).status_code == 200
+    finally:
+        hasher.configure(*settings)
+    user = storage.get(User, user_id)
+    assert user.password_hash.startswith("$2b$05$")
+    storage.delete(user)
+    storage.save()
+    storage.close()
+
+
+def test_login_survives_busy_rehash(monkeypatch):
+    """
+    Test that a login whose rehash finds the queue full still succeeds,
+    keeping the old hash
+    """
+    settings = (hasher.rounds, hasher.workers, hasher.max_queue,
+                hasher.retry_after)
+    client = app.test_client()
+    suffix = uuid4().hex[:8]
+    credentials = {"email": f"busy_{suffix}@example.com", "password": "pwd"}
+
+    def busy(password):
+        raise HasherBusy(1)
+
+    try:
+        hasher.configure(rounds=4, workers=0)
+        response = client.post('/api/v1/signup', json={
+            **credentials, "username": f"busy_{suffix}"})
+        user_id = response.get_json()['id']
+        hasher.configure(rounds=5, workers=0)
+        monkeypatch.setattr(hasher, 'hash', busy)
+        assert client.post('/api/v1/login', json=credentials).status_code == 200
+    finally:
+        monkeypatch.undo()
+        hasher.configure(*settings)
+    storage.close()
+    user = storage.get(User, user_id)
+    assert user.password_hash.startswith("$2b$04$")
+    storage.delete(user)
+    storage.save()
+    storage.close()
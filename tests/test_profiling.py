@@ -0,0 +1,102 @@
+import os
+import sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import logging
+import re
+import pytest
+from uuid import uuid4
+from api.v1 import profiler
+from api.v1.app import app
+from api.v1.profiling import Histogram
+
+
+@pytest.fixture(scope='module')
+def test_client():
+    flask_app = app
+    flask_app.config['TESTING'] = True
+    with flask_app.test_client() as testing_client:
+        yield testing_client
+
+
+@pytest.fixture(scope='module')
+def auth_headers(test_client):
+    """
+    Fixture that signs up a user and returns its authorization header.
+    """
+    suffix = uuid4().hex[:8]
+    credentials = {"email": f"prof_{suffix}@example.com", "password": "pwd"}
+    test_client.post('/api/v1/signup',
+                     json={**credentials, "username": f"prof_{suffix}"})
+    response = test_client.post('/api/v1/login', json=credentials)
+    token = response.get_json()['access_token']
+    return {"Authorization": f"Bearer {token}"}
+
+
+@pytest.fixture
+def profiling():
+    """Fixture that profiles every request during a test."""
+    sample, slow_ms = profiler.sample, profiler.slow_ms
+    profiler.reset()
+    profiler.configure(sample=1.0)
+    yield profiler
+    profiler.configure(sample=sample, slow_ms=slow_ms)
+    profiler.reset()
+
+
+def test_histogram_buckets():
+    """
+    Test that observations land in the first bucket bounding them and
+    that the snapshot is cumulative
+    """
+    histogram = Histogram((1, 5))
+    for value in (0, 1, 3, 9):
+        histogram.observe(value)
+    assert histogram.snapshot() == {
+        'buckets': [(1, 2), (5, 3), (float('inf'), 4)],
+        'count': 4, 'sum': 13}
+
+
+def test_server_timing_and_stats(test_client, auth_headers, profiling):
+    """
+    Test that profiled requests report their statements in Server-Timing
+    and are aggregated by endpoint
+    """
+    response = test_client.post('/api/v1/posts', headers=auth_headers,
+                                json={"title": "p", "content": "c"})
+    post_id = response.get_json()['id']
+    response = test_client.get(f'/api/v1/posts/{post_id}',
+                               headers=auth_headers)
+    match = re.fullmatch(r'db;dur=([\d.]+);desc="(\d+) queries"',
+                         response.headers['Server-Timing'])
+    assert match and int(match.group(2)) >= 1
+    stats = profiler.stats()['app_views.getPostById']
+    assert stats['queries']['count'] == 1
+    assert stats['queries']['sum'] == int(match.group(2))
+    assert stats['db_time']['buckets'][-1][1] == 1
+    assert stats['slowest'] and all(
+        isinstance(statement, str) for _, statement in stats['slowest'])
+
+
+def test_slow_queries_logged(test_client, auth_headers, profiling, caplog):
+    """
+    Test that statements over the threshold are logged with the endpoint
+    """
+    profiler.configure(slow_ms=0)
+    with caplog.at_level(logging.WARNING, logger='api.v1.profiling'):
+        test_client.get('/api/v1/posts?limit=1', headers=auth_headers)
+    assert any('app_views.getAllPosts' in record.getMessage()
+               for record in caplog.records)
+
+
+def test_disabled(test_client, auth_headers):
+    """
+    Test that requests are not profiled when sampling is off
+    """
+    sample = profiler.sample
+    profiler.configure(sample=0)
+    try:
+        response = test_client.get('/api/v1/posts?limit=1',
+                                   headers=auth_headers)
+    finally:
+        profiler.configure(sample=sample)
+    assert 'Server-Timing' not in response.headers
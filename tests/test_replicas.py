@@ -0,0 +1,186 @@
+import os
+import sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import time
+import pytest
+from uuid import uuid4
+from sqlalchemy import create_engine, delete
+from models import storage
+from models.base_model import db
+from models.category import Category
+from models.user import User
+from models.engine.cache import LRUCache, ObjectCache
+from models.engine.db_storage import DBStorage
+from models.engine.replicas import ReplicaRouter
+from api.v1.app import app
+
+
+@pytest.fixture
+def replicated(tmp_path):
+    """
+    Fixture that returns a storage on the test database with an empty
+    SQLite replica, which never receives the writes of the primary, so
+    the origin of each read is visible. The object cache is disabled.
+    """
+    url = 'sqlite:///{}'.format(tmp_path / 'replica.db')
+    engine = create_engine(url)
+    db.metadata.create_all(engine)
+    engine.dispose()
+    previous = db.session
+    storage = DBStorage(replicas=[url])
+    storage.reload()
+    storage.use_cache(None)
+    yield storage
+    storage.close()
+    storage.stop_replicas()
+    db.session = previous
+
+
+def written(storage):
+    """
+    Stores a category on behalf of a new client and returns its id and
+    the write marker handed back to the client.
+    """
+    storage.bind_client(None)
+    category = Category(name=f"replica_{uuid4().hex[:8]}")
+    storage.new(category)
+    storage.save()
+    storage.close()
+    return category.id, storage.last_write()
+
+
+def test_reads_go_to_replica(replicated):
+    """
+    Test that reads go to the replica, and to the primary for the rest of
+    a session that has written
+    """
+    category_id, _ = written(replicated)
+    replicated.bind_client(None)
+    assert replicated.get(Category, category_id) is None
+    assert replicated.count(Category) == 0
+    replicated.close()
+    replicated.new(Category(name=f"replica_{uuid4().hex[:8]}"))
+    replicated.save()
+    assert replicated.get(Category, category_id) is not None
+    replicated.close()
+    stats = list(replicated.replica_stats().values())[0]
+    assert stats['healthy'] and stats['reads'] >= 1
+
+
+def test_read_your_writes(replicated):
+    """
+    Test that a client reads from the primary right after its writes,
+    while other clients still read from the replica without caching
+    """
+    category_id, marker = written(replicated)
+    assert marker is not None
+    replicated.bind_client(marker)
+    assert replicated.get(Category, category_id) is not None
+    replicated.close()
+    replicated.bind_client(None)
+    assert replicated.get(Category, category_id) is None
+    assert db.session().info.get('wordflow_stale')
+    cache = ObjectCache(LRUCache())
+    assert not cache.shareable(db.session())
+    replicated.close()
+
+
+def test_revocations_read_on_primary(replicated):
+    """
+    Test that token revocation times are read from the primary, whatever
+    the replica holds
+    """
+    replicated.bind_client(None)
+    suffix = uuid4().hex[:8]
+    user = User(email=f"replica_{suffix}@example.com",
+                username=f"replica_{suffix}", password_hash="x")
+    replicated.new(user)
+    replicated.save()
+    replicated.close()
+    replicated.bind_client(None)
+    assert replicated.tokens_revoked_at(user.id) == (True, None)
+    assert replicated.get(User, user.id) is None
+    replicated.close()
+    db.session.execute(delete(User).where(User.id == user.id))
+    replicated.save()
+    assert replicated.tokens_revoked_at(user.id) == (False, None)
+    replicated.close()
+
+
+def test_replica_reads_profiled(replicated):
+    """
+    Test that the statements run on a replica count in the profile of the
+    request
+    """
+    from api.v1 import profiler
+    category_id, _ = written(replicated)
+    sample = profiler.sample
+    profiler.configure(sample=1.0)
+    try:
+        with app.test_request_context('/api/v1/status'):
+            app.preprocess_request()
+            replicated.bind_client(None)
+            assert replicated.get(Category, category_id) is None
+            response = app.process_response(app.response_class())
+    finally:
+        profiler.configure(sample=sample)
+        profiler.reset()
+    assert 'desc="1 queries"' in response.headers['Server-Timing']
+
+
+def test_unhealthy_replica(tmp_path):
+    """
+    Test that replicas failing their check get no reads until they pass
+    """
+    good = create_engine('sqlite:///{}'.format(tmp_path / 'good.db'))
+    bad = create_engine('sqlite:///{}'.format(tmp_path / 'missing' / 'x.db'))
+    router = ReplicaRouter([good, bad])
+    assert {router.read_engine() for _ in range(4)} == {good, bad}
+    router.check()
+    assert {router.read_engine() for _ in range(4)} == {good}
+    router.replicas[0].mark_down(None)
+    assert router.read_engine() is None
+    router.check()
+    assert router.read_engine() is good
+    stats = router.stats()
+    assert [figures['healthy'] for figures in stats.values()] == [True, False]
+    router.stop()
+
+
+def test_sticky_window():
+    """
+    Test that a client stays on the primary only for the sticky window
+    after the write it reports
+    """
+    router = ReplicaRouter([], sticky_seconds=0.05)
+    router.bind_client(None)
+    assert not router.sticky() and not router.lagging()
+    assert router.written() is None
+    router.wrote()
+    marker = router.written()
+    assert router.sticky() and router.lagging()
+    router.bind_client(None)
+    assert not router.sticky() and router.written() is None
+    router.bind_client(marker)
+    assert router.sticky()
+    router.bind_client(time.time() + 3600)
+    assert not router.sticky()
+    router.bind_client(marker)
+    time.sleep(0.06)
+    assert not router.sticky() and not router.lagging()
+
+
+def test_write_marker_round_trip(monkeypatch):
+    """
+    Test that the API hands the time of a write back to the client, and
+    binds the next requests to the marker they carry
+    """
+    bound = []
+    monkeypatch.setattr(storage, 'bind_client', bound.append)
+    monkeypatch.setattr(storage, 'last_write', lambda: 1700000000.25)
+    with app.test_client() as client:
+        response = client.get('/api/v1/nowhere')
+        assert response.headers['X-Last-Write'] == '1700000000.25'
+        client.get('/api/v1/nowhere')
+        client.get('/api/v1/nowhere', headers={'X-Last-Write': 'bad'})
+    assert bound == [None, 1700000000.25, None]
@@ -0,0 +1,176 @@
+import os
+import sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import threading
+import time
+import pytest
+from types import SimpleNamespace
+from uuid import uuid4
+from sqlalchemy.exc import OperationalError
+from models.engine.search import (FullTextIndex, MemoryIndex,
+                                  SearchUnavailable, highlight)
+from api.v1.app import app
+
+
+@pytest.fixture(scope='module')
+def test_client():
+    flask_app = app
+    flask_app.config['TESTING'] = True
+    with flask_app.test_client() as testing_client:
+        yield testing_client
+
+
+@pytest.fixture(scope='module')
+def auth_headers(test_client):
+    """
+    Fixture that signs up a user and returns its authorization header.
+    """
+    suffix = uuid4().hex[:8]
+    credentials = {"email": f"search_{suffix}@example.com", "password": "pwd"}
+    test_client.post('/api/v1/signup',
+                     json={**credentials, "username": f"search_{suffix}"})
+    response = test_client.post('/api/v1/login', json=credentials)
+    token = response.get_json()['access_token']
+    return {"Authorization": f"Bearer {token}"}
+
+
+def test_memory_index_ranking():
+    """
+    Test that the index ranks title and repeated matches first and forgets
+    removed posts
+    """
+    index = MemoryIndex()
+    index.add('a', "Gardening tips", "Water the tomatoes in the morning")
+    index.add('b', "Cooking", "Tomatoes and basil, tomatoes and garlic")
+    index.add('c', "Tomatoes", "A short post")
+    index.add('d', "Travel", "Nothing to see here")
+    hits, total = index.search(None, "tomatoes", 10)
+    assert total == 3
+    assert [id for id, _ in hits][0] == 'c'
+    assert 'd' not in [id for id, _ in hits]
+    hits, total = index.search(None, "tomatoes", 1, offset=1)
+    assert len(hits) == 1 and total == 3
+    index.remove('c')
+    index.add('b', "Cooking", "Basil only")
+    hits, total = index.search(None, "tomatoes", 10)
+    assert [id for id, _ in hits] == ['a']
+
+
+def test_memory_index_budget():
+    """
+    Test that a common term only re-ranks the posts of rarer terms once
+    the page is filled
+    """
+    index = MemoryIndex()
+    for i in range(50):
+        index.add(str(i), "common", "common words")
+    index.add('rare', "common", "a rare word")
+    hits, total = index.search(None, "rare common", 1)
+    assert hits[0][0] == 'rare'
+    assert total == 1
+    hits, total = index.search(None, "rare common", 10)
+    assert total == 51
+
+
+def test_memory_index_background_build():
+    """
+    Test that an index being built answers no search, and keeps the posts
+    committed while it reads the others
+    """
+    index = MemoryIndex()
+    index.add('gone', "tomatoes", "")
+    reading = threading.Event()
+    proceed = threading.Event()
+
+    def load():
+        reading.set()
+        proceed.wait(5)
+        yield [SimpleNamespace(id='a', title="tomatoes", content=""),
+               SimpleNamespace(id='gone', title="tomatoes", content="")]
+
+    index.start(load)
+    reading.wait(5)
+    with pytest.raises(SearchUnavailable):
+        index.search(None, "tomatoes", 10)
+    index.add('b', "tomatoes", "")
+    index.remove('gone')
+    proceed.set()
+    assert index.wait(5)
+    hits, total = index.search(None, "tomatoes", 10)
+    assert sorted(id for id, _ in hits) == ['a', 'b']
+
+
+def test_fulltext_timeout():
+    """
+    Test that a MySQL search running out of time is unavailable, and that
+    a count running out of time gives a lower bound
+    """
+    timeout = OperationalError("SELECT", {}, Exception(3024, "timeout"))
+
+    class Session:
+        def __init__(self, fail):
+            self.fail = fail
+
+        def execute(self, statement):
+            if 'rows' in self.fail:
+                raise timeout
+            return SimpleNamespace(all=lambda: [('a', 2.0), ('b', 1.0)])
+
+        def scalar(self, statement):
+            raise timeout
+
+    index = FullTextIndex()
+    with pytest.raises(SearchUnavailable):
+        index.search(Session({'rows'}), "tomatoes", 2)
+    assert index.search(Session(set()), "tomatoes", 2, offset=4) == (
+        [('a', 2.0), ('b', 1.0)], 6)
+
+
+def test_highlight():
+    """
+    Test that matches are marked and the text is escaped
+    """
+    assert highlight("Fish & <b>Chips</b>", {"chips"}) == \
+        "Fish &amp; &lt;b&gt;<mark>Chips</mark>&lt;/b&gt;"
+    text = "x " * 200 + "needle" + " y" * 200
+    extract = highlight(text, {"needle"}, width=40)
+    assert extract.startswith("…") and extract.endswith("…")
+    assert "<mark>needle</mark>" in extract
+
+
+def test_search_endpoint(test_client, auth_headers):
+    """
+    Test that created, updated and deleted posts are found accordingly
+    """
+    word = "zq" + uuid4().hex[:8]
+    ids = []
+    for i in range(3):
+        response = test_client.post(
+            '/api/v1/posts', headers=auth_headers,
+            json={"title": f"post {i}", "content": f"about {word} " * (i + 1)})
+        ids.append(response.get_json()['id'])
+    for _ in range(100):
+        # The index is built in the background when the storage starts
+        response = test_client.get(f'/api/v1/posts/search?q={word}&limit=2',
+                                   headers=auth_headers)
+        if response.status_code != 503:
+            break
+        time.sleep(0.05)
+    assert response.status_code == 200
+    results = response.get_json()
+    assert [post['id'] for post in results] == [ids[2], ids[1]]
+    assert f"<mark>{word}</mark>" in results[0]['highlights']['content']
+    assert response.headers['X-Total-Count'] == '3'
+    response = test_client.get(
+        f"/api/v1/posts/search?q={word}&limit=2"
+        f"&after={response.headers['X-Next-Cursor']}", headers=auth_headers)
+    assert [post['id'] for post in response.get_json()] == [ids[0]]
+    assert 'X-Next-Cursor' not in response.headers
+    test_client.put(f'/api/v1/posts/{ids[0]}', headers=auth_headers,
+                    json={"content": "changed"})
+    test_client.delete(f'/api/v1/posts/{ids[1]}', headers=auth_headers)
+    response = test_client.get(f'/api/v1/posts/search?q={word}',
+                               headers=auth_headers)
+    assert [post['id'] for post in response.get_json()] == [ids[2]]
+    response = test_client.get('/api/v1/posts/search', headers=auth_headers)
+    assert response.status_code == 400
@@ -0,0 +1,189 @@
+import os
+import sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import json
+import pytest
+from uuid import uuid4
+from flask.json.provider import DefaultJSONProvider
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from models import storage
+from models.post import Post
+from models.engine.serializer import SCHEMA_CACHE_SIZE, cached_schema
+from models.engine.serializer import schema_for
+from api.v1.app import app
+from api.v1.database import in_memory
+from api.v1.encoding import FastJSONProvider
+
+
+@pytest.fixture(scope='module')
+def test_client():
+    flask_app = app
+    flask_app.config['TESTING'] = True
+    with flask_app.test_client() as testing_client:
+        yield testing_client
+
+
+@pytest.fixture(scope='module')
+def auth_headers(test_client):
+    """
+    Fixture that signs up a user and returns its authorization header.
+    """
+    suffix = uuid4().hex[:8]
+    credentials = {"email": f"ser_{suffix}@example.com", "password": "pwd"}
+    test_client.post('/api/v1/signup',
+                     json={**credentials, "username": f"ser_{suffix}"})
+    response = test_client.post('/api/v1/login', json=credentials)
+    token = response.get_json()['access_token']
+    return {"Authorization": f"Bearer {token}"}
+
+
+def test_schema_matches_columns(test_client, auth_headers):
+    """
+    Test that objects and rows serialize to the columns, with ISO
+    timestamps and the class marker, and that fields narrow the output
+    """
+    response = test_client.post('/api/v1/posts', headers=auth_headers,
+                                json={"title": "t", "content": "c"})
+    post = storage.get(Post, response.get_json()['id'])
+    schema = schema_for(Post)
+    data = post.to_dict()
+    assert set(data) == set(schema.fields) | {'__class__'}
+    assert data['__class__'] == 'Post'
+    assert data['created_at'] == post.created_at.isoformat()
+    assert schema.dump_row([getattr(post, key)
+                            for key in schema.fields]) == data
+    narrow = schema.only(['title', 'id'])
+    assert narrow.dump(post) == {'id': post.id, 'title': 't'}
+    assert narrow is schema_for(Post, ('title', 'id'))
+    with pytest.raises(ValueError):
+        schema.only(['password'])
+
+
+@pytest.mark.skipif(in_memory(app.config['SQLALCHEMY_DATABASE_URI']),
+                    reason="streams are refused on the in-memory database")
+def test_fields_parameter(test_client, auth_headers):
+    """
+    Test that `fields` selects the columns of pages, streams and single
+    posts, and that unknown fields are rejected
+    """
+    response = test_client.post('/api/v1/posts', headers=auth_headers,
+                                json={"title": "fields", "content": "c"})
+    post_id = response.get_json()['id']
+    response = test_client.get('/api/v1/posts?fields=id,title&limit=5',
+                               headers=auth_headers)
+    assert response.status_code == 200
+    assert all(set(post) == {'id', 'title'} for post in response.get_json())
+    response = test_client.get(f'/api/v1/posts/{post_id}?fields=title',
+                               headers=auth_headers)
+    assert response.get_json() == {'title': 'fields'}
+    full = test_client.get(f'/api/v1/posts/{post_id}', headers=auth_headers)
+    assert full.headers['ETag'] != response.headers['ETag']
+    response = test_client.get('/api/v1/posts?stream=ndjson&fields=id',
+                               headers=auth_headers)
+    lines = [json.loads(line) for line in response.data.splitlines()]
+    assert {'id': post_id} in lines
+    response = test_client.get('/api/v1/posts?stream=json&fields=*',
+                               headers=auth_headers)
+    posts = {post['id']: post for post in response.get_json()}
+    assert posts[post_id] == full.get_json()
+    response = test_client.get('/api/v1/posts?fields=id,nope',
+                               headers=auth_headers)
+    assert response.status_code == 400
+
+
+def test_schema_cache_bounded(test_client, auth_headers):
+    """
+    Test that equivalent field lists share one schema, that rejected names
+    never reach the cache, and that users never show their password hash
+    """
+    schema = schema_for(Post, ('title', 'id', 'title'))
+    assert sorted(schema.fields) == ['id', 'title']
+    assert schema is schema_for(Post, ['id', 'title'])
+    before = cached_schema.cache_info().currsize
+    for i in range(20):
+        response = test_client.get(f'/api/v1/posts?fields=id,nope{i}',
+                                   headers=auth_headers)
+        assert response.status_code == 400
+        response = test_client.get('/api/v1/posts?fields=' + ','.join(
+            ['title', 'id'] * (i + 1)), headers=auth_headers)
+        assert response.status_code == 200
+    assert cached_schema.cache_info().currsize <= before + 1
+    assert cached_schema.cache_info().maxsize == SCHEMA_CACHE_SIZE
+    response = test_client.get('/api/v1/users?fields=id,password_hash',
+                               headers=auth_headers)
+    assert response.status_code == 400
+    response = test_client.get('/api/v1/users', headers=auth_headers)
+    assert all('password_hash' not in user for user in response.get_json())
+
+
+def test_expanded_author_has_no_credentials(test_client, auth_headers):
+    """
+    Test that the users embedded by `expand` carry neither the password
+    hash nor the email
+    """
+    response = test_client.post('/api/v1/posts', headers=auth_headers,
+                                json={"title": "embed", "content": "c"})
+    post_id = response.get_json()['id']
+    response = test_client.get(f'/api/v1/posts/{post_id}?expand=author',
+                               headers=auth_headers)
+    author = response.get_json()['author']
+    response = test_client.get('/api/v1/posts?expand=author&limit=5',
+                               headers=auth_headers)
+    authors = [post['author'] for post in response.get_json()]
+    assert author['username'].startswith('ser_')
+    for data in [author] + authors:
+        assert 'password_hash' not in data and 'email' not in data
+
+
+def test_projection_reaches_sql(test_client, auth_headers):
+    """
+    Test that lists leave the post content out of the SELECT and of the
+    response unless it is asked for
+    """
+    test_client.post('/api/v1/posts', headers=auth_headers,
+                     json={"title": "projected", "content": "x" * 500})
+    previous = storage.use_cache(None)
+    statements = []
+
+    def record(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    event.listen(Engine, 'before_cursor_execute', record)
+    try:
+        summary = test_client.get('/api/v1/posts?limit=50',
+                                  headers=auth_headers)
+        selects = [statement for statement in statements
+                   if 'ORDER BY posts.created_at' in statement]
+        statements.clear()
+        narrow = test_client.get('/api/v1/posts?limit=50&fields=id,title',
+                                 headers=auth_headers)
+        narrow_selects = [statement for statement in statements
+                          if 'ORDER BY posts.created_at' in statement]
+        full = test_client.get('/api/v1/posts?limit=50&fields=*',
+                               headers=auth_headers)
+    finally:
+        event.remove(Engine, 'before_cursor_execute', record)
+        storage.use_cache(previous)
+    assert selects and 'posts.content' not in selects[0]
+    assert 'posts.published' in selects[0]
+    assert narrow_selects and all('posts.content' not in statement
+                                  and 'posts.published' not in statement
+                                  for statement in narrow_selects)
+    assert all('content' not in post for post in summary.get_json())
+    assert all(set(post) == {'id', 'title'} for post in narrow.get_json())
+    assert all('content' in post for post in full.get_json())
+    assert len(narrow.data) < len(summary.data) < len(full.data)
+
+
+def test_fast_provider_matches_standard():
+    """
+    Test that the orjson provider encodes documents like the standard one
+    """
+    pytest.importorskip('orjson')
+    data = [{'b': 1, 'a': 'é', 'c': None, 'd': [1.5, True]}, {}]
+    with app.app_context():
+        fast = FastJSONProvider(app)
+        std = DefaultJSONProvider(app)
+        assert json.loads(fast.dumps(data)) == json.loads(std.dumps(data))
+        assert fast.response(data).get_json() == data
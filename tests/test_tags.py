@@ -0,0 +1,246 @@
+import os
+import sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import pytest
+from uuid import uuid4
+from sqlalchemy import event, select, update
+from sqlalchemy.engine import Engine
+from models import storage
+from models.base_model import db
+from models.follow import Follow
+from models.post import post_tags
+from models.tag import Tag
+from models.user import User
+from models.engine.cache import LRUCache, ObjectCache
+from api.v1.app import app
+
+
+@pytest.fixture(scope='module')
+def test_client():
+    flask_app = app
+    flask_app.config['TESTING'] = True
+    with flask_app.test_client() as testing_client:
+        yield testing_client
+
+
+def sign_up(test_client):
+    """
+    Signs up a user and returns its id and authorization header.
+    """
+    suffix = uuid4().hex[:8]
+    credentials = {"email": f"tags_{suffix}@example.com", "password": "pwd"}
+    response = test_client.post('/api/v1/signup',
+                                json={**credentials,
+                                      "username": f"tags_{suffix}"})
+    user_id = response.get_json()['id']
+    response = test_client.post('/api/v1/login', json=credentials)
+    token = response.get_json()['access_token']
+    return user_id, {"Authorization": f"Bearer {token}"}
+
+
+@pytest.fixture(scope='module')
+def auth_headers(test_client):
+    """
+    Fixture that signs up a user and returns its authorization header.
+    """
+    return sign_up(test_client)[1]
+
+
+@pytest.fixture
+def tag(test_client, auth_headers):
+    """
+    Fixture that creates a tag through the API.
+    """
+    response = test_client.post('/api/v1/tags', headers=auth_headers,
+                                json={"name": f"tag-{uuid4().hex[:8]}"})
+    assert response.status_code == 201
+    return response.get_json()
+
+
+def test_tag_crud(test_client, auth_headers, tag):
+    """
+    Test that tags are created, read, renamed and deleted
+    """
+    response = test_client.post('/api/v1/tags', headers=auth_headers,
+                                json={"name": tag['name']})
+    assert response.status_code == 409
+    response = test_client.get(f"/api/v1/tags/{tag['name']}",
+                               headers=auth_headers)
+    assert response.get_json()['id'] == tag['id']
+    new_name = f"renamed-{uuid4().hex[:8]}"
+    response = test_client.put(f"/api/v1/tags/{tag['id']}",
+                               headers=auth_headers, json={"name": new_name})
+    assert response.status_code == 200
+    response = test_client.put(f"/api/v1/tags/{tag['id']}",
+                               headers=auth_headers, json={"name": new_name})
+    assert response.status_code == 200
+    assert test_client.get(f"/api/v1/tags/{tag['name']}",
+                           headers=auth_headers).status_code == 404
+    assert test_client.get(f"/api/v1/tags/{new_name}",
+                           headers=auth_headers).status_code == 200
+    response = test_client.delete(f"/api/v1/tags/{tag['id']}",
+                                  headers=auth_headers)
+    assert response.status_code == 200
+    assert test_client.get(f"/api/v1/tags/{tag['id']}",
+                           headers=auth_headers).status_code == 404
+
+
+def test_tag_posts(test_client, auth_headers, tag):
+    """
+    Test that tagged posts are listed page by page, by tag id and name
+    """
+    post_ids = []
+    for i in range(3):
+        response = test_client.post('/api/v1/posts', headers=auth_headers,
+                                    json={"title": f"t{i}", "content": "c"})
+        post_ids.append(response.get_json()['id'])
+    for post_id in post_ids:
+        response = test_client.post(f"/api/v1/posts/{post_id}/tags/{tag['id']}",
+                                    headers=auth_headers)
+        assert response.status_code == 201
+    response = test_client.post(f"/api/v1/posts/{post_ids[0]}/tags/{tag['id']}",
+                                headers=auth_headers)
+    assert response.status_code == 200
+    response = test_client.get(f"/api/v1/tags/{tag['id']}/posts?limit=2",
+                               headers=auth_headers)
+    seen = [post['id'] for post in response.get_json()]
+    response = test_client.get(
+        f"/api/v1/tags/{tag['id']}/posts?limit=2"
+        f"&after={response.headers['X-Next-Cursor']}", headers=auth_headers)
+    seen += [post['id'] for post in response.get_json()]
+    assert seen == post_ids
+    response = test_client.delete(
+        f"/api/v1/posts/{post_ids[1]}/tags/{tag['id']}", headers=auth_headers)
+    assert response.status_code == 200
+    response = test_client.get(f"/api/v1/posts?tag={tag['name']}",
+                               headers=auth_headers)
+    assert [post['id'] for post in response.get_json()] == [
+        post_ids[0], post_ids[2]]
+    response = test_client.get(f"/api/v1/posts?tag=no-such-{uuid4().hex}",
+                               headers=auth_headers)
+    assert response.status_code == 404
+    test_client.delete(f"/api/v1/tags/{tag['id']}", headers=auth_headers)
+    assert storage.count_by('Post', 'tags', [tag['id']]) == {tag['id']: 0}
+
+
+def test_tag_posts_keyset_on_links(test_client, auth_headers, tag):
+    """
+    Test that the posts of a tag are paged on the association table, which
+    keeps the creation time of the posts, whatever way the link was added
+    """
+    post_ids = []
+    for i in range(3):
+        response = test_client.post('/api/v1/posts', headers=auth_headers,
+                                    json={"title": f"k{i}", "content": "c"})
+        post_ids.append(response.get_json()['id'])
+    test_client.post(f"/api/v1/posts/{post_ids[0]}/tags/{tag['id']}",
+                     headers=auth_headers)
+    storage.bulk_insert('post_tags', [{'post_id': post_ids[1],
+                                       'tag_id': tag['id']}])
+    post = storage.get('Post', post_ids[2])
+    post.tags.append(storage.get(Tag, tag['id']))
+    storage.save()
+    rows = db.session.execute(
+        select(post_tags.c.post_id, post_tags.c.created_at).where(
+            post_tags.c.tag_id == tag['id'])).all()
+    posts = {id: storage.get('Post', id).created_at for id in post_ids}
+    assert {id: created_at for id, created_at in rows} == posts
+    statements = []
+
+    def record(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    event.listen(Engine, 'before_cursor_execute', record)
+    try:
+        response = test_client.get(f"/api/v1/tags/{tag['id']}/posts?limit=2",
+                                   headers=auth_headers)
+    finally:
+        event.remove(Engine, 'before_cursor_execute', record)
+    assert [statement for statement in statements
+            if 'ORDER BY post_tags.created_at, post_tags.post_id' in statement]
+    seen = [post['id'] for post in response.get_json()]
+    response = test_client.get(
+        f"/api/v1/tags/{tag['id']}/posts?limit=2"
+        f"&after={response.headers['X-Next-Cursor']}", headers=auth_headers)
+    seen += [post['id'] for post in response.get_json()]
+    assert seen == post_ids
+
+
+def test_name_lookup_cached(tag):
+    """
+    Test that with the object cache on, repeated name lookups do not
+    query the tags table
+    """
+    storage.close()
+    previous = storage.use_cache(ObjectCache(LRUCache()))
+    statements = []
+
+    def record(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    try:
+        assert storage.get_by_name(Tag, tag['name']).id == tag['id']
+        storage.close()
+        event.listen(Engine, 'before_cursor_execute', record)
+        try:
+            assert storage.get_by_name(Tag, tag['name']).id == tag['id']
+        finally:
+            event.remove(Engine, 'before_cursor_execute', record)
+    finally:
+        storage.close()
+        storage.use_cache(previous)
+    assert statements == []
+    assert storage.get_by_name(Tag, f"missing-{uuid4().hex}") is None
+
+
+def test_tag_managers(test_client, tag):
+    """
+    Test that only the creator of a tag and the admins rename or delete it
+    """
+    user_id, headers = sign_up(test_client)
+    url = f"/api/v1/tags/{tag['id']}"
+    assert test_client.put(url, headers=headers, json={
+        "name": f"taken-{uuid4().hex[:8]}"}).status_code == 403
+    assert test_client.delete(url, headers=headers).status_code == 403
+    response = test_client.put(f"/api/v1/users/{user_id}", headers=headers,
+                               json={"is_admin": True})
+    assert response.status_code == 200
+    assert test_client.delete(url, headers=headers).status_code == 403
+    db.session.execute(update(User).where(User.id == user_id).values(
+        is_admin=True))
+    storage.save()
+    new_name = f"admin-{uuid4().hex[:8]}"
+    response = test_client.put(url, headers=headers, json={"name": new_name})
+    assert response.status_code == 200
+    assert response.get_json()['name'] == new_name
+    assert test_client.delete(url, headers=headers).status_code == 200
+
+
+def test_delete_tag_leaves_no_follows(test_client, auth_headers, tag):
+    """
+    Test that deleting a tag drops its follows, and the posts that only
+    it brought to the feeds
+    """
+    author_id, author = sign_up(test_client)
+    _, reader = sign_up(test_client)
+    posts = []
+    for headers in (auth_headers, author):
+        response = test_client.post('/api/v1/posts', headers=headers, json={
+            "title": "t", "content": "c", "published": True})
+        posts.append(response.get_json()['id'])
+        test_client.post(f"/api/v1/posts/{posts[-1]}/tags/{tag['id']}",
+                         headers=headers)
+    for target in ({"type": "tag", "id": tag['id']},
+                   {"type": "user", "id": author_id}):
+        response = test_client.post('/api/v1/follows', headers=reader,
+                                    json=target)
+        assert response.status_code == 201
+    response = test_client.get('/api/v1/feed', headers=reader)
+    assert {post['id'] for post in response.get_json()} == set(posts)
+    response = test_client.delete(f"/api/v1/tags/{tag['id']}",
+                                  headers=auth_headers)
+    assert response.status_code == 200
+    response = test_client.get('/api/v1/feed', headers=reader)
+    assert [post['id'] for post in response.get_json()] == [posts[1]]
+    assert db.session.scalars(select(Follow.id).where(
+        Follow.target_id == tag['id'])).all() == []
@@ -0,0 +1,43 @@
+#!/usr/bin/python3
+"""
+Trims the feeds to their newest WordFlow_FEED_MAX_ITEMS entries.
+
+Feeds grow with every post fanned out to them, and only the feeds refilled
+by a follow are trimmed on the spot; this job trims the others. Run it
+periodically, e.g. from cron or with --interval.
+
+Usage:
+    python3 trim_feeds.py --interval 600 --batch-size 1000
+"""
+import argparse
+import time
+from models import storage  # type: ignore
+
+
+def parse_args():
+    """Reads the command line options."""
+    parser = argparse.ArgumentParser(
+        description="Trim the WordFlow feeds to their cap.")
+    parser.add_argument('--batch-size', type=int, default=1000,
+                        help="feeds trimmed per commit (default 1000)")
+    parser.add_argument('--interval', type=int, default=0,
+                        help="seconds between runs, 0 runs once (default)")
+    return parser.parse_args()
+
+
+def main():
+    """Trims the feeds, once or every --interval seconds."""
+    args = parse_args()
+    while True:
+        start = time.monotonic()
+        removed = storage.trim_feeds(args.batch_size)
+        storage.close()
+        print("removed {} feed entries in {:.1f}s".format(
+            removed, time.monotonic() - start))
+        if not args.interval:
+            break
+        time.sleep(args.interval)
+
+
+if __name__ == "__main__":
+    main()